@@ -0,0 +1 @@
+"""Benchmarks of the configuration rendered by the installwizard"""
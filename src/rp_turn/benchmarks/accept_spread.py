@@ -0,0 +1,305 @@
+"""
+Measures how a surge of new connections is accepted by the nginx workers,
+with and without a listening socket per worker (reuseport), against a local
+nginx sized as the installwizard would size it. Reports the latency from
+connecting to the first byte of the response, and the share of connections
+and CPU time each worker took. The clients run on the same machine, so
+compare the two with each other rather than with production.
+
+    python -m rp_turn.benchmarks.accept_spread [--workers 8] [--duration 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+from rp_turn.benchmarks.tls_handshake import NGINX_PATH, BenchmarkError, local_nginx
+from rp_turn.platform import capacity
+
+# Answers every request on a new connection, saying which worker accepted it
+NGINX_CONF = """\
+daemon off;
+worker_processes {workers};
+worker_cpu_affinity auto;
+pid {prefix}/nginx.pid;
+error_log {prefix}/error.log;
+
+events {{
+    worker_connections {connections};
+}}
+
+http {{
+    access_log off;
+    keepalive_timeout 0;
+    server {{
+        listen 127.0.0.1:{port}{listen_options};
+        location / {{
+            add_header X-Worker $pid;
+            return 204;
+        }}
+    }}
+}}
+"""
+REQUEST = b"GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n"
+
+
+class AcceptResult:  # pylint: disable=too-few-public-methods
+    """Connections accepted by the workers during the surge"""
+
+    def __init__(
+        self,
+        latencies: list[float],
+        duration: float,
+        connections: Counter,
+        cpu_seconds: dict[int, float],
+    ) -> None:
+        self.connections = len(latencies)
+        self.per_second = self.connections / duration if duration else 0.0
+        ordered = sorted(latencies)
+        self.median_ms = statistics.median(ordered) * 1000 if ordered else 0.0
+        self.p99_ms = ordered[int(len(ordered) * 0.99)] * 1000 if ordered else 0.0
+        workers = set(connections) | set(cpu_seconds)
+        # Share of the connections and CPU time of each worker, busiest first,
+        # counting the workers which accepted none
+        self.connection_shares = _shares({pid: connections[pid] for pid in workers})
+        self.cpu_shares = _shares(cpu_seconds)
+
+    @property
+    def imbalance(self) -> float:
+        """Connections of the busiest worker over the average, 1.0 when even"""
+        if not self.connection_shares:
+            return 0.0
+        return self.connection_shares[0] * len(self.connection_shares)
+
+
+def _shares(values: dict[int, float]) -> list[float]:
+    """Returns each value's share of the total, largest first"""
+    total = sum(values.values())
+    if not total:
+        return []
+    return sorted((value / total for value in values.values()), reverse=True)
+
+
+def measure_accepts(
+    host: str,
+    port: int,
+    duration: float,
+    concurrency: int,
+    cpu_seconds: Callable[[], dict[int, float]] | None = None,
+) -> AcceptResult:
+    """
+    Opens a new connection for every request, from concurrent clients for
+    duration seconds, counting which worker (X-Worker) answered each.
+    cpu_seconds, if given, is sampled before and after to work out the CPU
+    time of each worker.
+    """
+    latencies: list[float] = []
+    connections: Counter = Counter()
+    errors: list[Exception] = []
+    lock = threading.Lock()
+
+    def client() -> None:
+        """Connects until the deadline"""
+        try:
+            while time.monotonic() < deadline:
+                # Timed from connect(), so the wait in the listen queue counts
+                start = time.monotonic()
+                with socket.create_connection((host, port), timeout=5) as sock:
+                    sock.sendall(REQUEST)
+                    response = sock.recv(4096)
+                    latency = time.monotonic() - start
+                    while sock.recv(4096):
+                        pass
+                worker = _worker(response)
+                with lock:
+                    latencies.append(latency)
+                    connections[worker] += 1
+        except OSError as error:
+            errors.append(error)
+
+    before = cpu_seconds() if cpu_seconds else {}
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise BenchmarkError(f"Connection failed: {errors[0]}")
+    return AcceptResult(
+        latencies,
+        time.monotonic() - started,
+        connections,
+        _cpu_used(before, cpu_seconds()) if cpu_seconds else {},
+    )
+
+
+def _cpu_used(before: dict[int, float], after: dict[int, float]) -> dict[int, float]:
+    """Returns the CPU seconds each worker used between two samples"""
+    return {pid: seconds - before.get(pid, 0.0) for pid, seconds in after.items()}
+
+
+def _worker(response: bytes) -> int:
+    """Returns the pid in the X-Worker header of a response, or 0"""
+    for line in response.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"x-worker" and value.strip().isdigit():
+            return int(value)
+    return 0
+
+
+def parse_stat(stat: str) -> tuple[int, float]:
+    """
+    Returns the parent pid and the CPU seconds (user and system) of a
+    process from its /proc/<pid>/stat
+    """
+    # The command may contain spaces and brackets, but is followed by the last )
+    fields = stat[stat.rindex(")") + 2 :].split()
+    ticks = int(fields[11]) + int(fields[12])
+    return int(fields[1]), ticks / os.sysconf("SC_CLK_TCK")
+
+
+def worker_cpu_seconds(master_pid: int, proc: str = "/proc") -> dict[int, float]:
+    """Returns the CPU seconds of each child (worker) of the nginx master"""
+    seconds = {}
+    for name in os.listdir(proc):
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, name, "stat"), encoding="utf-8") as file_obj:
+                parent, cpu = parse_stat(file_obj.read())
+        except (OSError, ValueError, IndexError):
+            continue
+        if parent == master_pid:
+            seconds[int(name)] = cpu
+    return seconds
+
+
+def _master_pid(prefix: str) -> int:
+    """Returns the pid of the nginx master, once it has written it"""
+    deadline = time.monotonic() + 5
+    while True:
+        with contextlib.suppress(OSError, ValueError):
+            with open(os.path.join(prefix, "nginx.pid"), encoding="ascii") as file_obj:
+                return int(file_obj.read())
+        if time.monotonic() > deadline:
+            raise BenchmarkError("nginx did not write its pid")
+        time.sleep(0.05)
+
+
+def benchmark(
+    workers: int,
+    reuseport: bool,
+    duration: float,
+    concurrency: int,
+    *,
+    participants: int = 10000,
+    nginx: str = NGINX_PATH,
+) -> AcceptResult:
+    """
+    Measures a surge against nginx sized as the installwizard would size it
+    for the participants, with or without reuseport
+    """
+    sizing = capacity.nginx_sizing(workers, None, participants, reuseport=reuseport)
+    listen_options = f" reuseport backlog={sizing['backlog']}" if reuseport else ""
+    with tempfile.TemporaryDirectory() as prefix:
+        with local_nginx(
+            nginx,
+            prefix,
+            NGINX_CONF,
+            workers=workers,
+            connections=sizing["connections"],
+            listen_options=listen_options,
+        ) as port:
+            master_pid = _master_pid(prefix)
+            return measure_accepts(
+                "127.0.0.1",
+                port,
+                duration,
+                concurrency,
+                cpu_seconds=lambda: worker_cpu_seconds(master_pid),
+            )
+
+
+def _spread(shares: list[float]) -> str:
+    """Formats the busiest and idlest worker's share"""
+    if not shares:
+        return "-"
+    return f"{shares[0]:.0%}/{shares[-1]:.0%}"
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the accept spread benchmark."""
+    parser = argparse.ArgumentParser(
+        prog="python -m rp_turn.benchmarks.accept_spread",
+        description="Measures how new connections are spread over the nginx "
+        + "workers, with and without reuseport",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=capacity.detect_cpus(),
+        help="nginx worker processes (default: %(default)s, one per CPU)",
+    )
+    parser.add_argument(
+        "--participants",
+        type=int,
+        default=10000,
+        help="participants to size the backlog for (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="seconds to measure each listener for (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4 * (os.cpu_count() or 1),
+        help="concurrent clients (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--nginx", default=NGINX_PATH, help="nginx binary (default: %(default)s)"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        print(
+            f"{'listener':<10}{'connections/s':>15}{'median ms':>11}{'p99 ms':>9}"
+            f"{'imbalance':>11}{'connections':>13}{'cpu':>9}"
+        )
+        for reuseport in (False, True):
+            result = benchmark(
+                args.workers,
+                reuseport,
+                args.duration,
+                args.concurrency,
+                participants=args.participants,
+                nginx=args.nginx,
+            )
+            print(
+                f"{'reuseport' if reuseport else 'shared':<10}"
+                f"{result.per_second:>15.1f}{result.median_ms:>11.2f}"
+                f"{result.p99_ms:>9.2f}{result.imbalance:>11.2f}"
+                f"{_spread(result.connection_shares):>13}"
+                f"{_spread(result.cpu_shares):>9}"
+            )
+    except BenchmarkError as error:
+        print(str(error))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Compares the cost of filtering sensitive parameters out of logged requests
+with the generated single map against the chained maps it replaced, one per
+parameter. nginx evaluates the maps with PCRE, which is emulated here with
+Python's re on a synthetic corpus of request lines, so compare the two with
+each other rather than with nginx itself.
+
+    python -m rp_turn.benchmarks.log_filter [--lines 20000] [--param NAME]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Pattern
+
+from rp_turn import utils
+from rp_turn.config_applicator import ConfigApplicator
+from rp_turn.platform import logfilter
+
+SOURCE = "$request"
+PATHS = (
+    "/api/client/v2/conferences/{alias}/request_token",
+    "/api/client/v2/conferences/{alias}/participants/{uuid}/calls",
+    "/api/client/v2/conferences/{alias}/events",
+    "/api/client/v2/registrations/{alias}/events",
+    "/webapp/conference/{alias}",
+    "/static/js/main.{uuid}.js",
+)
+# Non-sensitive parameters mixed in with the sensitive ones
+OTHER_PARAMS = ("display_name", "locale", "callback", "v", "role")
+# Share of the lines with sensitive parameters, as on a busy proxy most
+# requests are for static assets and events
+SENSITIVE_SHARE = 0.3
+
+_GROUP_RE = re.compile(r"\$(\d)")
+_VARIABLE_RE = re.compile(r"^\$[A-Za-z_]\w*$")
+# PCRE anchors a regex starting with .* itself, where re would retry it from
+# every position of the line
+_LEADING_ANY_RE = re.compile(r"^\(?\.\*")
+
+
+def legacy_maps(params: list[str] | tuple[str, ...]) -> list[list[tuple[str, str]]]:
+    """
+    The chained maps previously shipped in pexlog-filtered, each filtering the
+    last value of one parameter
+    """
+    return [
+        [(f"~(.*){name}=[^&\\ \\t\\n]*(.*)", f"$1{name}={logfilter.FILTERED}$2")]
+        for name in params
+    ]
+
+
+def single_map(params: list[str] | tuple[str, ...]) -> list[list[tuple[str, str]]]:
+    """The map generated for pexlog-filtered"""
+    return [logfilter.filter_map(params, SOURCE)]
+
+
+def compile_maps(
+    maps: list[list[tuple[str, str]]]
+) -> list[list[tuple[Pattern[str], str | None]]]:
+    """
+    Compiles the regex of each map entry. A value of None stands for the
+    unfiltered variable.
+    """
+    compiled = []
+    for entries in maps:
+        compiled_entries: list[tuple[Pattern[str], str | None]] = []
+        for regex, value in entries:
+            regex = regex[1:]
+            if _LEADING_ANY_RE.match(regex):
+                regex = "^" + regex
+            # $1 to $9 become the \g<1> to \g<9> of Match.expand
+            template = _GROUP_RE.sub(r"\\g<\1>", value)
+            compiled_entries.append(
+                (re.compile(regex), None if _VARIABLE_RE.match(value) else template)
+            )
+        compiled.append(compiled_entries)
+    return compiled
+
+
+def apply_maps(compiled: list[list[tuple[Pattern[str], str | None]]], line: str) -> str:
+    """Evaluates the maps in turn as nginx would: the first matching entry wins"""
+    for entries in compiled:
+        for pattern, value in entries:
+            match = pattern.search(line)
+            if match:
+                if value is not None:
+                    line = match.expand(value)
+                break
+    return line
+
+
+def request_lines(
+    count: int, params: list[str] | tuple[str, ...], seed: int = 0
+) -> list[str]:
+    """
+    Returns a reproducible corpus of request lines. Each sensitive parameter
+    is in a line at most once, as the chained maps only filter its last value.
+    """
+    generator = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        path = generator.choice(PATHS).format(
+            alias=f"meet.{generator.randrange(1000)}",
+            uuid=f"{generator.getrandbits(64):016x}",
+        )
+        query = [
+            f"{name}={generator.getrandbits(32):08x}"
+            for name in generator.sample(OTHER_PARAMS, generator.randrange(3))
+        ]
+        if params and generator.random() < SENSITIVE_SHARE:
+            query.extend(
+                f"{name}={generator.getrandbits(128):032x}"
+                for name in generator.sample(
+                    list(params), generator.randrange(1, len(params) + 1)
+                )
+            )
+        generator.shuffle(query)
+        target = path + (f"?{'&'.join(query)}" if query else "")
+        lines.append(f"{generator.choice(('GET', 'POST'))} {target} HTTP/1.1")
+    return lines
+
+
+class FilterResult:  # pylint: disable=too-few-public-methods
+    """The cost of filtering the corpus with both sets of maps"""
+
+    def __init__(
+        self,
+        legacy_seconds: float,
+        single_seconds: float,
+        lines: int,
+        differ: int,
+        leaked: int,
+    ) -> None:
+        self.legacy_us = legacy_seconds / lines * 1e6 if lines else 0.0
+        self.single_us = single_seconds / lines * 1e6 if lines else 0.0
+        self.speedup = self.legacy_us / self.single_us if self.single_us else 0.0
+        # Lines with several parameters, only filtered in place by the chained maps
+        self.differ = differ
+        # Lines the single map left a value in, which must be none
+        self.leaked = leaked
+
+
+def _time(
+    compiled: list[list[tuple[Pattern[str], str | None]]],
+    lines: list[str],
+    rounds: int,
+) -> tuple[float, list[str]]:
+    """Returns the fastest time to filter the lines, and the filtered lines"""
+    best = float("inf")
+    filtered: list[str] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        filtered = [apply_maps(compiled, line) for line in lines]
+        best = min(best, time.perf_counter() - start)
+    return best, filtered
+
+
+def count_leaked(params: list[str] | tuple[str, ...], lines: list[str]) -> int:
+    """Counts the filtered lines still holding a value of any of the parameters"""
+    value_re = re.compile(f"((?:{'|'.join(params)})=)[^&\\s]*")
+    return sum(
+        1
+        for line in lines
+        if value_re.sub(lambda match: match.group(1) + logfilter.FILTERED, line) != line
+    )
+
+
+def benchmark(
+    params: list[str] | tuple[str, ...], lines: list[str], rounds: int = 3
+) -> FilterResult:
+    """Filters the lines with the chained maps and with the single map"""
+    legacy_seconds, legacy = _time(compile_maps(legacy_maps(params)), lines, rounds)
+    single_seconds, single = _time(compile_maps(single_map(params)), lines, rounds)
+    differ = sum(1 for old, new in zip(legacy, single) if old != new)
+    return FilterResult(
+        legacy_seconds, single_seconds, len(lines), differ, count_leaked(params, single)
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the log filter benchmark."""
+    parser = argparse.ArgumentParser(
+        prog="python -m rp_turn.benchmarks.log_filter",
+        description="Compares the cost of the chained and single log filter maps",
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        type=logfilter.validate_param,
+        help="sensitive parameter, may be repeated "
+        + f"(default: {', '.join(logfilter.DEFAULT_SENSITIVE_PARAMS)})",
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=20000,
+        help="request lines in the corpus (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=3,
+        help="times to filter the corpus, keeping the fastest (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="corpus seed (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--show",
+        action="store_true",
+        help="prints the rendered pexlog-filtered and exits",
+    )
+    args = parser.parse_args(argv)
+
+    params = args.param or list(logfilter.DEFAULT_SENSITIVE_PARAMS)
+    if args.show:
+        print(ConfigApplicator(utils.nested_dict()).render_log_filter(params))
+        return
+    result = benchmark(
+        params, request_lines(args.lines, params, args.seed), args.rounds
+    )
+    print(f"{'maps':<10}{'us/line':>10}")
+    print(f"{'chained':<10}{result.legacy_us:>10.2f}")
+    print(f"{'single':<10}{result.single_us:>10.2f}")
+    print(
+        f"speedup {result.speedup:.2f}x, {result.differ} lines filtered differently, "
+        + f"{result.leaked} left with a value"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Measures the TLS handshakes per second of the rendered nginx TLS settings,
+for each TLS profile, against a local nginx. The client runs on the same
+machine, so compare the profiles with each other rather than with production.
+
+    python -m rp_turn.benchmarks.tls_handshake [--config PATH] [--duration 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Iterator
+
+from rp_turn import steps, utils
+from rp_turn.config_applicator import DHPARAM_PATH, ConfigApplicator
+from rp_turn.platform import certificate, ticketkeys
+from rp_turn.steps.tls import TLS_PROFILES
+
+NGINX_PATH = "/usr/sbin/nginx"
+
+# Serves nothing but TLS handshakes, with the rendered TLS settings
+NGINX_CONF = """\
+daemon off;
+worker_processes {workers};
+pid {prefix}/nginx.pid;
+error_log {prefix}/error.log;
+
+events {{
+    worker_connections 4096;
+}}
+
+http {{
+    access_log off;
+    server {{
+        listen 127.0.0.1:{port} ssl;
+{tls}
+        location / {{
+            return 204;
+        }}
+    }}
+}}
+"""
+
+
+class BenchmarkError(Exception):
+    """The benchmark could not be run"""
+
+
+class HandshakeResult:  # pylint: disable=too-few-public-methods
+    """Full TLS handshakes completed by the benchmark clients"""
+
+    def __init__(self, latencies: list[float], duration: float, cipher: str) -> None:
+        self.handshakes = len(latencies)
+        self.per_second = self.handshakes / duration if duration else 0.0
+        ordered = sorted(latencies)
+        self.median_ms = statistics.median(ordered) * 1000 if ordered else 0.0
+        self.p99_ms = ordered[int(len(ordered) * 0.99)] * 1000 if ordered else 0.0
+        self.cipher = cipher
+
+
+def measure_handshakes(
+    host: str,
+    port: int,
+    duration: float,
+    concurrency: int,
+    tls_version: ssl.TLSVersion = ssl.TLSVersion.TLSv1_3,
+) -> HandshakeResult:
+    """
+    Opens new TLS connections (never resuming a session) from concurrent
+    clients for duration seconds.
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.maximum_version = tls_version
+    latencies: list[float] = []
+    ciphers: list[str] = []
+    errors: list[Exception] = []
+    deadline = time.monotonic() + duration
+
+    def client() -> None:
+        """Handshakes until the deadline"""
+        try:
+            while time.monotonic() < deadline:
+                start = time.monotonic()
+                with socket.create_connection((host, port), timeout=5) as sock:
+                    with context.wrap_socket(sock) as tls_sock:
+                        cipher = tls_sock.cipher()
+                latencies.append(time.monotonic() - start)
+                if cipher and not ciphers:
+                    ciphers.append(f"{cipher[1]} {cipher[0]}")
+        except (OSError, ssl.SSLError) as error:
+            errors.append(error)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise BenchmarkError(f"Handshake failed: {errors[0]}")
+    return HandshakeResult(
+        latencies, time.monotonic() - started, ciphers[0] if ciphers else ""
+    )
+
+
+def _free_port() -> int:
+    """Returns a local port which is not in use"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+@contextlib.contextmanager
+def local_nginx(
+    nginx: str, prefix: str, conf_template: str, **fields: Any
+) -> Iterator[int]:
+    """
+    Runs nginx below prefix, yielding its port. conf_template is formatted
+    with prefix, port and fields.
+    """
+    port = _free_port()
+    conf_path = os.path.join(prefix, "nginx.conf")
+    with open(conf_path, "w", encoding="utf-8") as file_obj:
+        file_obj.write(conf_template.format(prefix=prefix, port=port, **fields))
+    try:
+        process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [nginx, "-p", prefix + "/", "-c", conf_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as error:
+        raise BenchmarkError(f"Unable to run {nginx}: {error}") from error
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            if process.poll() is not None:
+                stderr = process.stderr.read().decode() if process.stderr else ""
+                raise BenchmarkError(f"nginx exited: {stderr.strip()}")
+            with contextlib.suppress(OSError):
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            if time.monotonic() > deadline:
+                raise BenchmarkError("nginx did not start listening")
+            time.sleep(0.05)
+        yield port
+    finally:
+        process.terminate()
+        process.wait()
+        if process.stderr:
+            process.stderr.close()
+
+
+def load_config(path: str | None) -> defaultdict:
+    """
+    Loads the TLS settings from a saved config, or uses the defaults.
+    """
+    saved_config = utils.nested_dict()
+    if path is not None:
+        try:
+            with open(path, encoding="utf-8") as file_obj:
+                saved_config = utils.make_nested_dict(json.load(file_obj))
+        except (OSError, ValueError) as error:
+            raise BenchmarkError(f"Unable to read {path}: {error}") from error
+    config = utils.nested_dict()
+    steps.WebLoadBalanceStep().default_config(saved_config, config)
+    steps.CertificatesStep().default_config(saved_config, config)
+    return config
+
+
+def _write_keys(prefix: str, key_algorithm: str) -> tuple[str, list[str]]:
+    """
+    Writes a self-signed certificate and session ticket keys below prefix,
+    returning their paths
+    """
+    certificate_path = os.path.join(prefix, "pexip.pem")
+    with open(certificate_path, "w", encoding="ascii") as file_obj:
+        file_obj.write(certificate.generate_self_signed_pem(key_algorithm))
+    ticket_key_paths = []
+    for index in range(len(ticketkeys.TICKET_KEY_PATHS)):
+        ticket_key_paths.append(os.path.join(prefix, f"ticket.key.{index}"))
+        with open(ticket_key_paths[-1], "wb") as file_obj:
+            file_obj.write(ticketkeys.generate_ticket_key())
+    return certificate_path, ticket_key_paths
+
+
+def benchmark(
+    config: defaultdict,
+    profile: str,
+    duration: float,
+    concurrency: int,
+    *,
+    tls_version: ssl.TLSVersion = ssl.TLSVersion.TLSv1_3,
+    nginx: str = NGINX_PATH,
+    dhparam: str = DHPARAM_PATH,
+    workers: int = 1,
+) -> HandshakeResult:
+    """Measures handshakes with the config's TLS settings under a TLS profile"""
+    config["tlsprofile"] = profile
+    with tempfile.TemporaryDirectory() as prefix:
+        certificate_path, ticket_key_paths = _write_keys(
+            prefix, config["generate-certs"]["keyalgorithm"]
+        )
+        tls_config = ConfigApplicator(config).render_nginx_tls(
+            certificate_path=certificate_path,
+            dhparam_path=dhparam,
+            ticket_key_paths=ticket_key_paths,
+        )
+        with local_nginx(
+            nginx, prefix, NGINX_CONF, tls=tls_config, workers=workers
+        ) as port:
+            return measure_handshakes(
+                "127.0.0.1", port, duration, concurrency, tls_version=tls_version
+            )
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the TLS handshake benchmark."""
+    parser = argparse.ArgumentParser(
+        prog="python -m rp_turn.benchmarks.tls_handshake",
+        description="Measures TLS handshakes per second of each TLS profile",
+    )
+    parser.add_argument(
+        "--config",
+        default=None,
+        help="saved installwizard config to take the TLS settings from "
+        + "(default: the installwizard defaults)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=list(TLS_PROFILES),
+        help="TLS profile to measure, may be repeated (default: all of them)",
+    )
+    parser.add_argument(
+        "--key-algorithm",
+        choices=certificate.KEY_ALGORITHMS,
+        help="certificate key algorithm (default: from the config)",
+    )
+    parser.add_argument(
+        "--tls-version",
+        choices=["1.2", "1.3"],
+        default="1.3",
+        help="highest TLS version the clients offer (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="seconds to measure each profile for (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="concurrent clients (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="nginx worker processes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--nginx", default=NGINX_PATH, help="nginx binary (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--dhparam",
+        default=DHPARAM_PATH,
+        help="DH parameters of the compatibility profile (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    tls_version = {"1.2": ssl.TLSVersion.TLSv1_2, "1.3": ssl.TLSVersion.TLSv1_3}[
+        args.tls_version
+    ]
+    try:
+        config = load_config(args.config)
+        if args.key_algorithm:
+            config["generate-certs"]["keyalgorithm"] = args.key_algorithm
+        print(
+            f"{'profile':<15}{'key':<12}{'handshakes/s':>14}"
+            f"{'median ms':>11}{'p99 ms':>9}  cipher"
+        )
+        for profile in args.profile or list(TLS_PROFILES):
+            result = benchmark(
+                config,
+                profile,
+                args.duration,
+                args.concurrency,
+                tls_version=tls_version,
+                nginx=args.nginx,
+                dhparam=args.dhparam,
+                workers=args.workers,
+            )
+            print(
+                f"{profile:<15}{config['generate-certs']['keyalgorithm']:<12}"
+                f"{result.per_second:>14.1f}{result.median_ms:>11.2f}"
+                f"{result.p99_ms:>9.2f}  {result.cipher}"
+            )
+    except BenchmarkError as error:
+        print(str(error))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
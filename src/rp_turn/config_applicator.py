@@ -2,31 +2,138 @@
 Pexip Configuration Applicator
 """
 
-from __future__ import print_function
+from __future__ import annotations, print_function
 
+import difflib
+import json
 import logging
+import math
 import os
-import subprocess
+import time
 from collections import defaultdict
+from concurrent import futures
 from ipaddress import IPv4Interface
 from typing import Any
 
 import jinja2
 import yaml
 
-from rp_turn import utils
-from rp_turn.platform import filewriter
+from rp_turn import keygen, trace, utils
+from rp_turn.platform import (
+    capacity,
+    certificate,
+    filewriter,
+    hostkeys,
+    logfilter,
+    nodehealth,
+    ticketkeys,
+    turnuserdb,
+)
 
 DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
 
+TURNUSERDB_PATH = "/etc/turnuserdb.conf"
+IPTABLES_RULES_PATH = "/home/pexip/iptables.rules"
+# Sized from the VM and the expected participants, see rp_turn.platform.capacity
+NGINX_CONF_PATH = "/etc/nginx/nginx.conf"
+LIMITS_PATH = "/etc/security/limits.d/pexiplimits.conf"
+SYSCTL_LIMITS_PATH = "/etc/sysctl.d/20-pexip-limits.conf"
+NGINX_UPSTREAM_PATH = "/etc/nginx/includes/pexip-upstream.conf"
+# Clients banned by fail2ban (pexip-nginx-deny action) behind load balancers,
+# where iptables only sees the load balancers
+BANNED_CLIENTS_PATH = "/etc/nginx/includes/pexip-banned.conf"
+FAIL2BAN_JAIL_PATH = "/etc/fail2ban/jail.d/pexiprp.local"
+# Variables of the pexapplog log format with sensitive parameters filtered out
+NGINX_LOG_FILTER_PATH = "/etc/nginx/sites-available/pexlog-filtered"
+# Conference nodes probed by the health check service, see rp_turn.healthcheck
+HEALTHCHECK_CONFIG_PATH = "/etc/rp-turn/healthcheck.json"
+HEALTHCHECK_UNIT = "rp-turn-healthcheck.service"
+TICKET_KEYS_TIMER = "rp-turn-ticket-keys.timer"
+# Static assets cached by nginx, optionally on a tmpfs mounted by STATIC_CACHE_MOUNT
+# (shipped by the installwizard role, sized by a drop-in)
+STATIC_CACHE_PATH = "/var/cache/nginx/static"
+STATIC_CACHE_MOUNT = "var-cache-nginx-static.mount"
+STATIC_CACHE_MOUNT_DROPIN = (
+    "/etc/systemd/system/var-cache-nginx-static.mount.d/size.conf"
+)
+# Where the cache warm-up fetches the static assets from, see rp_turn.warm_static_cache
+STATIC_CACHE_WARMUP_CONFIG_PATH = "/etc/rp-turn/static-cache.json"
+STATIC_CACHE_WARMUP_UNIT = "rp-turn-static-cache-warmup.service"
+# Diffie-Hellman parameters of the compatibility TLS profile (shipped by the security role)
+DHPARAM_PATH = "/etc/ssl/certs/dhparam.pem"
+# A megabyte of nginx's shared TLS session cache holds about 4000 sessions.
+# Allow for each client reconnecting (e.g. a page reload) within the session timeout.
+SSL_SESSIONS_PER_MB = 4000
+SSL_SESSIONS_PER_CLIENT = 2
+
+# Apply phases (ConfigApplicator._apply_<phase>) and the phases that must have
+# finished before each one starts. Phases without a path between them may run
+# at the same time, so must not touch the same files or services.
+PHASE_DEPENDENCIES: dict[str, tuple[str, ...]] = {
+    "base_network_config": (),
+    "ntp_server_config": (),
+    "certificate_config": (),
+    "nginx_server_config": (),
+    "iptables_config": (),
+    "turn_config": (),
+    "fail2ban": (),
+    "snmp": (),
+    "system_limits": (),
+    # Phases only request unit states, which are then set with one batched call.
+    # This also keeps nginx disabled until its certificate exists.
+    "systemd_units": (
+        "certificate_config",
+        "nginx_server_config",
+        "iptables_config",
+        "turn_config",
+        "fail2ban",
+        "snmp",
+    ),
+}
+
 
 class ConfigApplicator:
     """
     Configuration applicator.
     """
 
-    def __init__(self, config: defaultdict) -> None:
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        config: defaultdict,
+        incremental: bool = False,
+        staging: str | None = None,
+        root: str = "/",
+        keys: keygen.KeyGenerator | None = None,
+    ) -> None:
+        """
+        staging: When set, only plan the apply: files are written below this
+                 directory and commands are recorded instead of run
+        root: Directory holding the current system files (only when planning)
+        keys: Source of new keys, e.g. generated in the background while the
+              wizard was waiting for input
+        """
+        if staging is None and root != "/":
+            raise ValueError("root can only be changed when planning")
         self._config = config
+        # Only rewrite files (and re-run dependent actions) whose content changed
+        self._incremental = incremental
+        self._staging = staging
+        self._root = root
+        self._keys = keygen.KeyGenerator() if keys is None else keys
+        self.changed: list[str] = []
+        # When planning: unified diff of each written file, and the commands
+        # (and other changes outside the staging tree) which would be run
+        self.diffs: dict[str, str] = {}
+        self.actions: list[str] = []
+        # Units the last apply changed the state of: enabled (True) or disabled (False)
+        self.units: dict[str, bool] = {}
+        # Unit states requested by the phases, set by the systemd_units phase
+        self._requested_units: dict[str, bool] = {}
+        # Wall-time of each phase and the chain of phases which bounded the last apply
+        self.phase_durations: dict[str, float] = {}
+        self.critical_path: list[str] = []
         # Setup jinja to load templates
         template_loader = jinja2.FileSystemLoader(
             searchpath=os.path.dirname(os.path.abspath(__file__)) + "/templates/"
@@ -39,19 +146,251 @@ class ConfigApplicator:
         """
         return f"{self._config['hostname']}.{self._config['domain']}"
 
-    def apply(self) -> None:
+    def real_ip(self) -> dict[str, Any]:
+        """
+        Returns where the address of a client comes from: the realip settings,
+        with the source reset to "none" if no load balancers are trusted
+        """
+        realip = dict(self._config["realip"])
+        if realip["source"] != "none" and not realip["trusted"]:
+            DEV_LOGGER.warning(
+                "No trusted load balancers, ignoring client addresses from %s",
+                realip["source"],
+            )
+            realip["source"] = "none"
+        return realip
+
+    def healthz(self) -> dict[str, Any]:
+        """
+        Returns the /healthz settings, with upstream reset to False unless the
+        health check service keeps track of the conference nodes
+        """
+        healthz = dict(self._config["healthz"])
+        if healthz["upstream"] and not self._config["healthcheck"]["enabled"]:
+            DEV_LOGGER.warning(
+                "Health checks are disabled, /healthz cannot reflect the nodes"
+            )
+            healthz["upstream"] = False
+        return healthz
+
+    def apply(self) -> list[str]:
         """
         Apply collected configuration to system.
+        Returns the paths of the artifacts whose contents changed.
+        """
+        if self._staging is None:
+            print("Applying configuration...")
+        else:
+            print(f"Planning configuration in {self._staging}...")
+        self.changed = []
+        self.units = {}
+        self._requested_units = {}
+        self.diffs = {}
+        self.actions = []
+        # Written files are flushed together and only replaced once every
+        # phase has succeeded
+        with trace.span("apply", incremental=self._incremental):
+            with filewriter.FileWriter.batch():
+                self._run_phases()
+        self.changed.sort()
+        DEV_LOGGER.info("Changed artifacts: %s", self.changed)
+        if self._incremental:
+            if self.changed:
+                print("Changed:")
+                for path in self.changed:
+                    print("  - " + path)
+            else:
+                print("No configuration changes")
+        return self.changed
+
+    @property
+    def requested_units(self) -> dict[str, bool]:
+        """
+        State of every unit the last apply manages, whether or not it changed:
+        enabled (True) or disabled (False)
+        """
+        return dict(self._requested_units)
+
+    def restore(self) -> list[str]:
+        """
+        Puts back what the last apply changed, after it failed to take effect:
+        the artifacts from the backups kept when they were written (reloading
+        the iptables rules), and the state of the units it enabled/disabled.
+        Artifacts without a backup (secrets, and those written for the first
+        time) are left as they are.
+        Afterwards changed, units and requested_units describe the restore, so
+        PostApply can put it into effect.
+        Returns the paths of the restored artifacts.
+        """
+        restored = [
+            path
+            for path in self.changed
+            if filewriter.restore_backup(path, root=self._root)
+        ]
+        if IPTABLES_RULES_PATH in restored:
+            with open(self._path(IPTABLES_RULES_PATH), encoding="utf-8") as file_obj:
+                self._load_iptables(file_obj.read())
+        reverted = {unit: not enabled for unit, enabled in self.units.items()}
+        self._set_units(reverted)
+        self._requested_units.update(reverted)
+        self.changed = restored
+        self.units = reverted
+        return restored
+
+    def _run_phases(self) -> None:
+        """
+        Runs each phase as soon as the phases it depends on have finished.
+        Waits for running phases and re-raises the first error if any phase fails.
+        """
+        self.phase_durations = {}
+        pending = dict(PHASE_DEPENDENCIES)
+        running: dict[futures.Future, str] = {}
+        error: BaseException | None = None
+        with futures.ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            while pending or running:
+                if error is None:
+                    for phase, dependencies in list(pending.items()):
+                        if all(dep in self.phase_durations for dep in dependencies):
+                            del pending[phase]
+                            running[executor.submit(self._run_phase, phase)] = phase
+                if not running:
+                    break
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    phase = running.pop(future)
+                    if future.exception() is not None:
+                        DEV_LOGGER.error("Phase %s failed", phase)
+                        error = error or future.exception()
+                    else:
+                        self.phase_durations[phase] = future.result()
+        if error is not None:
+            raise error
+        self.critical_path = critical_path(self.phase_durations, PHASE_DEPENDENCIES)
+        DEV_LOGGER.info(
+            "Critical path: %s (%.3fs)",
+            " -> ".join(self.critical_path),
+            sum(self.phase_durations[phase] for phase in self.critical_path),
+        )
+
+    def _run_phase(self, phase: str) -> float:
+        """Runs a single phase, returning its wall-time"""
+        start = time.monotonic()
+        with trace.span("phase", phase=phase):
+            getattr(self, "_apply_" + phase)()
+        duration = time.monotonic() - start
+        DEV_LOGGER.info("Phase %s took %.3fs", phase, duration)
+        return duration
+
+    def _render(self, template_name: str, **context: Any) -> str:
+        """Renders a template"""
+        with trace.span("render", template=template_name):
+            return self._template_env.get_template(template_name).render(**context)
+
+    def _write_file(
+        self,
+        writer_class: type[filewriter.FileWriter],
+        path: str,
+        contents: str | bytes,
+        mode: int = 0o644,
+        secret: bool = False,
+    ) -> bool:
+        """
+        Writes contents to path, unless applying incrementally and it is unchanged.
+        Only paths whose contents changed are added to self.changed, so a full
+        apply puts into effect (or reboots for) just what it actually changed.
+        Secret contents are never logged, diffed or backed up.
+        Returns whether the file was written.
+        """
+        current = writer_class(path, root=self._root)
+        with trace.span("write", path=path) as span:
+            unchanged = current.unchanged(contents)
+            if self._incremental and unchanged:
+                DEV_LOGGER.info("Skipping unchanged %s", path)
+                span["skipped"] = True
+                return False
+            if self._staging is None:
+                current.write(contents, mode=mode, backup=not secret)
+            else:
+                if not secret and isinstance(contents, str):
+                    self.diffs[path] = unified_diff(path, current.read(), contents)
+                writer = writer_class(path, root=self._staging)
+                os.makedirs(os.path.dirname(writer.file_path), exist_ok=True)
+                writer.write(contents, mode=mode, backup=not secret, sync=False)
+        DEV_LOGGER.info("Writing to %s: %s", path, "<secret>" if secret else contents)
+        if not unchanged:
+            self.changed.append(path)
+        return True
+
+    def _path(self, path: str) -> str:
+        """Maps an absolute path onto the directory holding the system files"""
+        return filewriter.rooted(path, self._root)
+
+    def _run(self, *argv: str, stdin: str | None = None, log_args: bool = True) -> None:
+        """Runs a command, or records it when planning"""
+        if self._staging is None:
+            utils.run_command(*argv, stdin=stdin, log_args=log_args)
+        else:
+            self.actions.append(" ".join(argv) if log_args else argv[0] + " ...")
+
+    def _chown(self, path: str, user: str, group: str) -> None:
+        """Changes the owner and group of a file, or records it when planning"""
+        if self._staging is None:
+            utils.chown(path, user, group)
+        else:
+            self.actions.append(f"chown {user}:{group} {path}")
+
+    def _chmod(self, path: str, mode: int) -> None:
+        """Changes the mode bits of a file, or records it when planning"""
+        if self._staging is None:
+            utils.chmod(path, mode)
+        else:
+            self.actions.append(f"chmod {mode:o} {path}")
+
+    def _remove(self, path: str) -> None:
+        """Removes files matching path, or records it when planning"""
+        if self._staging is None:
+            utils.remove_glob(path)
+        else:
+            self.actions.append(f"rm -f {path}")
+
+    def _set_unit_enabled(self, unit: str, enabled: bool) -> None:
+        """
+        Requests a systemd unit be enabled/disabled by the systemd_units phase.
+        """
+        self._requested_units[unit] = enabled
+
+    def _apply_systemd_units(self) -> None:
+        """
+        Enables/disables the requested systemd units, skipping those already in
+        the requested state when applying incrementally. Only units whose state
+        changed are added to self.units.
         """
-        print("Applying configuration...")
-        self._apply_base_network_config()
-        self._apply_ntp_server_config()
-        self._apply_nginx_server_config()
-        self._apply_iptables_config()
-        self._apply_certificate_config()
-        self._apply_turn_config()
-        self._apply_fail2ban()
-        self._apply_snmp()
+        unchanged = {
+            unit
+            for unit, enabled in self._requested_units.items()
+            if utils.systemd_unit_enabled(unit, root=self._root) == enabled
+        }
+        units = {
+            unit: enabled
+            for unit, enabled in sorted(self._requested_units.items())
+            if not (self._incremental and unit in unchanged)
+        }
+        for unit in self._requested_units.keys() - units.keys():
+            DEV_LOGGER.info("Skipping %s, already in the requested state", unit)
+        self._set_units(units)
+        self.units.update(
+            {unit: enabled for unit, enabled in units.items() if unit not in unchanged}
+        )
+
+    def _set_units(self, units: dict[str, bool]) -> None:
+        """Enables (True) or disables (False) systemd units"""
+        # systemd has no single operation that both enables and disables units
+        enable = sorted(unit for unit, enabled in units.items() if enabled)
+        disable = sorted(unit for unit, enabled in units.items() if not enabled)
+        if enable:
+            self._run("/bin/systemctl", "enable", *enable)
+        if disable:
+            self._run("/bin/systemctl", "disable", *disable)
 
     def _apply_base_network_config(self) -> None:
         """
@@ -101,28 +440,28 @@ class ConfigApplicator:
 
         netcfg_yaml = yaml.dump(netplan, default_flow_style=False, Dumper=NoAliasDumper)
         netplan_filepath = "/etc/netplan/01-netcfg.yaml"
-        filewriter.HeadedFileWriter(netplan_filepath).write(netcfg_yaml)
-        DEV_LOGGER.info("Writing to %s: %s", netplan_filepath, netcfg_yaml)
+        self._write_file(filewriter.HeadedFileWriter, netplan_filepath, netcfg_yaml)
         # If a fallback cloud-init network config exists, delete it
-        if os.path.exists("/etc/netplan/50-cloud-init.yaml"):
+        cloud_init_filepath = "/etc/netplan/50-cloud-init.yaml"
+        if os.path.exists(self._path(cloud_init_filepath)):
             DEV_LOGGER.info(
                 "cloud-init default config exists, removing so our new config takes it's place"
             )
-            os.remove("/etc/netplan/50-cloud-init.yaml")
+            if self._staging is None:
+                os.remove(cloud_init_filepath)
+            else:
+                self.actions.append(f"rm -f {cloud_init_filepath}")
 
         # Write hostname file
         hostname = self._config["hostname"]
         domain = self._config["domain"]
         hostname_filepath = "/etc/hostname"
-        filewriter.FileWriter(hostname_filepath).write(hostname)
-        DEV_LOGGER.info("Writing to %s: %s", hostname_filepath, hostname)
+        self._write_file(filewriter.FileWriter, hostname_filepath, hostname)
 
         # Write hosts file
-        hosts_template = self._template_env.get_template("hosts")
-        hosts = hosts_template.render(hostname=hostname, domain=domain)
+        hosts = self._render("hosts", hostname=hostname, domain=domain)
         hosts_filepath = "/etc/hosts"
-        filewriter.HeadedFileWriter(hosts_filepath).write(hosts)
-        DEV_LOGGER.info("Writing to %s: %s", hosts_filepath, hosts)
+        self._write_file(filewriter.HeadedFileWriter, hosts_filepath, hosts)
 
     def _apply_ntp_server_config(self) -> None:
         """
@@ -130,15 +469,13 @@ class ConfigApplicator:
         """
         DEV_LOGGER.info("Applying ntp")
         servers = self._config["ntp"]
-        ntp_template = self._template_env.get_template("ntp.conf")
-        ntp_config = ntp_template.render(servers=servers)
+        ntp_config = self._render("ntp.conf", servers=servers)
         ntp_filepath = "/etc/ntp.conf"
-        filewriter.HeadedFileWriter(ntp_filepath).write(ntp_config)
-        DEV_LOGGER.info("Writing to %s: %s", ntp_filepath, ntp_config)
+        self._write_file(filewriter.HeadedFileWriter, ntp_filepath, ntp_config)
 
     def _apply_nginx_server_config(self) -> None:
         """
-        Write /etc/nginx/sites-available/pexapp
+        Write /etc/nginx/sites-available/pexapp and the pexip upstream it includes
         """
         DEV_LOGGER.info("Applying nginx")
         if self._config["enablewebloadbalance"]:
@@ -150,23 +487,205 @@ class ConfigApplicator:
             enablecsp = self._config["enablecsp"]
             mgmtnets = self._config["managementnetworks"]
 
-            template = self._template_env.get_template("nginx")
-            nginx_config = template.render(
+            tlsperformance = self._config["tlsperformance"]
+            staticcache = self._config["staticcache"]
+
+            self._write_nginx_upstream()
+            if tlsperformance["enabled"] and not ticketkeys.ticket_keys_exist(
+                self._root
+            ):
+                # From then on only rp-turn-ticket-keys.timer replaces the keys,
+                # so tickets stay valid across applies
+                for path in ticketkeys.TICKET_KEY_PATHS:
+                    self._write_file(
+                        filewriter.FileWriter,
+                        path,
+                        ticketkeys.generate_ticket_key(),
+                        mode=0o600,
+                        secret=True,
+                    )
+            realip = self.real_ip()
+            if realip["source"] != "none" and not os.path.exists(
+                filewriter.rooted(BANNED_CLIENTS_PATH, self._root)
+            ):
+                # From then on only fail2ban changes the banned clients
+                self._write_file(filewriter.FileWriter, BANNED_CLIENTS_PATH, "")
+            sizing = self.nginx_sizing()
+            nginx_config = self._render(
+                "nginx",
                 confnodes=confnodes,
                 addresses=addresses,
                 mgmtnets=mgmtnets,
                 fqdn=fqdn,
                 enablecsp=enablecsp,
+                staticcache=staticcache,
+                accesslog=self._config["accesslog"],
+                ratelimit=self._config["ratelimit"],
+                realip=realip,
+                healthz=self.healthz(),
+                banned_clients_path=BANNED_CLIENTS_PATH,
+                static_cache_path=STATIC_CACHE_PATH,
+                reuseport=self._config["capacity"]["reuseport"],
+                sizing=sizing,
+                **self._nginx_tls_context(),
             )
             nginx_filepath = "/etc/nginx/sites-available/pexapp"
-            filewriter.FileWriter("/etc/nginx/sites-available/pexapp").write(
-                nginx_config
+            self._write_file(filewriter.FileWriter, nginx_filepath, nginx_config)
+            self._write_file(
+                filewriter.FileWriter,
+                NGINX_CONF_PATH,
+                self._render("nginx.conf", sizing=sizing),
+            )
+            self._write_file(
+                filewriter.FileWriter,
+                NGINX_LOG_FILTER_PATH,
+                self.render_log_filter(self._config["accesslog"]["sensitiveparams"]),
+            )
+            if staticcache["enabled"]:
+                # The listeners on the addresses expect the PROXY protocol
+                self._write_static_cache_config(
+                    (
+                        "127.0.0.1"
+                        if realip["source"] == "proxy_protocol"
+                        else addresses[0]
+                    ),
+                    fqdn,
+                )
+
+            self._set_unit_enabled("nginx", True)
+            self._set_unit_enabled(
+                HEALTHCHECK_UNIT, bool(self._config["healthcheck"]["enabled"])
+            )
+            self._set_unit_enabled(TICKET_KEYS_TIMER, bool(tlsperformance["enabled"]))
+            self._set_unit_enabled(
+                STATIC_CACHE_MOUNT,
+                bool(staticcache["enabled"] and staticcache["tmpfs"]),
+            )
+            self._set_unit_enabled(
+                STATIC_CACHE_WARMUP_UNIT, bool(staticcache["enabled"])
             )
-            DEV_LOGGER.info("Writing to %s: %s", nginx_filepath, nginx_config)
+        else:
+            self._set_unit_enabled("nginx", False)
+            self._set_unit_enabled(HEALTHCHECK_UNIT, False)
+            self._set_unit_enabled(TICKET_KEYS_TIMER, False)
+            self._set_unit_enabled(STATIC_CACHE_MOUNT, False)
+            self._set_unit_enabled(STATIC_CACHE_WARMUP_UNIT, False)
 
-            utils.run_shell("/bin/systemctl enable nginx")
+    def _write_static_cache_config(self, address: str, fqdn: str) -> None:
+        """
+        Writes the size of the static asset cache's tmpfs, and where the cache
+        warm-up fetches the assets from
+        """
+        staticcache = self._config["staticcache"]
+        if staticcache["tmpfs"]:
+            # nginx only trims the cache to max_size every so often
+            tmpfs_size = staticcache["size"] + staticcache["size"] // 4
+            self._write_file(
+                filewriter.FileWriter,
+                STATIC_CACHE_MOUNT_DROPIN,
+                f"[Mount]\nOptions=mode=0700,nodev,nosuid,noexec,size={tmpfs_size}m\n",
+            )
+        self._write_file(
+            filewriter.FileWriter,
+            STATIC_CACHE_WARMUP_CONFIG_PATH,
+            json.dumps({"address": address, "fqdn": fqdn}, indent=4, sort_keys=True),
+        )
+
+    def _nginx_tls_context(self) -> dict[str, Any]:
+        """Context of the nginx-tls template: the TLS settings of the pexapp server"""
+        tlsprofile = self._config["tlsprofile"]
+        tlsperformance = self._config["tlsperformance"]
+        if tlsprofile == "performance":
+            ecdh_curve = certificate.PERFORMANCE_ECDH_CURVE
         else:
-            utils.run_shell("/bin/systemctl disable nginx")
+            ecdh_curve = certificate.ECDH_CURVES[self._key_algorithm()]
+        return {
+            "tlsprofile": tlsprofile,
+            "ecdh_curve": ecdh_curve,
+            "tlsperformance": tlsperformance["enabled"],
+            "session_cache_size": ssl_session_cache_size(tlsperformance["clients"]),
+            "certificate_path": "ssl/pexip.pem",
+            "dhparam_path": DHPARAM_PATH,
+            "ticket_key_paths": ticketkeys.TICKET_KEY_PATHS,
+        }
+
+    def render_nginx_tls(self, **paths: Any) -> str:
+        """
+        Renders the TLS settings of the pexapp server on their own, e.g. for
+        rp_turn.benchmarks.tls_handshake. paths overrides certificate_path,
+        dhparam_path and ticket_key_paths.
+        """
+        return self._render("nginx-tls", **{**self._nginx_tls_context(), **paths})
+
+    def render_log_filter(self, params: list[str]) -> str:
+        """
+        Renders the maps filtering sensitive parameters out of the logged
+        request and referer, e.g. for rp_turn.benchmarks.log_filter
+        """
+        maps = [
+            (source, target, logfilter.filter_map(params, source))
+            for source, target in logfilter.FILTERED_VARIABLES.items()
+        ]
+        return self._render("pexlog-filtered", params=params, maps=maps)
+
+    def apply_nginx_upstream(self) -> list[str]:
+        """
+        Rewrites only the pexip upstream, e.g. after a conference node was drained.
+        Returns the paths of the artifacts whose contents changed.
+        """
+        self.changed = []
+        with trace.span("apply_nginx_upstream", incremental=self._incremental):
+            with filewriter.FileWriter.batch():
+                self._write_nginx_upstream()
+        return self.changed
+
+    def _write_nginx_upstream(self) -> None:
+        """
+        Writes the pexip upstream of the conference nodes, and the nodes the
+        health check service probes
+        """
+        upstream_config = self._render(
+            "nginx-upstream",
+            confnodes=self._config["conferencenodes"],
+            confnodeoptions=self._config["conferencenodeoptions"],
+            downnodes=self._down_nodes(),
+            loadbalancemethod=self._config["loadbalancemethod"],
+        )
+        self._write_file(filewriter.FileWriter, NGINX_UPSTREAM_PATH, upstream_config)
+        healthcheck_config = {
+            key: self._config[key]
+            for key in (
+                "conferencenodes",
+                "conferencenodeoptions",
+                "loadbalancemethod",
+                "healthcheck",
+            )
+        }
+        self._write_file(
+            filewriter.FileWriter,
+            HEALTHCHECK_CONFIG_PATH,
+            json.dumps(healthcheck_config, indent=4, sort_keys=True),
+        )
+
+    def _down_nodes(self) -> set[str]:
+        """
+        Conference nodes marked down in the upstream: drained nodes, and nodes
+        failing their health checks unless no other node would be left
+        """
+        nodes = self._config["conferencenodes"]
+        options = self._config["conferencenodeoptions"]
+        drained = {node for node in nodes if options[node]["down"]}
+        if not self._config["healthcheck"]["enabled"]:
+            return drained
+        status = nodehealth.read_status(self._path(nodehealth.HEALTH_STATUS_PATH))
+        unhealthy = nodehealth.unhealthy_nodes(status) & set(nodes)
+        if not set(nodes) - drained - unhealthy:
+            # Better to keep trying unhealthy nodes than to have none at all
+            DEV_LOGGER.info("Every conference node is unhealthy, keeping them all")
+            return drained
+        if unhealthy:
+            DEV_LOGGER.info("Unhealthy conference nodes: %s", sorted(unhealthy))
+        return drained | unhealthy
 
     def _apply_iptables_config(self) -> None:
         """
@@ -181,8 +700,8 @@ class ConfigApplicator:
         medianodes = self._config["medianodes"] or []
 
         # Save rules into a temporary file
-        template = self._template_env.get_template("iptables.rules")
-        iptables_config = template.render(
+        iptables_config = self._render(
+            "iptables.rules",
             management_networks=management_networks,
             internal_ip=self._config["networks"][internal_interface]["ipaddress"],
             external_ip=self._config["networks"][external_interface]["ipaddress"],
@@ -194,25 +713,24 @@ class ConfigApplicator:
             medianodes=medianodes,
             conferencenodes=conferencenodes,
             allnodes=set(conferencenodes + medianodes),
+            realip=self.real_ip(),
         )
-        iptables_filepath = "/home/pexip/iptables.rules"
         # iptables-restore crashes without this newline
-        filewriter.FileWriter(iptables_filepath).write(iptables_config + "\n")
-        DEV_LOGGER.info("Writing to %s: %s", iptables_filepath, iptables_config)
-
+        iptables_config += "\n"
+        if self._write_file(
+            filewriter.FileWriter, IPTABLES_RULES_PATH, iptables_config
+        ):
+            self._load_iptables(iptables_config)
+
+        # Enable SSH only if there are management networks to reach it from
+        self._set_unit_enabled("ssh.service", bool(management_networks))
+
+    def _load_iptables(self, rules: str) -> None:
+        """Loads iptables rules and makes them persistent"""
+        # iptables-restore replaces (flushes) the tables it is given
+        self._run("/sbin/iptables-restore", stdin=rules)
         # Make rules persistent
-        utils.run_shell(
-            "/sbin/iptables -F",
-            "/sbin/iptables-restore < /home/pexip/iptables.rules",
-            "/usr/sbin/netfilter-persistent save",
-        )
-
-        if management_networks:
-            # Enable SSH
-            utils.run_shell("/bin/systemctl enable ssh.service")
-        else:
-            # Disable SSH
-            utils.run_shell("/bin/systemctl disable ssh.service")
+        self._run("/usr/sbin/netfilter-persistent", "save")
 
     def _apply_certificate_config(self) -> None:
         """
@@ -221,28 +739,46 @@ class ConfigApplicator:
         """
         DEV_LOGGER.info("Applying generating certificates")
         if utils.config_get(self._config["generate-certs"]["ssl"]):
-            utils.run_shell(
-                (
-                    "/usr/bin/openssl req -x509 -newkey rsa:2048 -keyout "
-                    "/etc/nginx/ssl/pexip.pem -out /etc/nginx/ssl/pexip.pem "
-                    "-days 1095 -nodes -config /etc/ssl/pexip.cnf"
-                ),
-                "/bin/chown root:root /etc/nginx/ssl/pexip.pem",
-                "/bin/chmod 400 /etc/nginx/ssl",
-                "/bin/chmod 400 /etc/nginx/ssl/pexip.pem",
+            key_algorithm = self._key_algorithm()
+            with trace.span("keygen", algorithm=key_algorithm):
+                key = self._keys.tls_key(key_algorithm)
+            self._write_file(
+                filewriter.FileWriter,
+                "/etc/nginx/ssl/pexip.pem",
+                certificate.self_signed_pem(key),
+                mode=0o400,
+                secret=True,
             )
+            self._chmod("/etc/nginx/ssl", 0o400)
         else:
             DEV_LOGGER.info("Skipped generating SSL")
 
-        # Also create new SSH keys on initial setup
+        # Also create new SSH host keys on initial setup
         if utils.config_get(self._config["generate-certs"]["ssh"]):
-            utils.run_shell(
-                "/bin/rm -f /etc/ssh/ssh_host*",
-                "/usr/sbin/dpkg-reconfigure openssh-server",
-            )
+            with trace.span("keygen", algorithm="ssh"):
+                keys = self._keys.host_keys()
+            # Types of host key which are no longer generated
+            self._remove("/etc/ssh/ssh_host_dsa_key*")
+            files = hostkeys.host_key_files(keys, f"root@{self._config['hostname']}")
+            for name, contents in files.items():
+                private = not name.endswith(".pub")
+                self._write_file(
+                    filewriter.FileWriter,
+                    "/etc/ssh/" + name,
+                    contents,
+                    mode=0o600 if private else 0o644,
+                    secret=private,
+                )
         else:
             DEV_LOGGER.info("Skipped generating SSH")
 
+    def _key_algorithm(self) -> str:
+        """Key algorithm of the nginx TLS certificate"""
+        return (
+            utils.config_get(self._config["generate-certs"]["keyalgorithm"])
+            or certificate.DEFAULT_KEY_ALGORITHM
+        )
+
     def _apply_turn_config(self) -> None:
         """
         Write turnserver config files.
@@ -260,8 +796,8 @@ class ConfigApplicator:
             medianodes = self._config["medianodes"]
             client_turn = turnserver["clientturn"]
 
-            template = self._template_env.get_template("turnserver.conf")
-            turn_conf = template.render(
+            turn_conf = self._render(
+                "turnserver.conf",
                 listening_ip=listening_ip,
                 relay_ip=relay_ip,
                 domain=realm,
@@ -269,87 +805,107 @@ class ConfigApplicator:
                 medianodes=medianodes,
                 client_turn=client_turn,
             )
-            filewriter.HeadedFileWriter("/etc/turnserver.conf").write(turn_conf)
+            self._write_file(
+                filewriter.HeadedFileWriter, "/etc/turnserver.conf", turn_conf
+            )
 
-            filewriter.HeadedFileWriter("/etc/default/coturn").write(
-                "TURNSERVER_ENABLED=1"
+            self._write_file(
+                filewriter.HeadedFileWriter,
+                "/etc/default/coturn",
+                "TURNSERVER_ENABLED=1",
             )
             DEV_LOGGER.info("Enabled turnserver")
 
-            # Ensure turnuserdb.conf is deleted to remove previous turn users
-            try:
-                os.remove("/etc/turnuserdb.conf")
-                DEV_LOGGER.info("Removed previous turnuserdb")
-            except FileNotFoundError:
-                pass
-
-            run_turnuserdb_chmod = False
+            users = {}
             if all(k in turnserver for k in ("username", "password")) and all(
                 turnserver[k] for k in ("username", "password")
             ):
-                turnuser = turnserver["username"]
-                turnpassword = turnserver["password"]
-                with open(os.devnull, "wb") as fnull:
-                    subprocess.check_call(
-                        [
-                            "/usr/bin/turnadmin",
-                            "-k",
-                            "-a",
-                            "-b",
-                            "/etc/turnuserdb.conf",
-                            "-u",
-                            turnuser,
-                            "-r",
-                            realm,
-                            "-p",
-                            turnpassword,
-                        ],
-                        stdout=fnull,
-                        stderr=fnull,
-                    )
-                DEV_LOGGER.info("Run turnadmin add-user shell command")
-                run_turnuserdb_chmod = True
+                users[turnserver["username"]] = turnserver["password"]
+            secrets = []
             if (
                 client_turn
                 and "sharedsecret" in turnserver
                 and turnserver["sharedsecret"] is not None
             ):
-                shared_secret = turnserver["sharedsecret"]
-                with open(os.devnull, "wb") as fnull:
-                    subprocess.check_call(
-                        [
-                            "/usr/bin/turnadmin",
-                            "-b",
-                            "/etc/turnuserdb.conf",
-                            "-r",
-                            realm,
-                            "-s",
-                            shared_secret,
-                        ],
-                        stdout=fnull,
-                        stderr=fnull,
-                    )
-                DEV_LOGGER.info("Run turnadmin shared-secret shell command")
-                run_turnuserdb_chmod = True
-            if run_turnuserdb_chmod:
-                utils.run_shell("/usr/bin/chown root:turnserver /etc/turnuserdb.conf")
-                utils.run_shell("/usr/bin/chmod 640 /etc/turnuserdb.conf")
-            utils.run_shell("/bin/systemctl enable coturn")
+                secrets.append(turnserver["sharedsecret"])
+            self._write_turnuserdb(realm, users, secrets)
+            self._set_unit_enabled("coturn", True)
         else:
-            filewriter.HeadedFileWriter("/etc/default/coturn").write(
-                "TURNSERVER_ENABLED=0"
+            self._write_file(
+                filewriter.HeadedFileWriter,
+                "/etc/default/coturn",
+                "TURNSERVER_ENABLED=0",
             )
-            utils.run_shell("/bin/systemctl disable coturn")
+            self._set_unit_enabled("coturn", False)
             DEV_LOGGER.info("Disabled turnserver")
 
+    def _write_turnuserdb(
+        self, realm: str, users: dict[str, str], secrets: list[str]
+    ) -> None:
+        """
+        Replace the turnserver users and shared secrets.
+        """
+        database = turnuserdb.TurnUserDB(self._path(TURNUSERDB_PATH))
+        unchanged = database.unchanged(realm, users, secrets)
+        if self._incremental and unchanged:
+            DEV_LOGGER.info("Skipping unchanged %s", TURNUSERDB_PATH)
+            return
+        if not unchanged:
+            self.changed.append(TURNUSERDB_PATH)
+        with trace.span("write", path=TURNUSERDB_PATH, users=len(users)):
+            if self._staging is None:
+                database.write(realm, users, secrets, group="turnserver")
+                return
+            self.diffs[TURNUSERDB_PATH] = unified_diff(
+                TURNUSERDB_PATH,
+                database.describe_existing(),
+                turnuserdb.describe(realm, users, secrets),
+            )
+            staged_path = filewriter.rooted(TURNUSERDB_PATH, self._staging)
+            os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+            turnuserdb.TurnUserDB(staged_path).write(realm, users, secrets)
+            self.actions.append(f"chown root:turnserver {TURNUSERDB_PATH}")
+
     def _apply_fail2ban(self) -> None:
         """
-        Enables/disables fail2ban
+        Enables/disables fail2ban, banning in nginx behind load balancers
         """
         if self._config["enablefail2ban"]:
-            utils.run_shell("/bin/systemctl enable fail2ban.service")
-        else:
-            utils.run_shell("/bin/systemctl disable fail2ban.service")
+            self._write_file(
+                filewriter.FileWriter,
+                FAIL2BAN_JAIL_PATH,
+                self._render("pexiprp.local", realip=self.real_ip()),
+            )
+        self._set_unit_enabled("fail2ban.service", bool(self._config["enablefail2ban"]))
+
+    def _apply_system_limits(self) -> None:
+        """
+        Write the file descriptor limits (limits.d and sysctl) covering nginx
+        """
+        DEV_LOGGER.info("Applying system limits")
+        sizing = self.nginx_sizing()
+        self._write_file(
+            filewriter.FileWriter,
+            LIMITS_PATH,
+            self._render("pexiplimits.conf", sizing=sizing),
+        )
+        self._write_file(
+            filewriter.FileWriter,
+            SYSCTL_LIMITS_PATH,
+            self._render("20-pexip-limits.conf", sizing=sizing),
+        )
+
+    def nginx_sizing(self) -> dict[str, int]:
+        """
+        Sizes the nginx workers and file descriptor limits for this VM and the
+        expected participants, see rp_turn.platform.capacity.nginx_sizing
+        """
+        return capacity.nginx_sizing(
+            capacity.detect_cpus(),
+            capacity.detect_memory_mb(),
+            self._config["capacity"]["participants"],
+            reuseport=self._config["capacity"]["reuseport"],
+        )
 
     def _apply_snmp(self) -> None:
         """
@@ -367,8 +923,8 @@ class ConfigApplicator:
             snmp_name = self._config["snmp"]["name"]
             snmp_description = self._config["snmp"]["description"]
 
-            template = self._template_env.get_template("snmpd.conf")
-            snmp_conf = template.render(
+            snmp_conf = self._render(
+                "snmpd.conf",
                 internal_address=internal_address,
                 snmp_community=snmp_community,
                 snmp_location=snmp_location,
@@ -376,8 +932,55 @@ class ConfigApplicator:
                 snmp_name=snmp_name,
                 snmp_description=snmp_description,
             )
-            filewriter.HeadedFileWriter("/etc/snmp/snmpd.conf").write(snmp_conf)
-            utils.run_shell("/bin/systemctl enable snmpd.service")
+            self._write_file(
+                filewriter.HeadedFileWriter, "/etc/snmp/snmpd.conf", snmp_conf
+            )
+            self._set_unit_enabled("snmpd.service", True)
         else:
-            utils.run_shell("/bin/systemctl disable snmpd.service")
+            self._set_unit_enabled("snmpd.service", False)
             DEV_LOGGER.info("Disabled turnserver")
+
+
+def ssl_session_cache_size(clients: int) -> int:
+    """Megabytes of shared TLS session cache needed for the expected clients"""
+    return max(1, math.ceil(clients * SSL_SESSIONS_PER_CLIENT / SSL_SESSIONS_PER_MB))
+
+
+def unified_diff(path: str, before: str | None, after: str) -> str:
+    """
+    Returns a unified diff between the current (None if missing) and new
+    contents of a file.
+    """
+    lines = difflib.unified_diff(
+        (before or "").splitlines(keepends=True),
+        after.splitlines(keepends=True),
+        fromfile="/dev/null" if before is None else "a" + path,
+        tofile="b" + path,
+    )
+    return "".join(line if line.endswith("\n") else line + "\n" for line in lines)
+
+
+def critical_path(
+    durations: dict[str, float], dependencies: dict[str, tuple[str, ...]]
+) -> list[str]:
+    """
+    Returns the chain of phases with the longest total duration, which bounds
+    the wall-time of a parallel apply.
+    """
+    finish: dict[str, tuple[float, list[str]]] = {}
+
+    def longest(phase: str) -> tuple[float, list[str]]:
+        if phase not in finish:
+            before = max(
+                (longest(dep) for dep in dependencies[phase]),
+                default=(0.0, []),
+                key=lambda item: item[0],
+            )
+            finish[phase] = (before[0] + durations[phase], before[1] + [phase])
+        return finish[phase]
+
+    return max(
+        (longest(phase) for phase in durations),
+        default=(0.0, []),
+        key=lambda item: item[0],
+    )[1]
@@ -0,0 +1,305 @@
+"""
+Actively health checks the conference nodes behind the web reverse proxy.
+
+Runs as rp-turn-healthcheck.service: each node is probed over HTTPS, and when
+a node's health changes the pexip upstream is rewritten (with unhealthy nodes
+marked down) and nginx is gracefully reloaded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import ssl
+import time
+from collections import defaultdict
+from typing import Any
+
+from rp_turn import steps, utils
+from rp_turn.config_applicator import HEALTHCHECK_CONFIG_PATH, ConfigApplicator
+from rp_turn.installwizard import setup_logger
+from rp_turn.platform import nodehealth
+from rp_turn.post_apply import PostApply
+from rp_turn.steps.health_check import DEFAULT_HEALTH_CHECK_INTERVAL
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+PROBE_PATH = "/"
+PROBE_TIMEOUT = 3.0
+USER_AGENT = "rp-turn-healthcheck"
+# Consecutive probes needed to change a node's health
+RISE = 2
+FALL = 3
+
+
+class ProbeError(Exception):
+    """A conference node did not respond to a probe"""
+
+
+def _timestamp(when: float) -> str:
+    """Formats a time for the status file"""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(when))
+
+
+async def probe(
+    address: str,
+    port: int = 443,
+    path: str = PROBE_PATH,
+    timeout: float = PROBE_TIMEOUT,
+) -> float:
+    """
+    Requests path from a conference node over HTTPS. Any response other than a
+    server error counts, as nodes redirect most paths.
+    Returns the latency in seconds, or raises ProbeError.
+    """
+    # Conference nodes are addressed by IP, so their certificates cannot be verified
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    start = time.monotonic()
+    try:
+        status = await asyncio.wait_for(_request(address, port, path, context), timeout)
+    except asyncio.TimeoutError as error:
+        raise ProbeError(f"no response within {timeout:g}s") from error
+    except (OSError, ssl.SSLError) as error:
+        raise ProbeError(str(error) or type(error).__name__) from error
+    if status >= 500:
+        raise ProbeError(f"HTTP {status}")
+    return time.monotonic() - start
+
+
+async def _request(address: str, port: int, path: str, context: ssl.SSLContext) -> int:
+    """Sends a GET request, returning the status code of the response"""
+    reader, writer = await asyncio.open_connection(address, port, ssl=context)
+    try:
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {address}\r\n"
+                f"User-Agent: {USER_AGENT}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode("ascii")
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+    words = status_line.split()
+    if len(words) < 2 or not words[0].startswith(b"HTTP/") or not words[1].isdigit():
+        raise ProbeError(f"invalid response: {status_line[:80]!r}")
+    return int(words[1])
+
+
+class NodeHealth:
+    """
+    Probe results of a conference node. Its health only changes after RISE
+    probes in a row succeed (or FALL fail), so one slow response does not take
+    a node out of the upstream.
+    """
+
+    def __init__(self, healthy: bool = True, rise: int = RISE, fall: int = FALL):
+        self.healthy = healthy
+        self.latency: float | None = None
+        self.error: str | None = None
+        self.checked: float | None = None
+        self._rise = rise
+        self._fall = fall
+        # Probes in a row whose result disagrees with healthy
+        self._streak = 0
+
+    def record(self, latency: float | None, error: str | None = None) -> bool:
+        """
+        Records a probe's latency in seconds, or its error if it failed.
+        Returns whether the node's health changed.
+        """
+        self.checked = time.time()
+        self.latency = latency
+        self.error = error
+        succeeded = error is None
+        if succeeded == self.healthy:
+            self._streak = 0
+            return False
+        self._streak += 1
+        if self._streak < (self._rise if succeeded else self._fall):
+            return False
+        self.healthy = succeeded
+        self._streak = 0
+        return True
+
+    def to_dict(self) -> dict[str, Any]:
+        """Returns the probe results as a JSON serialisable dict"""
+        return {
+            "healthy": self.healthy,
+            "latency_ms": (
+                None if self.latency is None else round(self.latency * 1000, 3)
+            ),
+            "error": self.error,
+            "checked": None if self.checked is None else _timestamp(self.checked),
+        }
+
+
+def load_config(path: str) -> defaultdict | None:
+    """
+    Loads the conference nodes to probe, as written by ConfigApplicator.
+    Returns None if there is nothing to probe.
+    """
+    try:
+        with open(path, encoding="utf-8") as file_obj:
+            saved_config = utils.make_nested_dict(json.load(file_obj))
+    except FileNotFoundError:
+        DEV_LOGGER.info("No conference nodes to health check at %s", path)
+        return None
+    except (OSError, ValueError):
+        DEV_LOGGER.exception("Unable to read %s", path)
+        return None
+    config = utils.nested_dict()
+    steps.SignalingConferenceNodeStep().default_config(saved_config, config)
+    steps.LoadBalanceMethodStep().default_config(saved_config, config)
+    steps.HealthCheckStep().default_config(saved_config, config)
+    if not config["conferencenodes"]:
+        DEV_LOGGER.info("No conference nodes to health check in %s", path)
+        return None
+    return config
+
+
+class HealthChecker:
+    """Probes the conference nodes, taking unhealthy ones out of the upstream"""
+
+    def __init__(
+        self,
+        config_path: str = HEALTHCHECK_CONFIG_PATH,
+        port: int = 443,
+    ) -> None:
+        self._config_path = config_path
+        self._port = port
+        self.config: defaultdict | None = None
+        # Health survives restarts of the service (/run/rp-turn is preserved
+        # across them), but not stopping it or rebooting
+        self.nodes = {
+            address: NodeHealth(healthy=result.get("healthy") is not False)
+            for address, result in nodehealth.read_status(
+                nodehealth.HEALTH_STATUS_PATH
+            ).items()
+        }
+
+    @property
+    def interval(self) -> int:
+        """Seconds between probing the nodes"""
+        if self.config is None:
+            return DEFAULT_HEALTH_CHECK_INTERVAL
+        interval: int = self.config["healthcheck"]["interval"]
+        return interval
+
+    async def check(self) -> bool:
+        """
+        Probes every conference node once, rereading which nodes to probe first.
+        Returns whether the health of any node changed.
+        """
+        self.config = load_config(self._config_path)
+        addresses = [] if self.config is None else self.config["conferencenodes"]
+        self.nodes = {
+            address: self.nodes.get(address) or NodeHealth() for address in addresses
+        }
+        timeout = min(PROBE_TIMEOUT, self.interval)
+        results = await asyncio.gather(
+            *(self._probe(address, timeout) for address in addresses)
+        )
+        changed = False
+        for address, (latency, error) in zip(addresses, results):
+            if self.nodes[address].record(latency, error):
+                changed = True
+                DEV_LOGGER.info(
+                    "Conference node %s is %s%s",
+                    address,
+                    "healthy" if self.nodes[address].healthy else "unhealthy",
+                    f": {error}" if error else "",
+                )
+        return changed
+
+    async def _probe(
+        self, address: str, timeout: float
+    ) -> tuple[float | None, str | None]:
+        """Probes a node, returning its latency or the error"""
+        try:
+            return await probe(address, port=self._port, timeout=timeout), None
+        except ProbeError as error:
+            return None, str(error)
+
+    def write_status(self) -> None:
+        """
+        Writes the latest probe results of each node, and whether any healthy
+        node which is not drained can take requests
+        """
+        nodehealth.write_status(
+            nodehealth.HEALTH_STATUS_PATH,
+            {address: health.to_dict() for address, health in self.nodes.items()},
+            _timestamp(time.time()),
+        )
+        options = {} if self.config is None else self.config["conferencenodeoptions"]
+        nodehealth.write_available(
+            nodehealth.AVAILABLE_PATH,
+            any(
+                health.healthy and not options[address]["down"]
+                for address, health in self.nodes.items()
+            ),
+        )
+
+    def update_upstream(self) -> bool:
+        """
+        Rewrites the pexip upstream from the latest health, gracefully reloading
+        nginx if it changed. Returns False if nginx could not be reloaded.
+        """
+        if self.config is None:
+            return True
+        applicator = ConfigApplicator(self.config, incremental=True)
+        changed = applicator.apply_nginx_upstream()
+        return PostApply(changed, {}).run()
+
+    async def run(self) -> None:
+        """Probes the nodes forever"""
+        loop = asyncio.get_running_loop()
+        # The upstream may have been written from health which is now gone,
+        # e.g. after a reboot
+        update = True
+        while True:
+            started = loop.time()
+            changed = await self.check()
+            await loop.run_in_executor(None, self.write_status)
+            if changed or update:
+                update = not await loop.run_in_executor(None, self.update_upstream)
+            await asyncio.sleep(max(0.0, started + self.interval - loop.time()))
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the health check service."""
+    parser = argparse.ArgumentParser(
+        prog="rp-turn-healthcheck",
+        description="Health checks the conference nodes behind the web reverse proxy",
+    )
+    parser.add_argument(
+        "--config",
+        default=HEALTHCHECK_CONFIG_PATH,
+        help="conference nodes to health check (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_const",
+        const=True,
+        default=False,
+        help="prints debug to stdout (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    setup_logger(debug=args.debug)
+    DEV_LOGGER.info("Starting conference node health checks")
+    asyncio.run(HealthChecker(args.config).run())
+
+
+if __name__ == "__main__":
+    main()
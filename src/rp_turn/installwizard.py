@@ -7,19 +7,22 @@ from __future__ import annotations
 # Standard library imports
 import argparse
 import copy
+import cProfile
 import itertools
 import json
 import logging.handlers
 import os
 import signal
 import sys
+import tempfile
 import time
 from collections import defaultdict
 from functools import partial
-from typing import Any, Generator
+from typing import Any, Callable, Generator
 
-from rp_turn import steps, utils
+from rp_turn import keygen, steps, trace, utils
 from rp_turn.config_applicator import ConfigApplicator
+from rp_turn.post_apply import PostApply
 
 DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
 
@@ -29,26 +32,44 @@ class InstallWizard:
     Installation wizard.
     """
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(
         self,
         skip_ui: bool = False,
         skip_apply: bool = True,
         config_file_path: str | None = None,
         verify_json: bool = False,
+        *,
+        incremental: bool = False,
+        trace_path: str | None = None,
+        plan: str | None = None,
+        root: str = "/",
     ) -> None:
+        # pylint: disable=too-many-arguments
         # pylint: disable=too-many-statements
         # pylint: disable=too-many-branches
+        # pylint: disable=too-many-locals
         # Must verify the JSON file if we are skipping UI
         if skip_ui:
             verify_json = True
 
         # Initialise variables
-        self._config_file_path = os.getenv("HOME", "~") + "/.reverseproxy-config.json"
+        self._config_file_path = default_config_file_path()
         if config_file_path:
             self._config_file_path = config_file_path
         self._step_num = 0
         self._skip_ui = skip_ui
         self._skip_apply = skip_apply
+        self._incremental = incremental
+        # Where to write the timed spans of each apply, if anywhere
+        self._trace_path = trace_path
+        # Staging directory to plan the apply in (instead of applying it), and
+        # the directory holding the current system files to compare against
+        self._plan = plan
+        self._root = root
+        # Keys generated while waiting for the user's input
+        self._keys = keygen.KeyGenerator()
         self._steps: list[steps.Step] = []
         self._next_steps: list[steps.Step] = (
             []
@@ -145,6 +166,10 @@ class InstallWizard:
             DEV_LOGGER.info("Adding CertificatesSteps")
             self._steps.append(certs_step)
         self._config["first_run"] = first_run
+        if first_run and incremental:
+            # Nothing from a previous run can be trusted, so write everything
+            DEV_LOGGER.info("Ignoring incremental apply on first run")
+            self._incremental = False
 
     def _get_attached_nics(self) -> list[tuple[str, str]]:
         """
@@ -315,7 +340,7 @@ class InstallWizard:
             if path_reason not in acceptable_differences
         )
 
-    def _apply_user_config(self) -> None:
+    def _apply_user_config(self) -> ConfigApplicator:
         """Applies a configuration to the system"""
         if self._skip_ui:
             # We skipped the user input, so we need to check that the saved_config had all the required fields
@@ -329,10 +354,34 @@ class InstallWizard:
                 print("Aborting!")
                 sys.exit(1)
         # Apply the configuration to the system
-        ConfigApplicator(self._config).apply()
+        applicator = ConfigApplicator(
+            self._config,
+            incremental=self._incremental,
+            staging=self._plan,
+            root=self._root,
+            keys=self._keys,
+        )
+        applicator.apply()
+        return applicator
 
     def run(self) -> None:
         """Runs the installwizard"""
+        try:
+            self._run()
+        finally:
+            self._keys.close()
+
+    def _run(self) -> None:
+        """Gathers the user input, then applies (or plans) the config"""
+        if not self._skip_ui and not self._skip_apply and self._plan is None:
+            # Keys are likely to be regenerated, so start generating them
+            # while the user answers the questions
+            self._keys.start(
+                key_algorithm=utils.config_get(
+                    self._config["generate-certs"]["keyalgorithm"]
+                ),
+                ssh=True,
+            )
         if not self._skip_ui:
             DEV_LOGGER.info("Going through UI")
             os.system("/usr/bin/clear")
@@ -342,12 +391,100 @@ class InstallWizard:
 |   Pexip Reverse Proxy and TURN Server Install Wizard   |"""
             )
             self._gather_user_input()
-            self._save_user_config()
+        if self._plan is not None:
+            DEV_LOGGER.info("Going through plan")
+            self._print_plan(self._apply_user_config())
+            return
+        reboot_required = False
         if not self._skip_apply:
             DEV_LOGGER.info("Going through apply")
-            self._apply_user_config()
+            tracer = trace.Tracer()
+            with tracer.activate():
+                try:
+                    applicator = self._apply_user_config()
+                    post_apply = PostApply(
+                        applicator.changed, applicator.units, applicator.requested_units
+                    )
+                    reboot_required = (
+                        self._config["first_run"] or post_apply.reboot_required
+                    )
+                    if not reboot_required:
+                        DEV_LOGGER.info("Applying changes without rebooting")
+                        with trace.span("post_apply"):
+                            if not post_apply.run():
+                                self._roll_back(applicator)
+                finally:
+                    self._write_trace(tracer)
+        # Only answers which were put into effect are offered again next time
+        if not self._skip_ui:
+            self._save_user_config()
+        if reboot_required:
             reboot()
 
+    @staticmethod
+    def _roll_back(applicator: ConfigApplicator) -> None:
+        """
+        Puts back the previous configuration after it failed to take effect
+        (e.g. nginx -t rejected it), then exits
+        """
+        DEV_LOGGER.error("Unable to put the changes into effect, rolling back")
+        print("Unable to put the changes into effect, rolling back")
+        changed = applicator.changed
+        restored = applicator.restore()
+        if restored:
+            print("Restored the previous files:")
+            for path in restored:
+                print("  - " + path)
+        for unit, enabled in sorted(applicator.units.items()):
+            print(f"{'Enabled' if enabled else 'Disabled'} {unit} again")
+        not_restored = [path for path in changed if path not in restored]
+        if not_restored:
+            print("Not restored, as there was no previous copy (e.g. secrets):")
+            for path in not_restored:
+                print("  - " + path)
+        print("The saved configuration was left as it was")
+        # Services which did take the new files must take the old ones again
+        PostApply(
+            applicator.changed, applicator.units, applicator.requested_units
+        ).run()
+        sys.exit(1)
+
+    def _print_plan(self, applicator: ConfigApplicator) -> None:
+        """Prints the changes a planned apply would make"""
+        for path in applicator.changed:
+            if applicator.diffs.get(path):
+                print(applicator.diffs[path], end="")
+            elif path not in applicator.diffs:
+                print(f"{path} would be regenerated")
+        if applicator.actions:
+            print("Commands:")
+            for action in applicator.actions:
+                print("  $ " + action)
+        post_apply = PostApply(
+            applicator.changed, applicator.units, applicator.requested_units
+        )
+        if self._config["first_run"] or post_apply.reboot_required:
+            print("Then reboot")
+        else:
+            for description, commands in post_apply.commands():
+                print(f"Then {description[0].lower()}{description[1:]}:")
+                for command in commands:
+                    print("  $ " + " ".join(command))
+
+    def _write_trace(self, tracer: trace.Tracer) -> None:
+        """Writes the apply trace, if requested"""
+        if self._trace_path is None:
+            return
+        try:
+            tracer.write(self._trace_path)
+        except OSError:
+            DEV_LOGGER.exception("Unable to write trace to %s", self._trace_path)
+
+
+def default_config_file_path() -> str:
+    """Where the config is saved, unless --config is given"""
+    return os.getenv("HOME", "~") + "/.reverseproxy-config.json"
+
 
 def reboot() -> None:
     """Reboot the system"""
@@ -360,6 +497,17 @@ def reboot() -> None:
     print("\r\nSystem going down for reboot\r\n")
 
 
+def run_profiled(function: Callable[[], None], path: str) -> None:
+    """Runs function under cProfile, dumping the stats to path"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(function)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
+        DEV_LOGGER.info("Wrote profile to %s", path)
+
+
 def setup_logger(debug: bool = False, dev_log: bool = True) -> None:
     """Sets up the dev logger to output to /dev/log (and optionally stdout)"""
     # Setup logging
@@ -433,7 +581,48 @@ def main() -> None:
         default=False,
         help="exits if the config file is not a valid JSON file (default: %(default)s)",
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=trace.PROFILE_PATH,
+        default=None,
+        metavar="PATH",
+        help=(
+            "writes a cProfile dump of the run to PATH "
+            f"(default PATH: {trace.PROFILE_PATH})"
+        ),
+    )
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="STAGING_DIR",
+        help=(
+            "renders the config into STAGING_DIR (default: a temporary directory) "
+            "and shows the diffs and commands instead of applying it"
+        ),
+    )
+    parser.add_argument(
+        "--root",
+        default="/",
+        help=(
+            "directory holding the current system files to plan against "
+            "(default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_const",
+        const=True,
+        default=False,
+        help="only rewrites files whose contents changed (default: %(default)s)",
+    )
     args = parser.parse_args()
+    if args.root != "/" and args.plan is None:
+        parser.error("--root can only be used with --plan")
+    if args.plan == "":
+        args.plan = tempfile.mkdtemp(prefix="rp-turn-plan-")
 
     # Setup logging
     setup_logger(debug=args.debug)
@@ -445,8 +634,15 @@ def main() -> None:
             skip_apply=args.skip_apply,
             config_file_path=args.config,
             verify_json=args.verify_json,
+            incremental=args.incremental,
+            trace_path=trace.TRACE_PATH if args.plan is None else None,
+            plan=args.plan,
+            root=args.root,
         )
-        wizard.run()
+        if args.profile:
+            run_profiled(wizard.run, args.profile)
+        else:
+            wizard.run()
     except Exception as error:  # pylint: disable=broad-except
         print("Unexpected error: " + str(error))
         DEV_LOGGER.exception("Unexpected error took the whole program out")
@@ -0,0 +1,83 @@
+"""
+Key material generated in the background while the wizard waits for input
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent import futures
+
+from rp_turn.platform import certificate, hostkeys
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+
+class KeyGenerator:
+    """
+    Hands out newly generated keys for the apply. Keys started ahead of time
+    are generated in a background thread; any other key is generated when it
+    is asked for. Each key is handed out at most once, and keys which are
+    never asked for (e.g. the user declined regenerating them) are discarded.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._executor: futures.ThreadPoolExecutor | None = None
+        self._tls_keys: dict[str, futures.Future[certificate.PrivateKey]] = {}
+        self._host_keys: futures.Future[dict[str, hostkeys.HostKey]] | None = None
+
+    def start(self, key_algorithm: str | None = None, ssh: bool = False) -> None:
+        """
+        Starts generating keys in the background.
+
+        key_algorithm: Algorithm of the TLS key to generate, if any
+        ssh: Whether to generate SSH host keys
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="keygen"
+                )
+            if key_algorithm is not None and key_algorithm not in self._tls_keys:
+                DEV_LOGGER.info(
+                    "Generating %s TLS key in the background", key_algorithm
+                )
+                self._tls_keys[key_algorithm] = self._executor.submit(
+                    certificate.generate_key, key_algorithm
+                )
+            if ssh and self._host_keys is None:
+                DEV_LOGGER.info("Generating SSH host keys in the background")
+                self._host_keys = self._executor.submit(hostkeys.generate_host_keys)
+
+    def tls_key(self, key_algorithm: str) -> certificate.PrivateKey:
+        """Returns a new TLS key, waiting for it if it is still being generated"""
+        with self._lock:
+            future = self._tls_keys.pop(key_algorithm, None)
+        if future is None:
+            return certificate.generate_key(key_algorithm)
+        return future.result()
+
+    def host_keys(self) -> dict[str, hostkeys.HostKey]:
+        """Returns new SSH host keys, waiting for them if still being generated"""
+        with self._lock:
+            future, self._host_keys = self._host_keys, None
+        if future is None:
+            return hostkeys.generate_host_keys()
+        return future.result()
+
+    def close(self) -> None:
+        """Discards any keys which were not handed out"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            discarded: list[futures.Future] = list(self._tls_keys.values())
+            if self._host_keys is not None:
+                discarded.append(self._host_keys)
+            self._tls_keys = {}
+            self._host_keys = None
+        for future in discarded:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if discarded:
+            DEV_LOGGER.info("Discarding unused keys generated in the background")
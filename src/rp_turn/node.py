@@ -0,0 +1,185 @@
+"""
+Drains conference nodes from the web reverse proxy (and returns them to it)
+without re-running the installwizard or rebooting.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+
+from rp_turn import steps, utils
+from rp_turn.config_applicator import ConfigApplicator
+from rp_turn.installwizard import default_config_file_path, setup_logger
+from rp_turn.platform import filewriter
+from rp_turn.post_apply import PostApply
+from rp_turn.step_error import StepError
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+
+class NodeError(Exception):
+    """A conference node could not be drained or undrained"""
+
+
+def load_config(path: str) -> tuple[defaultdict, defaultdict]:
+    """
+    Loads the saved config, and validates the web reverse proxy part of it.
+    Returns the saved config and the validated web reverse proxy config.
+    """
+    try:
+        with open(path, encoding="utf-8") as file_obj:
+            saved_config = utils.make_nested_dict(json.load(file_obj))
+    except IOError as error:
+        raise NodeError(f"No config saved at {path}") from error
+    except ValueError as error:
+        raise NodeError(f"{path} is not a valid JSON file") from error
+    config = utils.nested_dict()
+    steps.WebLoadBalanceStep().default_config(saved_config, config)
+    if not config["enablewebloadbalance"] or not config["conferencenodes"]:
+        raise NodeError("The web reverse proxy is not enabled")
+    return saved_config, config
+
+
+def save_config(path: str, saved_config: defaultdict) -> None:
+    """Atomically replaces the saved config, keeping its mode"""
+    filewriter.FileWriter(path).write(
+        json.dumps(saved_config, indent=4, sort_keys=True),
+        mode=os.stat(path).st_mode & 0o777,
+        backup=False,
+    )
+    DEV_LOGGER.info("Saved config at: %s", path)
+
+
+def node_states(config: defaultdict) -> list[tuple[str, str, int]]:
+    """Returns the address, state and weight of each conference node"""
+    states = []
+    for address in config["conferencenodes"]:
+        options = config["conferencenodeoptions"][address]
+        if options["down"]:
+            state = "drained"
+        elif options["backup"]:
+            state = "backup"
+        else:
+            state = "active"
+        states.append((address, state, options["weight"]))
+    return states
+
+
+def set_drained(
+    config: defaultdict, address: str, drained: bool, force: bool = False
+) -> bool:
+    """
+    Marks a conference node as drained (down) or not.
+    Returns whether the node's state changed.
+    """
+    try:
+        address = str(utils.validate_ip(address))
+    except StepError as error:
+        raise NodeError(str(error)) from error
+    if address not in config["conferencenodes"]:
+        raise NodeError(f"{address} is not a conference node")
+    options = config["conferencenodeoptions"][address]
+    if options["down"] == drained:
+        return False
+    if drained and not force:
+        in_rotation = [
+            node
+            for node, state, _ in node_states(config)
+            if state == "active" and node != address
+        ]
+        if not in_rotation:
+            raise NodeError(
+                f"{address} is the last active conference node (use --force to drain it)"
+            )
+    options["down"] = drained
+    return True
+
+
+def reload_upstream(config: defaultdict) -> bool:
+    """
+    Rewrites the pexip upstream and gracefully reloads nginx.
+    Returns False if nginx rejected the new upstream (or failed to reload).
+    """
+    applicator = ConfigApplicator(config)
+    changed = applicator.apply_nginx_upstream()
+    return PostApply(changed, {}).run()
+
+
+def run(args: argparse.Namespace) -> None:
+    """Runs a node command"""
+    config_file_path = args.config or default_config_file_path()
+    saved_config, config = load_config(config_file_path)
+    if args.action == "list":
+        for address, state, weight in node_states(config):
+            print(f"{address:<16}{state:<9}weight={weight}")
+        return
+
+    drained = args.action == "drain"
+    if not set_drained(config, args.address, drained, force=args.force):
+        print(f"{args.address} is already {'drained' if drained else 'active'}")
+        return
+    if not reload_upstream(config):
+        # nginx is still running with the previous upstream, so put its file back
+        set_drained(config, args.address, not drained, force=True)
+        reload_upstream(config)
+        raise NodeError(f"Unable to {args.action} {args.address}")
+    saved_config["conferencenodeoptions"] = config["conferencenodeoptions"]
+    save_config(config_file_path, saved_config)
+    print(f"{args.address} {'drained' if drained else 'is active again'}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the node command."""
+    parser = argparse.ArgumentParser(
+        prog="rp-turn node",
+        description="Drains conference nodes from the web reverse proxy",
+    )
+    parser.add_argument(
+        "--config",
+        default=None,
+        help="specify a different path to read/store the config (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_const",
+        const=True,
+        default=False,
+        help="prints debug to stdout (default: %(default)s)",
+    )
+    actions = parser.add_subparsers(dest="action", required=True)
+    actions.add_parser("list", help="lists the conference nodes and their state")
+    drain_parser = actions.add_parser(
+        "drain", help="stops sending new requests to a conference node"
+    )
+    drain_parser.add_argument("address", help="IP address of the conference node")
+    drain_parser.add_argument(
+        "--force",
+        action="store_const",
+        const=True,
+        default=False,
+        help="drains the node even if no other node is active (default: %(default)s)",
+    )
+    undrain_parser = actions.add_parser(
+        "undrain", help="sends new requests to a drained conference node again"
+    )
+    undrain_parser.add_argument("address", help="IP address of the conference node")
+    undrain_parser.set_defaults(force=False)
+    args = parser.parse_args(argv)
+
+    setup_logger(debug=args.debug)
+    DEV_LOGGER.info("Running node %s", args.action)
+    try:
+        run(args)
+    except NodeError as error:
+        DEV_LOGGER.exception("node %s failed", args.action)
+        print(str(error))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
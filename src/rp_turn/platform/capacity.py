@@ -0,0 +1,150 @@
+"""
+Sizes nginx, and the file descriptor limits it needs, from the CPUs and memory
+of the VM and the participants expected to use the web reverse proxy at once
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Connections nginx holds for each participant: the browser's connections to
+# the web app and the API (up to 4 over HTTP/1.1, including the event stream)
+# and the upstream connection nginx opens to a conference node for each
+CLIENT_CONNECTIONS_PER_PARTICIPANT = 4
+CONNECTIONS_PER_PARTICIPANT = CLIENT_CONNECTIONS_PER_PARTICIPANT * 2
+# Average memory of a connection, most of which are idle event streams or
+# keepalives without TLS or proxy buffers
+CONNECTION_MEMORY_KB = 32
+# Share of the memory nginx may use, leaving the rest to coturn, the OS and
+# the page cache
+NGINX_MEMORY_SHARE = 0.5
+# Headroom on each worker's share of the connections (worker_connections, and
+# so worker_rlimit_nofile) and, with reuseport, of the surge in its own listen
+# backlog, as new connections are never spread evenly over the workers
+WORKER_IMBALANCE = 1.25
+MIN_WORKER_CONNECTIONS = 1024
+# Each connection is a socket, and proxied or cached responses may hold a
+# file open too
+FDS_PER_CONNECTION = 2
+# fs.nr_open: the most file descriptors a process may have
+MAX_RLIMIT_NOFILE = 1048576
+MAX_WORKER_CONNECTIONS = MAX_RLIMIT_NOFILE // FDS_PER_CONNECTION
+# Share of the client connections which may be waiting to be accepted at
+# once, e.g. when a large meeting starts
+SURGE_SHARE = 0.25
+# nginx's default listen backlog on Linux, kept as the minimum
+MIN_BACKLOG = 511
+MAX_BACKLOG = 65535
+# Linux's default net.core.somaxconn since 5.4, which caps every backlog
+MIN_SOMAXCONN = 4096
+# File descriptors left to the rest of the system (coturn, sshd, journald...)
+RESERVED_FILES = 65536
+# The limits shipped before they were sized, kept as the minimum
+MIN_NOFILE_SOFT = 20000
+MIN_NOFILE_HARD = 60000
+MIN_FILE_MAX = 140000
+
+
+def detect_cpus() -> int:
+    """
+    Count the CPUs this process may run on.
+
+    :return: Number of CPUs, at least 1
+    """
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+def detect_memory_mb(root: str = "/") -> int | None:
+    """
+    Read the memory of the VM.
+
+    :param root: Directory holding /proc
+    :return: Megabytes of memory, or None if unknown
+    """
+    path = os.path.join(root, "proc/meminfo")
+    try:
+        with open(path, encoding="ascii") as file_obj:
+            for line in file_obj:
+                name, _, value = line.partition(":")
+                if name == "MemTotal":
+                    return int(value.split()[0]) // 1024
+    except (OSError, ValueError, IndexError):
+        DEV_LOGGER.exception("Unable to read the memory from %s", path)
+        return None
+    DEV_LOGGER.info("No MemTotal in %s", path)
+    return None
+
+
+def max_participants(memory_mb: int | None) -> int | None:
+    """
+    Work out how many participants nginx can hold in its share of the memory.
+
+    :param memory_mb: Megabytes of memory, or None if unknown
+    :return: Number of participants, or None if the memory is unknown
+    """
+    if memory_mb is None:
+        return None
+    connections = memory_mb * 1024 * NGINX_MEMORY_SHARE / CONNECTION_MEMORY_KB
+    return max(1, int(connections // CONNECTIONS_PER_PARTICIPANT))
+
+
+def nginx_sizing(
+    cpus: int, memory_mb: int | None, participants: int, reuseport: bool = False
+) -> dict[str, int]:
+    """
+    Size the nginx workers and the file descriptor limits consistently.
+
+    A worker runs on each CPU, each with connections for its share of the
+    participants. The participants are capped at what the memory holds, so a
+    small VM refuses connections up front rather than running out of memory,
+    and the file descriptor limits always cover the connections, so a worker
+    never fails to accept one for lack of descriptors. The listen backlog
+    holds a surge of new connections, split over the workers when each has
+    its own listening socket (reuseport), and net.core.somaxconn is raised
+    so the kernel does not cap it.
+
+    :param cpus: Number of CPUs
+    :param memory_mb: Megabytes of memory, or None if unknown
+    :param participants: Participants expected to use the web reverse proxy at once
+    :param reuseport: Whether each worker has its own listening sockets
+    :return: participants (as capped), workers, connections (per worker),
+             rlimit (file descriptors per worker), backlog (per listening
+             socket), nofilesoft, nofilehard (limits.d), filemax (fs.file-max)
+             and somaxconn (net.core.somaxconn)
+    """
+    workers = max(1, cpus)
+    capacity = max_participants(memory_mb)
+    if capacity is not None and participants > capacity:
+        DEV_LOGGER.warning(
+            "Sizing nginx for %d participants, the most %d MB of memory holds",
+            capacity,
+            memory_mb,
+        )
+        participants = capacity
+    connections = math.ceil(
+        participants * CONNECTIONS_PER_PARTICIPANT * WORKER_IMBALANCE / workers
+    )
+    connections = min(max(connections, MIN_WORKER_CONNECTIONS), MAX_WORKER_CONNECTIONS)
+    rlimit = connections * FDS_PER_CONNECTION
+    surge = participants * CLIENT_CONNECTIONS_PER_PARTICIPANT * SURGE_SHARE
+    if reuseport:
+        surge = surge * WORKER_IMBALANCE / workers
+    backlog = min(max(math.ceil(surge), MIN_BACKLOG), MAX_BACKLOG)
+    return {
+        "participants": participants,
+        "workers": workers,
+        "connections": connections,
+        "rlimit": rlimit,
+        "backlog": backlog,
+        "nofilesoft": max(MIN_NOFILE_SOFT, rlimit),
+        "nofilehard": max(MIN_NOFILE_HARD, rlimit),
+        "filemax": max(MIN_FILE_MAX, workers * rlimit + RESERVED_FILES),
+        "somaxconn": max(MIN_SOMAXCONN, backlog),
+    }
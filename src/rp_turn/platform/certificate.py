@@ -0,0 +1,112 @@
+"""
+Self-signed TLS certificate generation
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from typing import Union
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+ECDSA_P256 = "ecdsa-p256"
+RSA_2048 = "rsa-2048"
+KEY_ALGORITHMS = (ECDSA_P256, RSA_2048)
+DEFAULT_KEY_ALGORITHM = ECDSA_P256
+
+# ssl_ecdh_curve used by nginx alongside a certificate with each key algorithm
+ECDH_CURVES = {
+    ECDSA_P256: "X25519:prime256v1:secp384r1",
+    RSA_2048: "secp384r1",
+}
+# ssl_ecdh_curve of the performance TLS profile, whatever the key algorithm
+PERFORMANCE_ECDH_CURVE = "X25519:prime256v1"
+
+# Subject of the certificate, as previously set by /etc/ssl/pexip.cnf
+SUBJECT = x509.Name(
+    [
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "NO"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "Oslo"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "Oslo"),
+        x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, "Pexip"),
+    ]
+)
+
+PrivateKey = Union[ec.EllipticCurvePrivateKey, rsa.RSAPrivateKey]
+
+
+def generate_key(key_algorithm: str) -> PrivateKey:
+    """
+    Generate a private key.
+
+    :param key_algorithm: One of KEY_ALGORITHMS
+    :return: The private key
+    :raises ValueError: If the key algorithm is unknown
+    """
+    if key_algorithm == ECDSA_P256:
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_algorithm == RSA_2048:
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"Unknown key algorithm: {key_algorithm}")
+
+
+def self_signed_pem(key: PrivateKey, days: int = 1095) -> str:
+    """
+    Create a self-signed certificate for a private key.
+
+    :param key: Private key
+    :param days: Days the certificate is valid for
+    :return: PEM encoded private key followed by the certificate
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rsa_key = isinstance(key, rsa.RSAPrivateKey)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(SUBJECT)
+        .issuer_name(SUBJECT)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), True)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True,
+                content_commitment=True,
+                # Only RSA keys can be used for key transport
+                key_encipherment=rsa_key,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=False,
+                crl_sign=False,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            False,
+        )
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    certificate_pem = certificate.public_bytes(serialization.Encoding.PEM)
+    return (key_pem + certificate_pem).decode("ascii")
+
+
+def generate_self_signed_pem(key_algorithm: str = DEFAULT_KEY_ALGORITHM) -> str:
+    """
+    Generate a private key and a self-signed certificate for it.
+
+    :param key_algorithm: One of KEY_ALGORITHMS
+    :return: PEM encoded private key followed by the certificate
+    """
+    DEV_LOGGER.info("Generating %s self-signed certificate", key_algorithm)
+    return self_signed_pem(generate_key(key_algorithm))
@@ -3,35 +3,319 @@
 File writing classes
 """
 
+import contextlib
+import ctypes
+import ctypes.util
+import hashlib
+import logging
 import os
 import shutil
 import tempfile
+import threading
 import time
+from typing import Callable, Iterator, Optional, Union
+
+from rp_turn import trace
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+
+def content_digest(contents: bytes) -> str:
+    """
+    Digest used to compare rendered file contents with files on disk.
+
+    :param contents: File contents
+    :return: Hex encoded SHA-256 digest
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+
+def rooted(path: str, root: str = "/") -> str:
+    """
+    Map an absolute path onto a root directory.
+
+    :param path: Absolute path, as seen on the live system
+    :param root: Directory standing in for /
+    :return: The path below root
+    """
+    return os.path.join(root, os.path.relpath(path, "/"))
+
+
+def _libc_syncfs() -> Optional[Callable[[int], int]]:
+    """
+    Look up syncfs(2) in the C library.
+
+    :return: The syncfs function, or None if it is unavailable
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        return libc.syncfs
+    except (OSError, AttributeError):
+        return None
+
+
+def sync_filesystems(paths: list[str]) -> None:
+    """
+    Flush the filesystems holding the given paths with one syncfs(2) each,
+    falling back to sync(2) where syncfs is unavailable.
+
+    :param paths: Paths on the filesystems to flush
+    :return: None
+    """
+    syncfs = _libc_syncfs()
+    if syncfs is None:
+        with trace.span("sync"):
+            os.sync()
+        return
+    devices = set()
+    for path in paths:
+        dirfd = os.open(path, os.O_RDONLY)
+        try:
+            device = os.fstat(dirfd).st_dev
+            if device in devices:
+                continue
+            devices.add(device)
+            with trace.span("syncfs", path=path):
+                if syncfs(dirfd) != 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno), path)
+        finally:
+            os.close(dirfd)
+
+
+def _encode(contents: Union[str, bytes]) -> bytes:
+    """
+    Encode file contents.
+
+    :param contents: Text (encoded as UTF-8) or raw bytes
+    :return: The bytes to write
+    """
+    if isinstance(contents, bytes):
+        return contents
+    return contents.encode("utf-8")
+
+
+def _backup(path: str) -> None:
+    """
+    Keep the existing file as path.bak.
+
+    The backup is a hardlink, as the file is only ever replaced by renaming a
+    new file over it, falling back to a copy where hardlinks are unsupported.
+
+    :param path: Absolute path of the existing file
+    :return: None
+    """
+    try:
+        os.remove(path + ".bak")
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(path, path + ".bak")
+    except OSError:
+        shutil.copy2(path, path + ".bak")
+
+
+def restore_backup(path: str, root: str = "/") -> bool:
+    """
+    Put back the file kept as path.bak when path was last written.
+
+    :param path: Absolute path of the file, as seen on the live system
+    :param root: Directory standing in for /
+    :return: True if there was a backup to restore
+    """
+    target = rooted(path, root)
+    try:
+        os.rename(target + ".bak", target)
+    except FileNotFoundError:
+        return False
+    DEV_LOGGER.info("Restored %s from its backup", path)
+    return True
+
+
+class _WriteBatch:
+    """Files staged by FileWriter.write within FileWriter.batch"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Target path -> (staged temporary file, backup, sync)
+        self._staged: dict[str, tuple[str, bool, bool]] = {}
+
+    def stage(self, path: str, tmpfile: str, backup: bool, sync: bool) -> None:
+        """
+        Add a fully written temporary file to be renamed over path on commit.
+
+        :param path: Absolute path of file to write
+        :param tmpfile: Temporary file in the same directory holding the contents
+        :param backup: Whether to back up existing file
+        :param sync: Whether the write needs to be durable
+        :return: None
+        """
+        with self._lock:
+            previous = self._staged.get(path)
+            self._staged[path] = (tmpfile, backup, sync)
+        if previous is not None:
+            os.remove(previous[0])
+
+    def commit(self) -> None:
+        """
+        Flush the staged files with one barrier, then rename them into place.
+
+        :return: None
+        """
+        if not self._staged:
+            return
+        with trace.span("commit", files=len(self._staged)):
+            self._commit()
+
+    def _commit(self) -> None:
+        """
+        Flush and rename the staged files.
+
+        :return: None
+        """
+        parent_dirs = sorted({os.path.dirname(path) for path in self._staged})
+        sync = any(sync for _, _, sync in self._staged.values())
+        if sync:
+            sync_filesystems(parent_dirs)
+        for path, (tmpfile, backup, _) in sorted(self._staged.items()):
+            if backup and os.path.exists(path):
+                _backup(path)
+            os.rename(tmpfile, path)
+        DEV_LOGGER.info("Committed %d files", len(self._staged))
+        self._staged = {}
+        if sync:
+            sync_filesystems(parent_dirs)
+
+    def discard(self) -> None:
+        """
+        Remove the staged files, leaving their targets untouched.
+
+        :return: None
+        """
+        for tmpfile, _, _ in self._staged.values():
+            try:
+                os.remove(tmpfile)
+            except FileNotFoundError:
+                pass
+        self._staged = {}
 
 
 class FileWriter:
     """Generic file writer"""
 
-    def __init__(self, path: str):
+    _batch: Optional[_WriteBatch] = None
+    _batch_lock = threading.Lock()
+
+    def __init__(self, path: str, root: str = "/"):
         """
         Create generic file writer.
 
-        :param path: Absolute path of file to write
+        :param path: Absolute path of file to write, as seen on the live system
+        :param root: Directory standing in for / (e.g. a staging tree)
         """
         self._path = path
+        self._file = rooted(path, root)
+
+    @classmethod
+    @contextlib.contextmanager
+    def batch(cls) -> Iterator[None]:
+        """
+        Write files transactionally: files written (from any thread) within the
+        batch are staged, then flushed with a single sync barrier and renamed
+        into place when the batch exits. Existing files are left untouched until
+        then, and if the batch exits with an exception nothing is replaced.
+        Nested batches join the outermost one.
+
+        :return: Context manager
+        """
+        with cls._batch_lock:
+            if FileWriter._batch is not None:
+                outermost = False
+            else:
+                outermost = True
+                FileWriter._batch = _WriteBatch()
+            batch = FileWriter._batch
+        if not outermost:
+            yield
+            return
+        try:
+            yield
+        except BaseException:
+            batch.discard()
+            raise
+        else:
+            batch.commit()
+        finally:
+            with cls._batch_lock:
+                FileWriter._batch = None
+
+    @property
+    def path(self) -> str:
+        """Absolute path of the file to write, as seen on the live system"""
+        return self._path
+
+    @property
+    def file_path(self) -> str:
+        """Absolute path of the file to write, below the root"""
+        return self._file
+
+    def read(self) -> Optional[str]:
+        """
+        Read the file on disk, without anything written by this class that is
+        not part of the contents.
+
+        :return: The existing contents, or None if there is no file
+        """
+        try:
+            with open(self._file, "rb") as file_obj:
+                existing = file_obj.read()
+        except FileNotFoundError:
+            return None
+        existing_contents = self._strip_heading(existing)
+        if existing_contents is None:
+            existing_contents = existing
+        return existing_contents.decode("utf-8", errors="replace")
+
+    def unchanged(self, contents: Union[str, bytes]) -> bool:
+        """
+        Check whether the file on disk already holds the given contents.
+
+        :param contents: File contents (text or raw bytes), as they would be
+                         passed to write
+        :return: True if writing the contents would not change the file
+        """
+        try:
+            with open(self._file, "rb") as file_obj:
+                existing = file_obj.read()
+        except FileNotFoundError:
+            return False
+        existing_contents = self._strip_heading(existing)
+        if existing_contents is None:
+            return False
+        return content_digest(existing_contents) == content_digest(_encode(contents))
+
+    def _strip_heading(self, existing: bytes) -> Optional[bytes]:
+        """
+        Remove anything written by this class that is not part of the contents.
+
+        :param existing: Contents of the file on disk
+        :return: The contents as originally passed to write, or None if the file
+                 was not written by this class
+        """
+        return existing
 
     def write(
         self,
-        contents: str,
+        contents: Union[str, bytes],
         mode: int = 0o644,
         backup: bool = True,
         suffix: str = "",
         sync: bool = True,
     ) -> None:
         """
-        Write data to a file.
+        Write data to a file. Within FileWriter.batch the file is only staged.
 
-        :param contents: File contents
+        :param contents: File contents, text (written as UTF-8) or raw bytes
         :param mode: File access mode
         :param backup: Whether to back up existing file
         :param suffix: Suffix to use for the temporary file
@@ -40,26 +324,25 @@ class FileWriter:
         """
         # Write contents to a temporary file *in the same directory*, so
         # that the rename can be atomic.
-        parent_dir = os.path.dirname(os.path.abspath(self._path))
+        parent_dir = os.path.dirname(os.path.abspath(self._file))
         tmpfile = None
         osfh = None
+        batch = FileWriter._batch
         try:
             osfh, tmpfile = tempfile.mkstemp(dir=parent_dir, suffix=suffix)
-            os.write(osfh, contents.encode("utf-8"))
-            if sync:
-                os.fsync(osfh)
+            os.write(osfh, _encode(contents))
+            # A batch flushes all of its files with a single barrier on commit
+            if sync and batch is None:
+                with trace.span("fsync", path=self._file):
+                    os.fsync(osfh)
             os.close(osfh)
             osfh = None
 
             # Set mode bits
             os.chmod(tmpfile, mode)
 
-            if backup and os.path.exists(self._path):
-                # Write backup of existing file
-                shutil.copy2(self._path, self._path + ".bak")
-
-            # Atomically replace target
-            os.rename(tmpfile, self._path)
+            if self._place(tmpfile, backup, sync):
+                return
 
         except Exception:
             if tmpfile is not None:
@@ -68,22 +351,89 @@ class FileWriter:
                 os.close(osfh)
             raise
 
-        # (Optionally) force a sync on the parent directory - if we're
-        # being cautious and renaming into place, etc. then let's do
-        # our best for data safety by ensuring the file has been
-        # updated and is findable in the directory.
         if sync:
-            dirfd = os.open(parent_dir, os.O_RDONLY)
+            self._sync_parent_dir()
+
+    def replace(self, tmpfile: str, backup: bool = True, sync: bool = True) -> None:
+        """
+        Replace the file with a temporary file already holding the contents,
+        e.g. a database built by another library. Within FileWriter.batch the
+        file is only staged. The temporary file is removed if this fails.
+
+        :param tmpfile: Temporary file in the same directory as the file
+        :param backup: Whether to back up existing file
+        :param sync: Whether to issue fsync call(s) for extra data safety
+        :return: None
+        """
+        try:
+            # A batch flushes all of its files with a single barrier on commit
+            if sync and FileWriter._batch is None:
+                with open(tmpfile, "rb") as file_obj:
+                    with trace.span("fsync", path=self._file):
+                        os.fsync(file_obj.fileno())
+            if self._place(tmpfile, backup, sync):
+                return
+        except Exception:
+            os.remove(tmpfile)
+            raise
+        if sync:
+            self._sync_parent_dir()
+
+    def _place(self, tmpfile: str, backup: bool, sync: bool) -> bool:
+        """
+        Rename a fully written temporary file over the file, or stage it
+        within FileWriter.batch.
+
+        :param tmpfile: Temporary file in the same directory as the file
+        :param backup: Whether to back up existing file
+        :param sync: Whether the write needs to be durable
+        :return: True if the file was only staged
+        """
+        batch = FileWriter._batch
+        if batch is not None:
+            batch.stage(os.path.abspath(self._file), tmpfile, backup, sync)
+            return True
+
+        if backup and os.path.exists(self._file):
+            # Write backup of existing file
+            _backup(self._file)
+
+        # Atomically replace target
+        os.rename(tmpfile, self._file)
+        return False
+
+    def _sync_parent_dir(self) -> None:
+        """
+        Force a sync on the parent directory - if we're being cautious and
+        renaming into place, etc. then let's do our best for data safety by
+        ensuring the file has been updated and is findable in the directory.
+
+        :return: None
+        """
+        parent_dir = os.path.dirname(os.path.abspath(self._file))
+        dirfd = os.open(parent_dir, os.O_RDONLY)
+        with trace.span("fsync", path=parent_dir):
             os.fsync(dirfd)
-            os.close(dirfd)
+        os.close(dirfd)
 
 
 class HeadedFileWriter(FileWriter):
     """File writer for headed files."""
 
+    def _strip_heading(self, existing: bytes) -> Optional[bytes]:
+        """Remove the common header, which contains the time it was written."""
+        lines = existing.split(b"\n", 2)
+        if (
+            len(lines) == 3
+            and lines[0] == f"# >{self._path}".encode("utf-8")
+            and lines[1].startswith(b"# Written at ")
+        ):
+            return lines[2]
+        return None
+
     def write(
         self,
-        contents: str,
+        contents: Union[str, bytes],
         mode: int = 0o644,
         backup: bool = True,
         suffix: str = "",
@@ -92,7 +442,7 @@ class HeadedFileWriter(FileWriter):
         """Write data to a file, prepending a common header.
 
         Args:
-            - contents (str) : File contents
+            - contents (str|bytes): File contents
             - mode     (int) : File access mode
             - backup   (bool): Whether to back up existing file
             - suffix   (str):  Suffix to use for the temporary file
@@ -109,5 +459,10 @@ class HeadedFileWriter(FileWriter):
 # Written at {now} by {self.__class__.__name__}
 """
         FileWriter.write(
-            self, heading + contents, mode=mode, backup=backup, suffix=suffix, sync=sync
+            self,
+            _encode(heading) + _encode(contents),
+            mode=mode,
+            backup=backup,
+            suffix=suffix,
+            sync=sync,
         )
@@ -0,0 +1,70 @@
+"""
+OpenSSH host key generation
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Union
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Host key types created by ssh-keygen -A (as run by dpkg-reconfigure openssh-server)
+HOST_KEY_TYPES = ("rsa", "ecdsa", "ed25519")
+
+HostKey = Union[
+    rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey, ed25519.Ed25519PrivateKey
+]
+
+
+def generate_host_key(key_type: str) -> HostKey:
+    """
+    Generate a host key, with the same parameters ssh-keygen uses by default.
+
+    :param key_type: One of HOST_KEY_TYPES
+    :return: The private key
+    :raises ValueError: If the key type is unknown
+    """
+    if key_type == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=3072)
+    if key_type == "ecdsa":
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Unknown host key type: {key_type}")
+
+
+def generate_host_keys() -> dict[str, HostKey]:
+    """
+    Generate a host key of every type.
+
+    :return: Mapping of key type to private key
+    """
+    DEV_LOGGER.info("Generating SSH host keys: %s", ", ".join(HOST_KEY_TYPES))
+    return {key_type: generate_host_key(key_type) for key_type in HOST_KEY_TYPES}
+
+
+def host_key_files(keys: dict[str, HostKey], comment: str) -> dict[str, str]:
+    """
+    OpenSSH private and public key files for host keys.
+
+    :param keys: Mapping of key type to private key
+    :param comment: Comment of the public keys, e.g. root@hostname
+    :return: Mapping of file name (within /etc/ssh) to contents
+    """
+    files = {}
+    for key_type, key in keys.items():
+        name = f"ssh_host_{key_type}_key"
+        files[name] = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.OpenSSH,
+            serialization.NoEncryption(),
+        ).decode("ascii")
+        public_key = key.public_key().public_bytes(
+            serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH
+        )
+        files[name + ".pub"] = f"{public_key.decode('ascii')} {comment}\n"
+    return files
@@ -0,0 +1,65 @@
+"""
+Filters sensitive parameters out of the requests nginx logs
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+DEFAULT_SENSITIVE_PARAMS = ("code", "state", "token", "pin", "data")
+SENSITIVE_PARAM_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+FILTERED = "[FILTERED]"
+# Logged variable -> the variable holding it with the parameters filtered out
+FILTERED_VARIABLES = {
+    "$request": "$request_filtered",
+    "$http_referer": "$http_referer_filtered",
+}
+
+
+def filter_map(
+    params: list[str] | tuple[str, ...], source: str
+) -> list[tuple[str, str]]:
+    """
+    Build the nginx map entries filtering the values of parameters out of a
+    variable. Names match as suffixes, as before (token also filters access_token).
+
+    A line is matched against a single map, whose entries are anchored and
+    tried in turn. An nginx map value is a fixed string over the captures $1
+    to $9, so no entry can filter any number of values in place: the first
+    passes lines without any of the parameters through, the second filters
+    the value of a line's only parameter, and the last filters everything
+    from the first parameter to the end of the URI, so that no value is
+    ever logged.
+
+    :param params: Names of the sensitive parameters
+    :param source: Variable holding the unfiltered line, e.g. $request
+    :return: (regex, value) of each map entry, in order
+    """
+    if not params:
+        return []
+    name = f"(?:{'|'.join(dict.fromkeys(params))})="
+    # Text without any of the parameters
+    clean = f"(?:(?!{name}).)*"
+    # The value is always taken whole, so it is never backtracked into
+    value = "[^&\\s]*(?![^&\\s])"
+    return [
+        (f"~^{clean}$", source),
+        (f"~^({clean}{name}){value}({clean})$", f"$1{FILTERED}$2"),
+        (f"~^({clean}{name})\\S*(\\s+HTTP/[0-9.]+$)?", f"$1{FILTERED}$2"),
+    ]
+
+
+def validate_param(name: str) -> str:
+    """
+    Check a sensitive parameter name can be matched without escaping.
+
+    :param name: Parameter name
+    :return: The name
+    :raises ValueError: If it has characters other than letters, digits, _ and -
+    """
+    if not SENSITIVE_PARAM_RE.match(name):
+        raise ValueError(f"{name!r} is not a parameter name")
+    return name
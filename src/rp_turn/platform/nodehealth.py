@@ -0,0 +1,90 @@
+"""
+Health of the conference nodes, as probed by rp_turn.healthcheck
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+from typing import Any
+
+from rp_turn.platform import filewriter
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Last probe results of each conference node (and their latency)
+HEALTH_STATUS_PATH = "/run/rp-turn/health.json"
+# Exists while a conference node can take requests, for nginx's /healthz. It is
+# removed with /run/rp-turn when rp-turn-healthcheck.service stops, but kept
+# while it restarts.
+AVAILABLE_PATH = "/run/rp-turn/available"
+
+
+def read_status(path: str) -> dict[str, dict[str, Any]]:
+    """
+    Read the last probe results of the conference nodes.
+
+    :param path: Path of the status file
+    :return: Mapping of node address to its probe results, empty if the nodes
+             have not been probed
+    """
+    try:
+        with open(path, encoding="utf-8") as file_obj:
+            status = json.load(file_obj)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        DEV_LOGGER.exception("Ignoring unreadable health status %s", path)
+        return {}
+    nodes = status.get("nodes") if isinstance(status, dict) else None
+    if not isinstance(nodes, dict):
+        DEV_LOGGER.info("Ignoring invalid health status %s", path)
+        return {}
+    return {
+        address: result for address, result in nodes.items() if isinstance(result, dict)
+    }
+
+
+def write_status(path: str, nodes: dict[str, dict[str, Any]], updated: str) -> None:
+    """
+    Atomically replace the probe results of the conference nodes.
+
+    :param path: Path of the status file (on a tmpfs, so it is not synced)
+    :param nodes: Mapping of node address to its probe results
+    :param updated: When the nodes were last probed
+    :return: None
+    """
+    filewriter.FileWriter(path).write(
+        json.dumps({"updated": updated, "nodes": nodes}, indent=4, sort_keys=True),
+        backup=False,
+        sync=False,
+    )
+
+
+def unhealthy_nodes(status: dict[str, dict[str, Any]]) -> set[str]:
+    """
+    Conference nodes whose last probes failed.
+
+    :param status: Probe results, as returned by read_status
+    :return: Addresses of the unhealthy nodes
+    """
+    return {
+        address for address, result in status.items() if result.get("healthy") is False
+    }
+
+
+def write_available(path: str, available: bool) -> None:
+    """
+    Create the file saying a conference node can take requests, or remove it.
+
+    :param path: Path of the file (on a tmpfs, so it is not synced)
+    :param available: Whether any conference node can take requests
+    :return: None
+    """
+    if available:
+        filewriter.FileWriter(path).write("ok\n", backup=False, sync=False)
+    else:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
@@ -0,0 +1,74 @@
+"""
+TLS session ticket keys shared by the nginx workers
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from rp_turn.platform import filewriter
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# The first key encrypts new tickets, the others still decrypt tickets issued
+# before the last rotations
+TICKET_KEY_PATHS = (
+    "/etc/nginx/ssl/ticket.key",
+    "/etc/nginx/ssl/ticket.key.1",
+    "/etc/nginx/ssl/ticket.key.2",
+)
+# AES-256 and HMAC-SHA256 keys, as used by nginx 1.11.8 and later
+TICKET_KEY_SIZE = 80
+
+
+def generate_ticket_key() -> bytes:
+    """
+    Generate a session ticket key.
+
+    :return: Random key of TICKET_KEY_SIZE bytes
+    """
+    return os.urandom(TICKET_KEY_SIZE)
+
+
+def ticket_keys_exist(root: str = "/") -> bool:
+    """
+    Check whether every session ticket key exists.
+
+    :param root: Directory standing in for /
+    :return: True if no key is missing
+    """
+    return all(
+        os.path.exists(filewriter.rooted(path, root)) for path in TICKET_KEY_PATHS
+    )
+
+
+def read_ticket_keys(root: str = "/") -> list[bytes | None]:
+    """
+    Read the session ticket keys.
+
+    :param root: Directory standing in for /
+    :return: Each key in the order of TICKET_KEY_PATHS, None where it is
+             missing or not a valid key
+    """
+    keys: list[bytes | None] = []
+    for path in TICKET_KEY_PATHS:
+        try:
+            with open(filewriter.rooted(path, root), "rb") as file_obj:
+                key = file_obj.read()
+        except FileNotFoundError:
+            key = b""
+        keys.append(key if len(key) == TICKET_KEY_SIZE else None)
+    return keys
+
+
+def rotated_ticket_keys(keys: list[bytes | None]) -> list[bytes]:
+    """
+    Rotate session ticket keys: a new key encrypts new tickets, and the oldest
+    key is dropped.
+
+    :param keys: Current keys, as returned by read_ticket_keys
+    :return: The new keys in the order of TICKET_KEY_PATHS
+    """
+    kept = [key or generate_ticket_key() for key in keys[: len(TICKET_KEY_PATHS) - 1]]
+    return [generate_ticket_key()] + kept
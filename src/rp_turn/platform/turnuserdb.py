@@ -0,0 +1,233 @@
+"""
+coturn SQLite user database
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Iterable, Optional
+
+from rp_turn.platform import filewriter
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Schema created by coturn (and turnadmin) for an SQLite userdb
+SCHEMA = (
+    "CREATE TABLE turnusers_lt (realm varchar(127) default '', "
+    "name varchar(512), hmackey char(128), PRIMARY KEY (realm,name))",
+    "CREATE TABLE turn_secret (realm varchar(127) default '', "
+    "value varchar(256), primary key (realm,value))",
+    "CREATE TABLE allowed_peer_ip (realm varchar(127) default '', "
+    "ip_range varchar(256), primary key (realm,ip_range))",
+    "CREATE TABLE denied_peer_ip (realm varchar(127) default '', "
+    "ip_range varchar(256), primary key (realm,ip_range))",
+    "CREATE TABLE turn_origin_to_realm (origin varchar(127),realm varchar(127), "
+    "primary key (origin))",
+    "CREATE TABLE turn_realm_option (realm varchar(127) default '', "
+    "opt varchar(32), value varchar(128), primary key (realm,opt))",
+    "CREATE TABLE oauth_key (kid varchar(128),ikm_key varchar(256), "
+    "timestamp bigint default 0,lifetime integer default 0, "
+    "as_rs_alg varchar(64) default '',realm varchar(127) default '', "
+    "primary key (kid))",
+    "CREATE TABLE admin_user (name varchar(32), realm varchar(127), "
+    "password varchar(127), primary key (name))",
+)
+
+
+def lt_cred_key(username: str, realm: str, password: str) -> str:
+    """
+    Long-term credential mechanism key for a TURN user (RFC 5389, section 15.4).
+
+    :param username: TURN username
+    :param realm: TURN realm
+    :param password: TURN password
+    :return: Hex encoded MD5 of username:realm:password, as stored by turnadmin
+    """
+    return hashlib.md5(f"{username}:{realm}:{password}".encode("utf-8")).hexdigest()
+
+
+def expected(
+    realm: str, users: dict[str, str], secrets: Iterable[str]
+) -> tuple[set[tuple[str, str, str]], set[tuple[str, str]]]:
+    """
+    Rows a database holding the given credentials contains.
+
+    :param realm: TURN realm
+    :param users: Mapping of username to password
+    :param secrets: Shared secrets
+    :return: Set of (realm, name, hmackey) users and set of (realm, secret) secrets
+    """
+    return (
+        {
+            (realm, name, lt_cred_key(name, realm, password))
+            for name, password in users.items()
+        },
+        {(realm, secret) for secret in secrets},
+    )
+
+
+def describe_rows(
+    users: set[tuple[str, str, str]], secrets: set[tuple[str, str]]
+) -> str:
+    """
+    Human readable listing of database rows, e.g. for diffing, which only
+    shows fingerprints of the keys and secrets.
+
+    :param users: Set of (realm, name, hmackey) users
+    :param secrets: Set of (realm, secret) secrets
+    :return: One line per row
+    """
+
+    def fingerprint(value: str) -> str:
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+    lines = [
+        f"user {realm} {name} key:{fingerprint(hmackey)}\n"
+        for realm, name, hmackey in sorted(users)
+    ]
+    lines += [
+        f"secret {realm} {fingerprint(value)}\n" for realm, value in sorted(secrets)
+    ]
+    return "".join(lines)
+
+
+def describe(realm: str, users: dict[str, str], secrets: Iterable[str]) -> str:
+    """
+    Human readable listing of a database holding the given credentials.
+
+    :param realm: TURN realm
+    :param users: Mapping of username to password
+    :param secrets: Shared secrets
+    :return: One line per row
+    """
+    return describe_rows(*expected(realm, users, secrets))
+
+
+class TurnUserDB:
+    """coturn user database (the file named by userdb= in turnserver.conf)"""
+
+    def __init__(self, path: str):
+        """
+        Create coturn user database accessor.
+
+        :param path: Absolute path of the SQLite database
+        """
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        """Absolute path of the SQLite database"""
+        return self._path
+
+    def read(self) -> tuple[set[tuple[str, str, str]], set[tuple[str, str]]]:
+        """
+        Read the credentials held in the database.
+
+        :return: Set of (realm, name, hmackey) users and set of (realm, secret) secrets
+        :raises sqlite3.Error: If the database is missing or unreadable
+        """
+        connection = sqlite3.connect(f"file:{self._path}?mode=ro", uri=True)
+        try:
+            users = {
+                (str(realm), str(name), str(hmackey).lower())
+                for realm, name, hmackey in connection.execute(
+                    "SELECT realm, name, hmackey FROM turnusers_lt"
+                )
+            }
+            secrets = {
+                (str(realm), str(value))
+                for realm, value in connection.execute(
+                    "SELECT realm, value FROM turn_secret"
+                )
+            }
+        finally:
+            connection.close()
+        return users, secrets
+
+    def unchanged(self, realm: str, users: dict[str, str], secrets: list[str]) -> bool:
+        """
+        Check whether the database already holds exactly the given credentials.
+
+        :param realm: TURN realm
+        :param users: Mapping of username to password
+        :param secrets: Shared secrets
+        :return: True if writing the credentials would not change the database
+        """
+        try:
+            existing = self.read()
+        except sqlite3.Error:
+            DEV_LOGGER.info("Unable to read %s", self._path)
+            return False
+        return existing == expected(realm, users, secrets)
+
+    def describe_existing(self) -> Optional[str]:
+        """
+        Human readable listing of the credentials held in the database.
+
+        :return: One line per row, or None if the database is missing or unreadable
+        """
+        try:
+            return describe_rows(*self.read())
+        except sqlite3.Error:
+            return None
+
+    def write(
+        self,
+        realm: str,
+        users: dict[str, str],
+        secrets: Iterable[str],
+        mode: int = 0o640,
+        group: Optional[str] = None,
+    ) -> None:
+        """
+        Atomically replace the database with the given credentials.
+
+        The new database is built in a temporary file next to the old one, in
+        a single transaction, then renamed over it. Within FileWriter.batch it
+        is only staged, like the other files written by the batch.
+
+        :param realm: TURN realm
+        :param users: Mapping of username to password
+        :param secrets: Shared secrets
+        :param mode: File access mode
+        :param group: Group to own the database (owned by root), if any
+        :return: None
+        """
+        parent_dir = os.path.dirname(os.path.abspath(self._path))
+        osfh, tmpfile = tempfile.mkstemp(dir=parent_dir, suffix=".db")
+        os.close(osfh)
+        try:
+            connection = sqlite3.connect(tmpfile)
+            try:
+                # Nothing to recover if building the new database fails
+                connection.execute("PRAGMA journal_mode=OFF")
+                with connection:
+                    for statement in SCHEMA:
+                        connection.execute(statement)
+                    connection.executemany(
+                        "INSERT INTO turnusers_lt VALUES (?, ?, ?)",
+                        (
+                            (realm, name, lt_cred_key(name, realm, password))
+                            for name, password in users.items()
+                        ),
+                    )
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO turn_secret VALUES (?, ?)",
+                        ((realm, secret) for secret in secrets),
+                    )
+            finally:
+                connection.close()
+            os.chmod(tmpfile, mode)
+            if group is not None:
+                shutil.chown(tmpfile, "root", group)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+        # Credentials are never backed up
+        filewriter.FileWriter(self._path).replace(tmpfile, backup=False)
+        DEV_LOGGER.info("Wrote %d users to %s", len(users), self._path)
@@ -0,0 +1,167 @@
+"""
+Post-apply stage: puts applied configuration into effect without a reboot where possible
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import logging
+import subprocess
+
+from rp_turn import utils
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+NETPLAN = "netplan"
+
+# Artifact (or pattern of artifacts) written by ConfigApplicator -> what has to
+# happen for it to take effect. None means nothing more is needed; artifacts
+# missing from here require a reboot.
+ARTIFACT_SERVICES: dict[str, str | None] = {
+    "/etc/netplan/01-netcfg.yaml": NETPLAN,
+    "/etc/hosts": None,
+    "/etc/ntp.conf": "ntp",
+    "/etc/nginx/nginx.conf": "nginx",
+    "/etc/nginx/sites-available/pexapp": "nginx",
+    "/etc/nginx/includes/pexip-upstream.conf": "nginx",
+    "/etc/nginx/sites-available/pexlog-filtered": "nginx",
+    "/etc/nginx/includes/pexip-banned.conf": "nginx",
+    "/etc/rp-turn/healthcheck.json": None,  # Reread by rp-turn-healthcheck.service
+    "/etc/rp-turn/static-cache.json": None,  # Read by rp-turn-static-cache-warmup
+    "/etc/nginx/ssl/pexip.pem": "nginx",
+    "/etc/nginx/ssl/ticket.key*": "nginx",
+    "/home/pexip/iptables.rules": None,  # Loaded by iptables-restore during apply
+    "/etc/turnserver.conf": "coturn",
+    "/etc/default/coturn": "coturn",
+    "/etc/turnuserdb.conf": "coturn",
+    "/etc/snmp/snmpd.conf": "snmpd.service",
+    "/etc/ssh/ssh_host*": "ssh.service",
+    "/etc/fail2ban/jail.d/pexiprp.local": "fail2ban.service",
+    "/etc/security/limits.d/pexiplimits.conf": None,  # Read by new sessions
+    "/etc/sysctl.d/20-pexip-limits.conf": "systemd-sysctl.service",
+}
+
+# Services that can pick up new configuration without dropping existing connections
+RELOADABLE_SERVICES = {"nginx"}
+
+# Units which cannot be (un)mounted safely while nginx is using them
+REBOOT_UNITS = {"var-cache-nginx-static.mount"}
+
+# Units using other services, so only started once those have been (re)loaded
+LATE_UNITS = {"rp-turn-static-cache-warmup.service"}
+
+# Commands checking a service's configuration before it is (re)loaded
+CONFIG_TESTS = {"nginx": ["/usr/sbin/nginx", "-t"]}
+
+
+class PostApply:
+    """
+    Works out the least disruptive way of putting changed artifacts into effect.
+    """
+
+    def __init__(
+        self,
+        changed: list[str],
+        units: dict[str, bool],
+        requested_units: dict[str, bool] | None = None,
+    ) -> None:
+        """
+        :param changed: Artifacts written by ConfigApplicator.apply
+        :param units: Units enabled (True) or disabled (False) by ConfigApplicator.apply
+        :param requested_units: State of every unit ConfigApplicator.apply
+                                manages, changed or not. Units meant to be
+                                disabled are never restarted or reloaded.
+        """
+        self.reboot_required = False
+        self._netplan = False
+        services: set[str] = set()
+        for path in changed:
+            pattern = _artifact_pattern(path)
+            if pattern is None:
+                DEV_LOGGER.info("%s changed, a reboot is required", path)
+                self.reboot_required = True
+                continue
+            service = ARTIFACT_SERVICES[pattern]
+            if service == NETPLAN:
+                self._netplan = True
+            elif service is not None:
+                services.add(service)
+        for unit in units.keys() & REBOOT_UNITS:
+            DEV_LOGGER.info("%s changed, a reboot is required", unit)
+            self.reboot_required = True
+        units = {unit: units[unit] for unit in units.keys() - REBOOT_UNITS}
+        self._start = sorted(unit for unit, enabled in units.items() if enabled)
+        self._stop = sorted(unit for unit, enabled in units.items() if not enabled)
+        disabled = {
+            unit for unit, enabled in (requested_units or {}).items() if not enabled
+        }
+        for unit in services & disabled:
+            DEV_LOGGER.info("%s changed, but %s stays disabled", unit, unit)
+        self._restart = sorted(services - set(self._start) - set(self._stop) - disabled)
+
+    def commands(self) -> list[tuple[str, list[list[str]]]]:
+        """
+        Ordered list of (description, commands) needed instead of a reboot
+        """
+        commands = []
+        if self._netplan:
+            commands.append(
+                ("Applying network configuration", [["/usr/sbin/netplan", "apply"]])
+            )
+        for unit in self._stop:
+            commands.append((f"Stopping {unit}", [["/bin/systemctl", "stop", unit]]))
+        for unit in self._start:
+            if unit in LATE_UNITS:
+                continue
+            commands.append(
+                (
+                    f"Starting {unit}",
+                    _config_test(unit) + [["/bin/systemctl", "restart", unit]],
+                )
+            )
+        for unit in self._restart:
+            action = "reload" if unit in RELOADABLE_SERVICES else "restart"
+            commands.append(
+                (
+                    f"{action.capitalize()}ing {unit}",
+                    _config_test(unit) + [["/bin/systemctl", action, unit]],
+                )
+            )
+        for unit in self._start:
+            if unit in LATE_UNITS:
+                commands.append(
+                    (f"Starting {unit}", [["/bin/systemctl", "restart", unit]])
+                )
+        return commands
+
+    def run(self) -> bool:
+        """
+        Runs the commands needed instead of a reboot.
+        Returns False if any of them failed.
+        """
+        success = True
+        for description, commands in self.commands():
+            print(description)
+            try:
+                for command in commands:
+                    utils.run_command(*command)
+            except subprocess.CalledProcessError as error:
+                DEV_LOGGER.exception("%s failed", description)
+                print(f"{description} failed: {error}")
+                success = False
+        return success
+
+
+def _artifact_pattern(path: str) -> str | None:
+    """Returns the ARTIFACT_SERVICES entry matching an artifact, if any"""
+    if path in ARTIFACT_SERVICES:
+        return path
+    for pattern in ARTIFACT_SERVICES:
+        if fnmatch.fnmatchcase(path, pattern):
+            return pattern
+    return None
+
+
+def _config_test(unit: str) -> list[list[str]]:
+    """Returns the configuration test for a unit, if it has one"""
+    return [CONFIG_TESTS[unit]] if unit in CONFIG_TESTS else []
@@ -0,0 +1,56 @@
+"""
+Rotates the TLS session ticket keys of nginx, run by rp-turn-ticket-keys.timer
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+
+from rp_turn.installwizard import setup_logger
+from rp_turn.platform import filewriter, ticketkeys
+from rp_turn.post_apply import PostApply
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+
+def rotate(root: str = "/") -> list[str]:
+    """
+    Replaces the session ticket keys with a new key followed by the newest
+    current keys. Returns the paths of the keys which were written.
+
+    root: Directory standing in for /
+    """
+    keys = ticketkeys.rotated_ticket_keys(ticketkeys.read_ticket_keys(root))
+    # Staged, then renamed into place together before nginx is reloaded
+    with filewriter.FileWriter.batch():
+        for path, key in zip(ticketkeys.TICKET_KEY_PATHS, keys):
+            filewriter.FileWriter(path, root=root).write(key, mode=0o600, backup=False)
+    DEV_LOGGER.info("Rotated session ticket keys")
+    return list(ticketkeys.TICKET_KEY_PATHS)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the ticket key rotation."""
+    parser = argparse.ArgumentParser(
+        prog="rp-turn-rotate-ticket-keys",
+        description="Rotates the TLS session ticket keys of the web reverse proxy",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_const",
+        const=True,
+        default=False,
+        help="prints debug to stdout (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    setup_logger(debug=args.debug)
+    # nginx only reads the keys when it is (re)loaded
+    if not PostApply(rotate(), {}).run():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,24 @@
 # pylint: disable=cyclic-import
 """Each step of the installwizard"""
 
+from rp_turn.steps.access_log import AccessLogStep, SensitiveParamsStep
 from rp_turn.steps.base_step import MultiStep, Step
+from rp_turn.steps.capacity import CapacityStep
 from rp_turn.steps.certificates import CertificatesStep
 from rp_turn.steps.dns import DNSStep
 from rp_turn.steps.dual_nic import DualNicStep
 from rp_turn.steps.fail2ban import Fail2BanStep
+from rp_turn.steps.health_check import HealthCheckStep, HealthEndpointStep
 from rp_turn.steps.hostname import HostnameStep
 from rp_turn.steps.management_networks import ManagementStep
 from rp_turn.steps.network import NetworkStep
 from rp_turn.steps.ntp import NTPStep
+from rp_turn.steps.rate_limit import RateLimitStep
+from rp_turn.steps.real_ip import RealIPStep, TrustedProxiesStep
 from rp_turn.steps.routes import RoutesStep
 from rp_turn.steps.snmp import SNMPStep
+from rp_turn.steps.static_cache import StaticCacheStep
+from rp_turn.steps.tls import TLSPerformanceStep, TLSProfileStep
 from rp_turn.steps.turnserver import (
     ClientTurnServerStep,
     MediaConferenceNodeStep,
@@ -19,6 +26,7 @@ from rp_turn.steps.turnserver import (
 )
 from rp_turn.steps.web_load_balance import (
     ContentSecurityPolicyStep,
+    LoadBalanceMethodStep,
     SignalingConferenceNodeStep,
     WebLoadBalanceStep,
 )
@@ -0,0 +1,119 @@
+"""
+Pexip installation wizard steps to setup the access logs
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.platform import logfilter
+from rp_turn.steps.base_step import MultiStep, Step, StepError
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Successful static asset requests logged: 1 in this many
+DEFAULT_STATIC_LOG_SAMPLE = 1
+# split_clients percentages have two decimal places, so 0.01% at least
+MAX_STATIC_LOG_SAMPLE = 10000
+
+
+class AccessLogStep(Step):
+    """Step to decide how much of the web reverse proxy's traffic is logged"""
+
+    def __init__(self) -> None:
+        super().__init__("Access Logs")
+        self.questions = [
+            self._enable_buffered_access_log,
+            self._enable_conditional_access_log,
+            self._get_static_log_sample,
+        ]
+
+    def _enable_buffered_access_log(self, config: defaultdict) -> None:
+        """Question to find out whether to buffer access log writes"""
+        default_buffered = utils.config_get(config["accesslog"]["buffered"])
+        response = self.ask_yes_no(
+            """\
+Buffered access logs are written every 64 KB or 5 seconds instead of on every
+request. Lines reach the logs (and fail2ban) up to 5 seconds late.
+
+Buffer access log writes?""",
+            default=default_buffered,
+        )
+        config["accesslog"]["buffered"] = response
+
+    def _enable_conditional_access_log(self, config: defaultdict) -> None:
+        """Question to find out whether to only log errors and slow requests"""
+        default_conditional = utils.config_get(config["accesslog"]["conditional"])
+        response = self.ask_yes_no(
+            """\
+Conditional access logs only keep failed requests and requests which took a
+second or more. Failed PIN attempts are always kept for fail2ban.
+
+Only log failed and slow requests?""",
+            default=default_conditional,
+        )
+        config["accesslog"]["conditional"] = response
+
+    def _get_static_log_sample(self, config: defaultdict) -> None:
+        """Question asking how many successful static requests to log"""
+        default_sample = utils.config_get(config["accesslog"]["staticsample"])
+        response = self.ask(
+            """\
+Sampled static asset requests are logged even with conditional access logs.
+
+Log 1 in how many successful static asset requests? (1 turns sampling off)""",
+            default=default_sample,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["accesslog"]["staticsample"] = utils.validate_int_range(
+            response, 1, MAX_STATIC_LOG_SAMPLE, "Static log sample"
+        )
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        for key in ("buffered", "conditional"):
+            DEV_LOGGER.info("Getting from saved_config: accesslog.%s", key)
+            config["accesslog"][key] = utils.validated_config_value(
+                saved_config["accesslog"],
+                key,
+                partial(utils.validate_type, bool),
+                fallback=False,
+            )
+        DEV_LOGGER.info("Getting from saved_config: accesslog.staticsample")
+        config["accesslog"]["staticsample"] = utils.validated_config_value(
+            saved_config["accesslog"],
+            "staticsample",
+            partial(
+                utils.validate_saved_int_range,
+                low=1,
+                high=MAX_STATIC_LOG_SAMPLE,
+                name="Static log sample",
+            ),
+            fallback=DEFAULT_STATIC_LOG_SAMPLE,
+        )
+
+
+class SensitiveParamsStep(MultiStep):
+    """Step to get the parameters whose values are filtered out of the access logs"""
+
+    def __init__(self) -> None:
+        super().__init__("Sensitive Log Parameters", ["accesslog", "sensitiveparams"])
+
+    def validate(self, response: str) -> str:
+        DEV_LOGGER.info("Response: %s", response)
+        try:
+            return logfilter.validate_param(str(response).strip())
+        except ValueError as error:
+            raise StepError(
+                "Parameter names may only have letters, digits, _ and -"
+            ) from error
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: accesslog.sensitiveparams")
+        config["accesslog"]["sensitiveparams"] = utils.validated_config_value(
+            saved_config["accesslog"],
+            "sensitiveparams",
+            self.validate,
+            value_list=True,
+            fallback=list(logfilter.DEFAULT_SENSITIVE_PARAMS),
+        )
@@ -173,9 +173,17 @@ class MultiStep(Step):
         DEV_LOGGER.warning("%s has no validate method", self._step_msg)
         return response
 
+    def current_values(self, config: defaultdict) -> Any:
+        """Values in the config, offered as the defaults"""
+        return utils.get_config_value_by_path(config, self._keyname)
+
+    def save_values(self, config: defaultdict, values: list[Any]) -> None:
+        """Stores the answers in the config"""
+        utils.set_config_value_by_path(config, self._keyname, values)
+
     def _use_default(self, config: defaultdict) -> None:
         """Shows user a list of default values and ask whether they want to use them"""
-        default_values = utils.get_config_value_by_path(config, self._keyname)
+        default_values = self.current_values(config)
         if default_values:
             msg = f"Default {self._step_msg} found:"
             for value in default_values:
@@ -199,7 +207,7 @@ class MultiStep(Step):
                 raise StepError(f"Must enter at least one {singular_msg}")
 
             DEV_LOGGER.info("Saving answers to %s", self._keyname)
-            utils.set_config_value_by_path(config, self._keyname, self._answers)
+            self.save_values(config, self._answers)
             return
         answer = str(self.validate(response))
         self._answers.append(answer)
@@ -0,0 +1,93 @@
+"""
+Pexip installation wizard step to size the web reverse proxy
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.platform import capacity
+from rp_turn.steps.base_step import Step
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Participants expected to use the web reverse proxy at once, which sizes the
+# nginx workers and file descriptor limits. By default, as many as the memory
+# holds (or this many if the memory is unknown).
+DEFAULT_TARGET_PARTICIPANTS = 1000
+MAX_TARGET_PARTICIPANTS = 1000000
+# Each nginx worker gets its own listening sockets by default from this many CPUs
+REUSEPORT_MIN_CPUS = 8
+
+
+class CapacityStep(Step):
+    """Step to get the participants the web reverse proxy is sized for"""
+
+    def __init__(self) -> None:
+        super().__init__("Web Reverse Proxy Capacity")
+        self.questions = [self._get_target_participants, self._enable_reuseport]
+
+    @staticmethod
+    def default_participants() -> int:
+        """The participants the memory of this VM holds"""
+        participants = capacity.max_participants(capacity.detect_memory_mb())
+        if participants is None:
+            return DEFAULT_TARGET_PARTICIPANTS
+        return min(participants, MAX_TARGET_PARTICIPANTS)
+
+    def _get_target_participants(self, config: defaultdict) -> None:
+        """Question asking how many participants use the web reverse proxy at once"""
+        memory_mb = capacity.detect_memory_mb()
+        self.display(
+            f"This VM has {capacity.detect_cpus()} CPUs and "
+            + ("unknown" if memory_mb is None else f"{memory_mb} MB of")
+            + " memory, enough for about "
+            + f"{self.default_participants()} participants at once.\n"
+            + "nginx is sized for the participants, up to what the memory holds."
+        )
+        default_participants = utils.config_get(config["capacity"]["participants"])
+        response = self.ask(
+            "How many participants are expected to use the web reverse proxy "
+            + "at once?",
+            default=default_participants,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["capacity"]["participants"] = utils.validate_int_range(
+            response, 1, MAX_TARGET_PARTICIPANTS, "Participants"
+        )
+
+    def _enable_reuseport(self, config: defaultdict) -> None:
+        """Question to find out whether each nginx worker has its own listening sockets"""
+        default_enabled = utils.config_get(config["capacity"]["reuseport"])
+        response = self.ask_yes_no(
+            f"""\
+With a listening socket per nginx worker (reuseport), the kernel spreads new
+connections evenly over the workers instead of waking all of them for each.
+This helps most when large meetings start on {REUSEPORT_MIN_CPUS} or more CPUs.
+
+Give each nginx worker its own listening sockets?""",
+            default=default_enabled,
+        )
+        config["capacity"]["reuseport"] = response
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: capacity.participants")
+        config["capacity"]["participants"] = utils.validated_config_value(
+            saved_config["capacity"],
+            "participants",
+            partial(
+                utils.validate_saved_int_range,
+                low=1,
+                high=MAX_TARGET_PARTICIPANTS,
+                name="Participants",
+            ),
+            fallback=self.default_participants(),
+        )
+        DEV_LOGGER.info("Getting from saved_config: capacity.reuseport")
+        config["capacity"]["reuseport"] = utils.validated_config_value(
+            saved_config["capacity"],
+            "reuseport",
+            partial(utils.validate_type, bool),
+            fallback=capacity.detect_cpus() >= REUSEPORT_MIN_CPUS,
+        )
@@ -7,7 +7,8 @@ from collections import defaultdict
 from functools import partial
 
 from rp_turn import utils
-from rp_turn.steps.base_step import Step
+from rp_turn.platform import certificate
+from rp_turn.steps.base_step import Step, StepError
 
 DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
 
@@ -28,6 +29,32 @@ class CertificatesStep(Step):
         )
         DEV_LOGGER.info("Response: %s", response)
         config["generate-certs"]["ssl"] = response
+        if response:
+            self.questions.insert(0, self._get_key_algorithm)
+
+    @staticmethod
+    def _validate_key_algorithm(value: str) -> str:
+        """Validates the key algorithm field"""
+        value = str(value).strip().lower()
+        if value not in certificate.KEY_ALGORITHMS:
+            raise StepError(
+                "Key algorithm must be one of: " + ", ".join(certificate.KEY_ALGORITHMS)
+            )
+        return value
+
+    def _get_key_algorithm(self, config: defaultdict) -> None:
+        """Question asking which key algorithm to use for the ssl certificate"""
+        default_algorithm = utils.config_get(config["generate-certs"]["keyalgorithm"])
+        response = self.ask(
+            "Which key algorithm should the SSL certificate use?\n"
+            + "ecdsa-p256 is faster for TLS handshakes, rsa-2048 suits older clients "
+            + f"({'/'.join(certificate.KEY_ALGORITHMS)})",
+            default=default_algorithm,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["generate-certs"]["keyalgorithm"] = self._validate_key_algorithm(
+            response
+        )
 
     def _generate_ssh(self, config: defaultdict) -> None:
         """Question asking whether to regenerate ssh certificates"""
@@ -50,3 +77,10 @@ class CertificatesStep(Step):
         config_certs["ssh"] = utils.validated_config_value(
             saved_certs, "ssh", partial(utils.validate_type, bool), fallback=True
         )
+        DEV_LOGGER.info("Getting from saved_config: generate-certs.keyalgorithm")
+        config_certs["keyalgorithm"] = utils.validated_config_value(
+            saved_certs,
+            "keyalgorithm",
+            self._validate_key_algorithm,
+            fallback=certificate.DEFAULT_KEY_ALGORITHM,
+        )
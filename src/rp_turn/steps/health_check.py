@@ -0,0 +1,117 @@
+"""
+Pexip installation wizard steps to setup health checks of the conference nodes
+and of the reverse proxy itself
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.steps.base_step import Step
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Seconds between health checks of the conference nodes, see rp_turn.healthcheck
+DEFAULT_HEALTH_CHECK_INTERVAL = 5
+MAX_HEALTH_CHECK_INTERVAL = 300
+
+
+class HealthCheckStep(Step):
+    """Step to decide whether to actively health check the conference nodes"""
+
+    def __init__(self) -> None:
+        super().__init__("Conference Node Health Checks")
+        self.questions = [self._enable_health_check]
+
+    def _enable_health_check(self, config: defaultdict) -> None:
+        """Question to find out whether to health check the conference nodes"""
+        default_enabled = utils.config_get(config["healthcheck"]["enabled"])
+        response = self.ask_yes_no(
+            """\
+Health checks regularly probe each conference node over HTTPS. Nodes which stop
+responding are sent no new requests until they respond again.
+
+Enable conference node health checks?""",
+            default=default_enabled,
+        )
+        config["healthcheck"]["enabled"] = response
+        if response:
+            self.questions.append(self._get_interval)
+
+    def _get_interval(self, config: defaultdict) -> None:
+        """Question asking how often to health check the conference nodes"""
+        default_interval = utils.config_get(config["healthcheck"]["interval"])
+        response = self.ask("Seconds between health checks?", default=default_interval)
+        DEV_LOGGER.info("Response: %s", response)
+        config["healthcheck"]["interval"] = utils.validate_int_range(
+            response, 1, MAX_HEALTH_CHECK_INTERVAL, "Health check interval in seconds"
+        )
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: healthcheck.enabled")
+        config["healthcheck"]["enabled"] = utils.validated_config_value(
+            saved_config["healthcheck"],
+            "enabled",
+            partial(utils.validate_type, bool),
+            fallback=False,
+        )
+        DEV_LOGGER.info("Getting from saved_config: healthcheck.interval")
+        config["healthcheck"]["interval"] = utils.validated_config_value(
+            saved_config["healthcheck"],
+            "interval",
+            partial(
+                utils.validate_saved_int_range,
+                low=1,
+                high=MAX_HEALTH_CHECK_INTERVAL,
+                name="Health check interval in seconds",
+            ),
+            fallback=DEFAULT_HEALTH_CHECK_INTERVAL,
+        )
+
+
+class HealthEndpointStep(Step):
+    """Step to decide whether nginx answers load balancer probes on /healthz"""
+
+    def __init__(self) -> None:
+        super().__init__("Load Balancer Health Endpoint")
+        self.questions = [self._enable_health_endpoint]
+
+    def _enable_health_endpoint(self, config: defaultdict) -> None:
+        """Question to find out whether to answer health probes on /healthz"""
+        default_enabled = utils.config_get(config["healthz"]["enabled"])
+        response = self.ask_yes_no(
+            """\
+A load balancer in front of the reverse proxy can probe /healthz over HTTP or
+HTTPS. nginx answers it directly, without logging it or passing it on to a
+conference node.
+
+Enable the /healthz endpoint?""",
+            default=default_enabled,
+        )
+        config["healthz"]["enabled"] = response
+        if response and config["healthcheck"]["enabled"]:
+            self.questions.append(self._enable_upstream_health)
+
+    def _enable_upstream_health(self, config: defaultdict) -> None:
+        """Question to find out whether /healthz reflects the conference nodes"""
+        default_upstream = utils.config_get(config["healthz"]["upstream"])
+        response = self.ask_yes_no(
+            """\
+/healthz can answer 503 while the health checks find no conference node which
+can take requests, so the load balancer sends clients to another reverse proxy.
+
+Reflect the conference nodes in /healthz?""",
+            default=default_upstream,
+        )
+        config["healthz"]["upstream"] = response
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        for name, fallback in [("enabled", True), ("upstream", False)]:
+            DEV_LOGGER.info("Getting from saved_config: healthz.%s", name)
+            config["healthz"][name] = utils.validated_config_value(
+                saved_config["healthz"],
+                name,
+                partial(utils.validate_type, bool),
+                fallback=fallback,
+            )
@@ -0,0 +1,96 @@
+"""
+Pexip installation wizard step to setup rate limits
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.steps.base_step import Step
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Limits on each client address, rejecting floods in nginx before they reach
+# the conference nodes (or fail2ban):
+# saved name -> (description, default, minimum, maximum)
+RATE_LIMITS = {
+    "tokenrate": ("Token requests per second", 5, 1, 1000),
+    "tokenburst": ("Token requests allowed in a burst above the rate", 20, 0, 10000),
+    "connections": ("Concurrent connections", 100, 1, 100000),
+}
+
+
+class RateLimitStep(Step):
+    """Step to decide whether to limit the token requests and connections of a client"""
+
+    def __init__(self) -> None:
+        super().__init__("Rate Limits")
+        self.questions = [self._enable_rate_limit]
+
+    def _enable_rate_limit(self, config: defaultdict) -> None:
+        """Question to find out whether to rate limit clients"""
+        default_enabled = utils.config_get(config["ratelimit"]["enabled"])
+        response = self.ask_yes_no(
+            """\
+Rate limits reject floods of token requests (PIN entry) and connections from a
+single client address in nginx, before they reach the conference nodes or
+fail2ban. Rejected requests get a 429 response and are only logged to
+/var/log/nginx/limit.access.log. Clients sharing an address (e.g. behind a
+NAT) share its limits.
+
+Enable rate limits?""",
+            default=default_enabled,
+        )
+        config["ratelimit"]["enabled"] = response
+        if response:
+            self.questions.append(self._get_token_rate)
+            self.questions.append(self._get_token_burst)
+            self.questions.append(self._get_connection_limit)
+
+    def _ask_rate_limit(self, name: str, config: defaultdict) -> None:
+        """Asks for a limit on each client address"""
+        description, _, minimum, maximum = RATE_LIMITS[name]
+        default_limit = utils.config_get(config["ratelimit"][name])
+        response = self.ask(
+            f"{description} from each client address?",
+            default=default_limit,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["ratelimit"][name] = utils.validate_int_range(
+            response, minimum, maximum, description
+        )
+
+    def _get_token_rate(self, config: defaultdict) -> None:
+        """Question asking how many token requests a client may make a second"""
+        self._ask_rate_limit("tokenrate", config)
+
+    def _get_token_burst(self, config: defaultdict) -> None:
+        """Question asking how many token requests may burst above the rate"""
+        self._ask_rate_limit("tokenburst", config)
+
+    def _get_connection_limit(self, config: defaultdict) -> None:
+        """Question asking how many connections a client may hold open"""
+        self._ask_rate_limit("connections", config)
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: ratelimit.enabled")
+        config["ratelimit"]["enabled"] = utils.validated_config_value(
+            saved_config["ratelimit"],
+            "enabled",
+            partial(utils.validate_type, bool),
+            fallback=False,
+        )
+        for name, (description, default, minimum, maximum) in RATE_LIMITS.items():
+            DEV_LOGGER.info("Getting from saved_config: ratelimit.%s", name)
+            config["ratelimit"][name] = utils.validated_config_value(
+                saved_config["ratelimit"],
+                name,
+                partial(
+                    utils.validate_saved_int_range,
+                    low=minimum,
+                    high=maximum,
+                    name=description,
+                ),
+                fallback=default,
+            )
@@ -0,0 +1,122 @@
+"""
+Pexip installation wizard steps to setup client addresses from load balancers
+"""
+
+import logging
+import re
+from collections import defaultdict
+
+from rp_turn import utils
+from rp_turn.steps.base_step import MultiStep, Step, StepError
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Where the client address comes from -> description shown to the user. nginx
+# takes it from trusted load balancers, and uses it for balancing, logging,
+# rate limits and fail2ban's bans.
+REAL_IP_SOURCES = {
+    "none": "clients connect directly",
+    "proxy_protocol": "load balancers send the PROXY protocol to port 443",
+    "header": "load balancers pass it in an HTTP header",
+}
+DEFAULT_REAL_IP_SOURCE = "none"
+DEFAULT_REAL_IP_HEADER = "X-Forwarded-For"
+HEADER_NAME_RE = re.compile(r"^[A-Za-z0-9-]+$")
+
+
+class RealIPStep(Step):
+    """Step to decide where the address of a client comes from"""
+
+    def __init__(self) -> None:
+        super().__init__("Client Addresses")
+        self.questions = [self._get_real_ip_source]
+
+    @staticmethod
+    def _validate_real_ip_source(value: str) -> str:
+        """Validates the client address source field"""
+        value = str(value).strip().lower()
+        if value not in REAL_IP_SOURCES:
+            raise StepError(
+                "Client address source must be one of: " + ", ".join(REAL_IP_SOURCES)
+            )
+        return value
+
+    @staticmethod
+    def _validate_real_ip_header(value: str) -> str:
+        """Validates the client address header field"""
+        value = str(value).strip()
+        if not HEADER_NAME_RE.match(value):
+            raise StepError("Header names may only have letters, digits and -")
+        return value
+
+    def _get_real_ip_source(self, config: defaultdict) -> None:
+        """Question asking where the address of a client comes from"""
+        default_source = utils.config_get(config["realip"]["source"])
+        sources = "".join(
+            f"  {source}: {description}\n"
+            for source, description in REAL_IP_SOURCES.items()
+        )
+        response = self.ask(
+            """\
+Behind a load balancer, connections come from the load balancer rather than
+the client. nginx can take the client's address from trusted load balancers
+instead, so balancing, logs, rate limits and fail2ban use the client's.
+Where does the client address come from?
+"""
+            + sources
+            + f"({'/'.join(REAL_IP_SOURCES)})",
+            default=default_source,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["realip"]["source"] = self._validate_real_ip_source(response)
+        if config["realip"]["source"] == "header":
+            self.questions.append(self._get_real_ip_header)
+
+    def _get_real_ip_header(self, config: defaultdict) -> None:
+        """Question asking which header has the address of a client"""
+        default_header = utils.config_get(config["realip"]["header"])
+        response = self.ask("Header with the client address?", default=default_header)
+        DEV_LOGGER.info("Response: %s", response)
+        config["realip"]["header"] = self._validate_real_ip_header(response)
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: realip.source")
+        config["realip"]["source"] = utils.validated_config_value(
+            saved_config["realip"],
+            "source",
+            self._validate_real_ip_source,
+            fallback=DEFAULT_REAL_IP_SOURCE,
+        )
+        DEV_LOGGER.info("Getting from saved_config: realip.header")
+        config["realip"]["header"] = utils.validated_config_value(
+            saved_config["realip"],
+            "header",
+            self._validate_real_ip_header,
+            fallback=DEFAULT_REAL_IP_HEADER,
+        )
+
+
+class TrustedProxiesStep(MultiStep):
+    """Step to get the networks of the load balancers passing on client addresses"""
+
+    def __init__(self) -> None:
+        super().__init__("Trusted Load Balancer Networks", ["realip", "trusted"])
+
+    def _use_default(self, config: defaultdict) -> None:
+        # Only asked for when the client address comes from load balancers
+        if config["realip"]["source"] != "none":
+            super()._use_default(config)
+
+    def validate(self, response: str) -> str:
+        DEV_LOGGER.info("Response: %s", response)
+        return str(utils.validate_cidr_network(response))
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: realip.trusted")
+        config["realip"]["trusted"] = utils.validated_config_value(
+            saved_config["realip"],
+            "trusted",
+            self.validate,
+            value_list=True,
+            fallback=[],
+        )
@@ -0,0 +1,97 @@
+"""
+Pexip installation wizard step to setup the static asset cache
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.steps.base_step import Step
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Megabytes of conference node static assets (web app bundles) cached by nginx
+DEFAULT_STATIC_CACHE_SIZE = 256
+MIN_STATIC_CACHE_SIZE = 16
+MAX_STATIC_CACHE_SIZE = 16384
+
+
+class StaticCacheStep(Step):
+    """Step to decide whether to cache the static assets of the conference nodes"""
+
+    def __init__(self) -> None:
+        super().__init__("Static Asset Cache")
+        self.questions = [self._enable_static_cache]
+
+    def _enable_static_cache(self, config: defaultdict) -> None:
+        """Question to find out whether to cache static assets"""
+        default_enabled = utils.config_get(config["staticcache"]["enabled"])
+        response = self.ask_yes_no(
+            """\
+The static asset cache keeps the web app bundles (/static) fetched from the
+conference nodes, so the nodes are not asked for the same files by every
+participant joining a large meeting.
+
+Enable the static asset cache?""",
+            default=default_enabled,
+        )
+        config["staticcache"]["enabled"] = response
+        if response:
+            self.questions.append(self._get_static_cache_size)
+            self.questions.append(self._enable_static_cache_tmpfs)
+
+    def _get_static_cache_size(self, config: defaultdict) -> None:
+        """Question asking how large the static asset cache is"""
+        default_size = utils.config_get(config["staticcache"]["size"])
+        response = self.ask(
+            "Megabytes of static assets to cache?", default=default_size
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["staticcache"]["size"] = utils.validate_int_range(
+            response,
+            MIN_STATIC_CACHE_SIZE,
+            MAX_STATIC_CACHE_SIZE,
+            "Static cache size in megabytes",
+        )
+
+    def _enable_static_cache_tmpfs(self, config: defaultdict) -> None:
+        """Question to find out whether to keep the static asset cache in memory"""
+        default_tmpfs = utils.config_get(config["staticcache"]["tmpfs"])
+        response = self.ask_yes_no(
+            """\
+Keeping the cache in memory (tmpfs) avoids disk reads, but uses up to the
+cache size of RAM and is emptied by a reboot.
+
+Keep the static asset cache in memory?""",
+            default=default_tmpfs,
+        )
+        config["staticcache"]["tmpfs"] = response
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: staticcache.enabled")
+        config["staticcache"]["enabled"] = utils.validated_config_value(
+            saved_config["staticcache"],
+            "enabled",
+            partial(utils.validate_type, bool),
+            fallback=False,
+        )
+        DEV_LOGGER.info("Getting from saved_config: staticcache.size")
+        config["staticcache"]["size"] = utils.validated_config_value(
+            saved_config["staticcache"],
+            "size",
+            partial(
+                utils.validate_saved_int_range,
+                low=MIN_STATIC_CACHE_SIZE,
+                high=MAX_STATIC_CACHE_SIZE,
+                name="Static cache size in megabytes",
+            ),
+            fallback=DEFAULT_STATIC_CACHE_SIZE,
+        )
+        DEV_LOGGER.info("Getting from saved_config: staticcache.tmpfs")
+        config["staticcache"]["tmpfs"] = utils.validated_config_value(
+            saved_config["staticcache"],
+            "tmpfs",
+            partial(utils.validate_type, bool),
+            fallback=False,
+        )
@@ -0,0 +1,121 @@
+"""
+Pexip installation wizard steps to setup TLS on the web reverse proxy
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from rp_turn import utils
+from rp_turn.steps.base_step import Step, StepError
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Key exchange and cipher suite profiles of the pexapp server -> description
+TLS_PROFILES = {
+    "compatibility": "ECDHE and DHE key exchange, for the widest range of clients",
+    "performance": "ECDHE only on X25519/P-256, the cheapest handshakes",
+}
+DEFAULT_TLS_PROFILE = "compatibility"
+
+# Clients expected to use the web reverse proxy at once, which sizes the TLS
+# session cache of the TLS performance profile
+DEFAULT_EXPECTED_CLIENTS = 1000
+MAX_EXPECTED_CLIENTS = 1000000
+
+
+class TLSPerformanceStep(Step):
+    """Step to decide whether to use the TLS performance profile"""
+
+    def __init__(self) -> None:
+        super().__init__("TLS Performance")
+        self.questions = [self._enable_tls_performance]
+
+    def _enable_tls_performance(self, config: defaultdict) -> None:
+        """Question to find out whether to use the TLS performance profile"""
+        default_enabled = utils.config_get(config["tlsperformance"]["enabled"])
+        response = self.ask_yes_no(
+            """\
+The TLS performance profile enables HTTP/2, TLS session tickets (with keys
+rotated hourly) and smaller TLS records, so web app pages load faster.
+
+Enable the TLS performance profile?""",
+            default=default_enabled,
+        )
+        config["tlsperformance"]["enabled"] = response
+        if response:
+            self.questions.append(self._get_expected_clients)
+
+    def _get_expected_clients(self, config: defaultdict) -> None:
+        """Question asking how many clients use the web reverse proxy at once"""
+        default_clients = utils.config_get(config["tlsperformance"]["clients"])
+        response = self.ask(
+            "How many clients are expected to use the web reverse proxy at once?",
+            default=default_clients,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["tlsperformance"]["clients"] = utils.validate_int_range(
+            response, 1, MAX_EXPECTED_CLIENTS, "Expected clients"
+        )
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: tlsperformance.enabled")
+        config["tlsperformance"]["enabled"] = utils.validated_config_value(
+            saved_config["tlsperformance"],
+            "enabled",
+            partial(utils.validate_type, bool),
+            fallback=False,
+        )
+        DEV_LOGGER.info("Getting from saved_config: tlsperformance.clients")
+        config["tlsperformance"]["clients"] = utils.validated_config_value(
+            saved_config["tlsperformance"],
+            "clients",
+            partial(
+                utils.validate_saved_int_range,
+                low=1,
+                high=MAX_EXPECTED_CLIENTS,
+                name="Expected clients",
+            ),
+            fallback=DEFAULT_EXPECTED_CLIENTS,
+        )
+
+
+class TLSProfileStep(Step):
+    """Step to choose the key exchange and cipher suites of TLS"""
+
+    def __init__(self) -> None:
+        super().__init__("TLS Cipher Suites")
+        self.questions = [self._get_tls_profile]
+
+    @staticmethod
+    def _validate_tls_profile(value: str) -> str:
+        """Validates the TLS profile field"""
+        value = str(value).strip().lower()
+        if value not in TLS_PROFILES:
+            raise StepError("TLS profile must be one of: " + ", ".join(TLS_PROFILES))
+        return value
+
+    def _get_tls_profile(self, config: defaultdict) -> None:
+        """Question asking which key exchange and cipher suites TLS uses"""
+        default_profile = utils.config_get(config["tlsprofile"])
+        profiles = "".join(
+            f"  {profile}: {description}\n"
+            for profile, description in TLS_PROFILES.items()
+        )
+        response = self.ask(
+            "Which key exchange and cipher suite profile should TLS use?\n"
+            + profiles
+            + f"({'/'.join(TLS_PROFILES)})",
+            default=default_profile,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["tlsprofile"] = self._validate_tls_profile(response)
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: tlsprofile")
+        config["tlsprofile"] = utils.validated_config_value(
+            saved_config,
+            "tlsprofile",
+            self._validate_tls_profile,
+            fallback=DEFAULT_TLS_PROFILE,
+        )
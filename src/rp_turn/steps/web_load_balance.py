@@ -7,13 +7,79 @@ from __future__ import annotations
 import logging
 from collections import defaultdict
 from functools import partial
-from ipaddress import IPv4Address
+from typing import Any
 
 from rp_turn import utils
-from rp_turn.steps.base_step import MultiStep, Step
+from rp_turn.steps.access_log import AccessLogStep, SensitiveParamsStep
+from rp_turn.steps.base_step import MultiStep, Step, StepError
+from rp_turn.steps.capacity import CapacityStep
+from rp_turn.steps.health_check import HealthCheckStep, HealthEndpointStep
+from rp_turn.steps.rate_limit import RateLimitStep
+from rp_turn.steps.real_ip import RealIPStep, TrustedProxiesStep
+from rp_turn.steps.static_cache import StaticCacheStep
+from rp_turn.steps.tls import TLSPerformanceStep, TLSProfileStep
 
 DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
 
+# Balancing methods of the pexip upstream -> description shown to the user
+LOAD_BALANCE_METHODS = {
+    "hash": "consistent hash of the client address (clients stay on one node)",
+    "least_conn": "node with the fewest active connections",
+    "random": "least connected of two random nodes",
+    "ip_hash": "hash of the first three octets of the client address",
+}
+DEFAULT_LOAD_BALANCE_METHOD = "hash"
+# nginx does not allow backup servers with these balancing methods
+HASH_LOAD_BALANCE_METHODS = ("hash", "ip_hash", "random")
+
+# Upstream server parameters of each conference node:
+# saved name -> (nginx name, default, minimum)
+NODE_PARAMETERS = {
+    "weight": ("weight", 1, 1),
+    "maxconns": ("max_conns", 0, 0),
+    "maxfails": ("max_fails", 1, 0),
+    "failtimeout": ("fail_timeout", 10, 1),
+}
+# Upstream server flags of each conference node (off by default).
+# Drained nodes are down: they get no new requests, see rp_turn.node
+NODE_FLAGS = ("backup", "down")
+
+
+def default_node_options() -> dict[str, Any]:
+    """Upstream server parameters of a conference node without any options"""
+    options: dict[str, Any] = {
+        name: default for name, (_, default, _) in NODE_PARAMETERS.items()
+    }
+    for flag in NODE_FLAGS:
+        options[flag] = False
+    return options
+
+
+def validate_node_options(options: Any) -> dict[str, Any]:
+    """Validates the saved upstream server parameters of a conference node"""
+    if not isinstance(options, dict) or set(options) != set(default_node_options()):
+        raise StepError(
+            "Conference node options must be: " + ", ".join(default_node_options())
+        )
+    for name, (nginx_name, _, minimum) in NODE_PARAMETERS.items():
+        value = options[name]
+        if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+            raise StepError(
+                f"{nginx_name} must be a whole number of at least {minimum}"
+            )
+    for flag in NODE_FLAGS:
+        if not isinstance(options[flag], bool):
+            raise StepError(f"{flag} must be true or false")
+    return options
+
+
+def has_backup_nodes(config: defaultdict) -> bool:
+    """Whether any of the conference nodes is a backup node"""
+    return any(
+        isinstance(options, dict) and options.get("backup")
+        for options in config["conferencenodeoptions"].values()
+    )
+
 
 class WebLoadBalanceStep(Step):
     """
@@ -23,7 +89,22 @@ class WebLoadBalanceStep(Step):
     def __init__(self) -> None:
         super().__init__("Web Reverse Proxy")
         self.questions = [self._enable_web_load_balance]
-        self._extra_steps = [SignalingConferenceNodeStep(), ContentSecurityPolicyStep()]
+        self._extra_steps = [
+            SignalingConferenceNodeStep(),
+            LoadBalanceMethodStep(),
+            RealIPStep(),
+            TrustedProxiesStep(),
+            HealthCheckStep(),
+            HealthEndpointStep(),
+            CapacityStep(),
+            RateLimitStep(),
+            TLSPerformanceStep(),
+            TLSProfileStep(),
+            StaticCacheStep(),
+            AccessLogStep(),
+            SensitiveParamsStep(),
+            ContentSecurityPolicyStep(),
+        ]
 
     def _enable_web_load_balance(self, config: defaultdict) -> None:
         """Question to find out whether to enable web reverseproxy"""
@@ -56,21 +137,150 @@ class WebLoadBalanceStep(Step):
 
 
 class SignalingConferenceNodeStep(MultiStep):
-    """Step to set the conference node ip addresses"""
+    """Step to set the conference node ip addresses and upstream parameters"""
 
     def __init__(self) -> None:
         super().__init__(
             "IP Address of Signaling Conferencing Nodes", "conferencenodes"
         )
+        self.questions.insert(0, self._describe_options)
+
+    def _describe_options(self, _config: defaultdict) -> None:
+        """Shows the upstream parameters which may follow each address"""
+        self.display(
+            "Each address may be followed by options, e.g. 10.0.0.1 weight=2 backup\n"
+            + "  weight=N: share of requests relative to the other nodes (default 1)\n"
+            + "  max_conns=N: most connections at once, 0 for no limit (default 0)\n"
+            + "  max_fails=N: failures which mark the node as down, 0 to never "
+            + "mark it down (default 1)\n"
+            + "  fail_timeout=N: seconds a down node is skipped for (default 10)\n"
+            + "  backup: only used when all other nodes are down (needs least_conn)\n"
+            + "  down: drained, so not sent any new requests"
+        )
+
+    @staticmethod
+    def parse(response: str) -> tuple[str, dict[str, Any]]:
+        """Parses an address followed by options into the address and options"""
+        words = str(response).split()
+        if not words:
+            raise StepError("Must enter an IP address")
+        address = str(utils.validate_ip(words[0]))
+        options = default_node_options()
+        nginx_names = {
+            nginx_name: name for name, (nginx_name, _, _) in NODE_PARAMETERS.items()
+        }
+        for word in words[1:]:
+            nginx_name, equals, value = word.lower().partition("=")
+            if nginx_name in NODE_FLAGS and not equals:
+                options[nginx_name] = True
+            elif nginx_name in nginx_names and value.isdigit():
+                options[nginx_names[nginx_name]] = int(value)
+            else:
+                raise StepError(f"Invalid conference node option: {word}")
+        return address, validate_node_options(options)
 
-    def validate(self, response: str) -> IPv4Address:
+    @staticmethod
+    def format_node(address: str, options: Any) -> str:
+        """Converts an address and its options into the form they are entered in"""
+        words = [str(address)]
+        if isinstance(options, dict):
+            for name, (nginx_name, default, _) in NODE_PARAMETERS.items():
+                if options.get(name, default) != default:
+                    words.append(f"{nginx_name}={options[name]}")
+            words += [flag for flag in NODE_FLAGS if options.get(flag)]
+        return " ".join(words)
+
+    def validate(self, response: str) -> str:
         DEV_LOGGER.info("Response: %s", response)
-        return utils.validate_ip(response)
+        return self.format_node(*self.parse(response))
+
+    def current_values(self, config: defaultdict) -> list[str] | None:
+        addresses = utils.config_get(config["conferencenodes"])
+        if not addresses:
+            return None
+        return [
+            self.format_node(address, config["conferencenodeoptions"].get(address))
+            for address in addresses
+        ]
+
+    def save_values(self, config: defaultdict, values: list[str]) -> None:
+        nodes = [self.parse(value) for value in values]
+        config["conferencenodes"] = [address for address, _ in nodes]
+        config["conferencenodeoptions"] = dict(nodes)
 
     def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
         DEV_LOGGER.info("Getting from saved_config: conferencenodes")
         config["conferencenodes"] = utils.validated_config_value(
-            saved_config, "conferencenodes", self.validate, value_list=True
+            saved_config, "conferencenodes", utils.validate_ip, value_list=True
+        )
+        addresses = config["conferencenodes"] or []
+        DEV_LOGGER.info("Getting from saved_config: conferencenodeoptions")
+        config["conferencenodeoptions"] = utils.validated_config_value(
+            saved_config,
+            "conferencenodeoptions",
+            partial(self._validate_all_node_options, addresses),
+            fallback={address: default_node_options() for address in addresses},
+        )
+
+    @staticmethod
+    def _validate_all_node_options(addresses: list[str], value: Any) -> Any:
+        """Validates there are valid options for each of the conference nodes"""
+        if not isinstance(value, dict) or set(value) != set(addresses):
+            raise StepError("Each conference node must have options")
+        for options in value.values():
+            validate_node_options(options)
+        return value
+
+
+class LoadBalanceMethodStep(Step):
+    """Step to choose how requests are balanced across the conference nodes"""
+
+    def __init__(self) -> None:
+        super().__init__("Load Balancing Method")
+        self.questions = [self._get_load_balance_method]
+
+    @staticmethod
+    def _validate_load_balance_method(value: str, backup: bool = False) -> str:
+        """Validates the load balancing method field"""
+        value = str(value).strip().lower()
+        if value not in LOAD_BALANCE_METHODS:
+            raise StepError(
+                "Load balancing method must be one of: "
+                + ", ".join(LOAD_BALANCE_METHODS)
+            )
+        if backup and value in HASH_LOAD_BALANCE_METHODS:
+            raise StepError(f"Backup conference nodes cannot be used with {value}")
+        return value
+
+    def _get_load_balance_method(self, config: defaultdict) -> None:
+        """Question asking how to balance requests across the conference nodes"""
+        default_method = utils.config_get(config["loadbalancemethod"])
+        backup = has_backup_nodes(config)
+        if backup and default_method in HASH_LOAD_BALANCE_METHODS:
+            default_method = "least_conn"
+        methods = "".join(
+            f"  {method}: {description}\n"
+            for method, description in LOAD_BALANCE_METHODS.items()
+        )
+        response = self.ask(
+            "How should requests be balanced across the conference nodes?\n"
+            + methods
+            + f"({'/'.join(LOAD_BALANCE_METHODS)})",
+            default=default_method,
+        )
+        DEV_LOGGER.info("Response: %s", response)
+        config["loadbalancemethod"] = self._validate_load_balance_method(
+            response, backup=backup
+        )
+
+    def default_config(self, saved_config: defaultdict, config: defaultdict) -> None:
+        DEV_LOGGER.info("Getting from saved_config: loadbalancemethod")
+        backup = has_backup_nodes(config)
+        config["loadbalancemethod"] = utils.validated_config_value(
+            saved_config,
+            "loadbalancemethod",
+            partial(self._validate_load_balance_method, backup=backup),
+            fallback="least_conn" if backup else DEFAULT_LOAD_BALANCE_METHOD,
         )
 
 
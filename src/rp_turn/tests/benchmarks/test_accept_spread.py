@@ -0,0 +1,151 @@
+"""
+Test the accept spread benchmark, against a local Python HTTP server and, where
+it is installed, nginx
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.benchmarks import accept_spread, tls_handshake
+
+RESPONSE = b"HTTP/1.1 204 No Content\r\nX-Worker: 1234\r\nConnection: close\r\n\r\n"
+
+
+class TestMeasureAccepts(TestCase):
+    """Tests timing new connections against a local HTTP server"""
+
+    def setUp(self):
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self._listener.settimeout(0.05)
+        self.addCleanup(self._listener.close)
+        self.port = self._listener.getsockname()[1]
+        self._stopped = threading.Event()
+        thread = threading.Thread(target=self._serve, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self._stopped.set)
+
+    def _serve(self):
+        """Answers as a single worker until the test ends"""
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                continue
+            with sock:
+                try:
+                    sock.recv(4096)
+                    sock.sendall(RESPONSE)
+                except OSError:
+                    pass
+
+    def test_measure(self):
+        """Every connection is timed, and counted against the worker answering it"""
+        result = accept_spread.measure_accepts(
+            "127.0.0.1",
+            self.port,
+            0.2,
+            2,
+            cpu_seconds=lambda: {1234: 1.0, 5678: 2.0},
+        )
+        self.assertGreater(result.connections, 0)
+        self.assertGreater(result.per_second, 0)
+        self.assertGreaterEqual(result.p99_ms, result.median_ms)
+        # The idle worker is counted too
+        self.assertEqual(result.connection_shares, [1.0, 0.0])
+        self.assertEqual(result.imbalance, 2.0)
+        self.assertEqual(result.cpu_shares, [])
+
+    def test_refused(self):
+        """A failed connection fails the benchmark"""
+        self._stopped.set()
+        self._listener.close()
+        with self.assertRaisesRegex(tls_handshake.BenchmarkError, "Connection failed"):
+            accept_spread.measure_accepts("127.0.0.1", self.port, 0.1, 1)
+
+
+class TestAcceptResult(TestCase):
+    """Tests the spread of the connections and CPU time over the workers"""
+
+    def test_even(self):
+        """Evenly spread connections have no imbalance"""
+        result = accept_spread.AcceptResult(
+            [0.001, 0.002, 0.003, 0.004],
+            2.0,
+            Counter({10: 2, 11: 2}),
+            {10: 0.5, 11: 1.5},
+        )
+        self.assertEqual(result.per_second, 2.0)
+        self.assertEqual(result.median_ms, 2.5)
+        self.assertEqual(result.connection_shares, [0.5, 0.5])
+        self.assertEqual(result.imbalance, 1.0)
+        self.assertEqual(result.cpu_shares, [0.75, 0.25])
+        self.assertEqual(
+            accept_spread.AcceptResult([], 0.0, Counter(), {}).imbalance, 0
+        )
+
+
+class TestWorkerCpu(TestCase):
+    """Tests reading the CPU time of the workers from /proc"""
+
+    def test_parse_stat(self):
+        """The parent and CPU time are read after the command"""
+        ticks = os.sysconf("SC_CLK_TCK")
+        stat = f"42 (nginx: (worker) ) S 7 42 42 0 -1 0 0 0 0 0 {ticks} {ticks * 2} 0 0"
+        self.assertEqual(accept_spread.parse_stat(stat), (7, 3.0))
+
+    def test_worker_cpu_seconds(self):
+        """Only the children of the master are reported"""
+        with tempfile.TemporaryDirectory() as proc:
+            for pid, parent in [(10, 1), (11, 10), (12, 10)]:
+                os.makedirs(os.path.join(proc, str(pid)))
+                with open(
+                    os.path.join(proc, str(pid), "stat"), "w", encoding="utf-8"
+                ) as file_obj:
+                    file_obj.write(f"{pid} (nginx) S {parent} 0 0 0 0 0 0 0 0 0 0 0")
+            os.makedirs(os.path.join(proc, "13"))
+            os.makedirs(os.path.join(proc, "self"))
+            self.assertEqual(
+                accept_spread.worker_cpu_seconds(10, proc), {11: 0.0, 12: 0.0}
+            )
+
+    def test_own_children(self):
+        """The children of this process are found in /proc"""
+        if not os.path.isdir("/proc/self"):
+            self.skipTest("No /proc")
+        with subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(5)"]
+        ) as child:
+            try:
+                self.assertIn(child.pid, accept_spread.worker_cpu_seconds(os.getpid()))
+            finally:
+                child.kill()
+
+
+class TestBenchmark(TestCase):
+    """Tests benchmarking the listeners of nginx"""
+
+    def test_no_nginx(self):
+        """A missing nginx is reported rather than raised"""
+        with self.assertRaisesRegex(tls_handshake.BenchmarkError, "Unable to run"):
+            accept_spread.benchmark(2, True, 0.1, 1, nginx="/nonexistent/nginx")
+        with patch("sys.stdout"), self.assertRaises(SystemExit):
+            accept_spread.main(["--nginx", "/nonexistent/nginx", "--duration", "0.1"])
+
+    def test_nginx(self):
+        """Both listeners accept connections on every worker"""
+        nginx = shutil.which("nginx")
+        if nginx is None:
+            self.skipTest("nginx is not installed")
+        for reuseport in (False, True):
+            result = accept_spread.benchmark(2, reuseport, 0.5, 8, nginx=nginx)
+            self.assertGreater(result.connections, 0)
+            self.assertEqual(len(result.connection_shares), 2)
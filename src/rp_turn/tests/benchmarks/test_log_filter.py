@@ -0,0 +1,62 @@
+"""
+Test the log filter benchmark
+"""
+
+import io
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.benchmarks import log_filter
+from rp_turn.platform import logfilter
+
+
+class TestLogFilterBenchmark(TestCase):
+    """Tests comparing the chained and single maps"""
+
+    def test_request_lines(self):
+        """The corpus is reproducible, and has each sensitive parameter once"""
+        lines = log_filter.request_lines(200, ["pin", "token"], seed=3)
+        self.assertEqual(lines, log_filter.request_lines(200, ["pin", "token"], seed=3))
+        self.assertTrue(any("pin=" in line for line in lines))
+        self.assertTrue(any("=" not in line for line in lines))
+        for line in lines:
+            self.assertLessEqual(line.count("&pin=") + line.count("?pin="), 1)
+
+    def test_legacy_maps(self):
+        """The chained maps filter the last value of each parameter"""
+        compiled = log_filter.compile_maps(log_filter.legacy_maps(["pin", "token"]))
+        self.assertEqual(
+            log_filter.apply_maps(compiled, "GET /a?pin=1&pin=2&token=3 HTTP/1.1"),
+            "GET /a?pin=1&pin=[FILTERED]&token=[FILTERED] HTTP/1.1",
+        )
+
+    def test_benchmark(self):
+        """Only lines with several values are filtered differently, none leak"""
+        params = logfilter.DEFAULT_SENSITIVE_PARAMS
+        lines = log_filter.request_lines(300, params)
+        result = log_filter.benchmark(params, lines, rounds=1)
+        self.assertEqual(result.leaked, 0)
+        self.assertEqual(
+            result.differ,
+            sum(
+                1
+                for line in lines
+                if sum(line.count(f"{name}=") for name in params) > 1
+            ),
+        )
+        self.assertGreater(log_filter.count_leaked(params, lines), 0)
+        self.assertGreater(result.legacy_us, 0)
+        self.assertGreater(result.single_us, 0)
+
+    def test_main(self):
+        """The results, or the rendered maps, are printed"""
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            log_filter.main(["--lines", "50", "--rounds", "1", "--param", "pin"])
+        self.assertIn(
+            "0 lines filtered differently, 0 left with a value", stdout.getvalue()
+        )
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            log_filter.main(["--show", "--param", "pin"])
+        self.assertIn("map $request $request_filtered {", stdout.getvalue())
+        with patch("sys.stderr"), self.assertRaises(SystemExit):
+            log_filter.main(["--param", "pin|code"])
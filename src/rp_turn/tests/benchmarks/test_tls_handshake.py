@@ -0,0 +1,114 @@
+"""
+Test the TLS handshake benchmark, against a local Python TLS server and, where
+it is installed, nginx
+"""
+
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.benchmarks import tls_handshake
+from rp_turn.platform import certificate
+
+
+class TestMeasureHandshakes(TestCase):
+    """Tests timing handshakes against a local TLS server"""
+
+    def setUp(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pem_path = os.path.join(directory, "server.pem")
+            with open(pem_path, "w", encoding="ascii") as file_obj:
+                file_obj.write(certificate.generate_self_signed_pem())
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(pem_path)
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self._listener.settimeout(0.05)
+        self.addCleanup(self._listener.close)
+        self.port = self._listener.getsockname()[1]
+        self._stopped = threading.Event()
+        thread = threading.Thread(target=self._serve, args=(context,), daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self._stopped.set)
+
+    def _serve(self, context):
+        """Completes handshakes until the test ends"""
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                continue
+            try:
+                with context.wrap_socket(sock, server_side=True):
+                    pass
+            except (OSError, ssl.SSLError):
+                sock.close()
+
+    def test_measure(self):
+        """Every handshake is timed, and the negotiated cipher is reported"""
+        result = tls_handshake.measure_handshakes("127.0.0.1", self.port, 0.2, 2)
+        self.assertGreater(result.handshakes, 0)
+        self.assertGreater(result.per_second, 0)
+        self.assertGreaterEqual(result.p99_ms, result.median_ms)
+        self.assertTrue(result.cipher.startswith("TLSv1.3 "))
+
+        result = tls_handshake.measure_handshakes(
+            "127.0.0.1", self.port, 0.1, 1, tls_version=ssl.TLSVersion.TLSv1_2
+        )
+        self.assertTrue(result.cipher.startswith("TLSv1.2 ECDHE-"))
+
+    def test_refused(self):
+        """A failed handshake fails the benchmark"""
+        self._stopped.set()
+        self._listener.close()
+        with self.assertRaisesRegex(tls_handshake.BenchmarkError, "Handshake failed"):
+            tls_handshake.measure_handshakes("127.0.0.1", self.port, 0.1, 1)
+
+
+class TestBenchmark(TestCase):
+    """Tests benchmarking the rendered TLS settings with nginx"""
+
+    def test_load_config(self):
+        """The TLS settings are taken from the saved config"""
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "config.json")
+            with open(config_path, "w", encoding="utf-8") as file_obj:
+                file_obj.write(
+                    '{"tlsprofile": "performance",'
+                    ' "generate-certs": {"keyalgorithm": "rsa-2048"}}'
+                )
+            config = tls_handshake.load_config(config_path)
+            self.assertEqual(config["tlsprofile"], "performance")
+            self.assertEqual(config["generate-certs"]["keyalgorithm"], "rsa-2048")
+            self.assertEqual(
+                tls_handshake.load_config(None)["tlsprofile"], "compatibility"
+            )
+            with self.assertRaisesRegex(tls_handshake.BenchmarkError, "Unable to read"):
+                tls_handshake.load_config(os.path.join(directory, "missing.json"))
+
+    def test_no_nginx(self):
+        """A missing nginx is reported rather than raised"""
+        with self.assertRaisesRegex(tls_handshake.BenchmarkError, "Unable to run"):
+            tls_handshake.benchmark(
+                tls_handshake.load_config(None),
+                "performance",
+                0.1,
+                1,
+                nginx="/nonexistent/nginx",
+            )
+        with patch("sys.stdout"), self.assertRaises(SystemExit):
+            tls_handshake.main(["--nginx", "/nonexistent/nginx", "--duration", "0.1"])
+
+    def test_nginx(self):
+        """nginx serves the rendered TLS settings of the performance profile"""
+        nginx = shutil.which("nginx")
+        if nginx is None:
+            self.skipTest("nginx is not installed")
+        config = tls_handshake.load_config(None)
+        result = tls_handshake.benchmark(config, "performance", 0.2, 2, nginx=nginx)
+        self.assertGreater(result.handshakes, 0)
@@ -0,0 +1,104 @@
+"""
+Test sizing nginx from the VM and the expected participants
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.platform import capacity
+
+
+class TestDetect(TestCase):
+    """Tests detecting the CPUs and memory of the VM"""
+
+    def test_detect_cpus(self):
+        """The CPUs this process may run on are counted"""
+        with patch("os.sched_getaffinity", create=True, return_value={0, 2, 3}):
+            self.assertEqual(capacity.detect_cpus(), 3)
+        with patch("os.sched_getaffinity", create=True, side_effect=OSError):
+            with patch("os.cpu_count", return_value=None):
+                self.assertEqual(capacity.detect_cpus(), 1)
+
+    def test_detect_memory_mb(self):
+        """The memory is read from /proc/meminfo below the root"""
+        with tempfile.TemporaryDirectory() as root:
+            self.assertIsNone(capacity.detect_memory_mb(root))
+            os.makedirs(os.path.join(root, "proc"))
+            meminfo_path = os.path.join(root, "proc", "meminfo")
+            with open(meminfo_path, "w", encoding="ascii") as file_obj:
+                file_obj.write("MemTotal:        8152324 kB\nMemFree: 1000 kB\n")
+            self.assertEqual(capacity.detect_memory_mb(root), 7961)
+            with open(meminfo_path, "w", encoding="ascii") as file_obj:
+                file_obj.write("MemFree: 1000 kB\n")
+            self.assertIsNone(capacity.detect_memory_mb(root))
+
+
+class TestNginxSizing(TestCase):
+    """Tests the nginx workers and file descriptor limits"""
+
+    def test_max_participants(self):
+        """A bigger VM holds more participants"""
+        self.assertIsNone(capacity.max_participants(None))
+        self.assertEqual(capacity.max_participants(1024), 2048)
+        self.assertEqual(capacity.max_participants(8192), 16384)
+        self.assertEqual(capacity.max_participants(0), 1)
+
+    def test_nginx_sizing(self):
+        """Each worker has its share of the connections, and the descriptors for them"""
+        sizing = capacity.nginx_sizing(4, 8192, 2000)
+        self.assertEqual(
+            sizing,
+            {
+                "participants": 2000,
+                "workers": 4,
+                "connections": 5000,
+                "rlimit": 10000,
+                "backlog": 2000,
+                "nofilesoft": 20000,
+                "nofilehard": 60000,
+                "filemax": 140000,
+                "somaxconn": 4096,
+            },
+        )
+        # More CPUs spread the same participants over more workers
+        self.assertEqual(capacity.nginx_sizing(8, 8192, 2000)["connections"], 2500)
+        # Small loads still get the minimum
+        self.assertEqual(capacity.nginx_sizing(64, None, 1)["connections"], 1024)
+
+    def test_backlog(self):
+        """The backlog holds a surge, split over the workers' own sockets"""
+        self.assertEqual(capacity.nginx_sizing(4, None, 100)["backlog"], 511)
+        sizing = capacity.nginx_sizing(4, None, 20000)
+        self.assertEqual((sizing["backlog"], sizing["somaxconn"]), (20000, 20000))
+        sizing = capacity.nginx_sizing(4, None, 20000, reuseport=True)
+        self.assertEqual((sizing["backlog"], sizing["somaxconn"]), (6250, 6250))
+        sizing = capacity.nginx_sizing(1, None, 1000000)
+        self.assertEqual((sizing["backlog"], sizing["somaxconn"]), (65535, 65535))
+
+    def test_capped_by_memory(self):
+        """A small VM is not sized for more participants than its memory holds"""
+        sizing = capacity.nginx_sizing(2, 1024, 100000)
+        self.assertEqual(sizing["participants"], 2048)
+        self.assertEqual(sizing["connections"], 10240)
+        # Without the memory, the participants are taken as they are
+        self.assertEqual(capacity.nginx_sizing(2, None, 100000)["participants"], 100000)
+
+    def test_limits_cover_workers(self):
+        """The limits always cover the file descriptors of every worker"""
+        for cpus, memory_mb, participants in [
+            (1, 512, 10),
+            (4, 16384, 30000),
+            (96, None, 1000000),
+            (1, None, 1000000),
+        ]:
+            sizing = capacity.nginx_sizing(cpus, memory_mb, participants)
+            self.assertGreaterEqual(
+                sizing["rlimit"],
+                sizing["connections"] * capacity.FDS_PER_CONNECTION,
+            )
+            self.assertLessEqual(sizing["rlimit"], capacity.MAX_RLIMIT_NOFILE)
+            self.assertGreaterEqual(sizing["nofilehard"], sizing["nofilesoft"])
+            self.assertGreaterEqual(sizing["nofilesoft"], sizing["rlimit"])
+            self.assertGreater(sizing["filemax"], sizing["workers"] * sizing["rlimit"])
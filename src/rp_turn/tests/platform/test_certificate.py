@@ -0,0 +1,67 @@
+"""
+Test the self-signed certificate generation
+"""
+
+from unittest import TestCase
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from rp_turn.platform import certificate
+
+
+class TestSelfSignedCertificate(TestCase):
+    """Tests generate_self_signed_pem"""
+
+    def _load(self, pem):
+        """Loads the private key and certificate from a PEM file"""
+        key = serialization.load_pem_private_key(pem.encode("ascii"), None)
+        cert = x509.load_pem_x509_certificate(pem.encode("ascii"))
+        return key, cert
+
+    def _check_certificate(self, key, cert):
+        """Checks the certificate is self-signed for the key"""
+        self.assertEqual(cert.subject, certificate.SUBJECT)
+        self.assertEqual(cert.issuer, certificate.SUBJECT)
+        self.assertEqual(
+            cert.public_key().public_bytes(
+                serialization.Encoding.DER,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            ),
+            key.public_key().public_bytes(
+                serialization.Encoding.DER,
+                serialization.PublicFormat.SubjectPublicKeyInfo,
+            ),
+        )
+        validity = cert.not_valid_after_utc - cert.not_valid_before_utc
+        self.assertEqual(validity.days, 1095)
+        self.assertFalse(
+            cert.extensions.get_extension_for_class(x509.BasicConstraints).value.ca
+        )
+
+    def test_ecdsa(self):
+        """ECDSA P-256 is the default"""
+        key, cert = self._load(certificate.generate_self_signed_pem())
+        self.assertIsInstance(key, ec.EllipticCurvePrivateKey)
+        self.assertIsInstance(key.curve, ec.SECP256R1)
+        self._check_certificate(key, cert)
+        key_usage = cert.extensions.get_extension_for_class(x509.KeyUsage).value
+        self.assertFalse(key_usage.key_encipherment)
+
+    def test_rsa(self):
+        """RSA 2048 is still available"""
+        key, cert = self._load(certificate.generate_self_signed_pem("rsa-2048"))
+        self.assertIsInstance(key, rsa.RSAPrivateKey)
+        self.assertEqual(key.key_size, 2048)
+        self._check_certificate(key, cert)
+
+    def test_unknown_algorithm(self):
+        """Unknown algorithms are rejected"""
+        self.assertRaises(ValueError, certificate.generate_self_signed_pem, "dsa")
+
+    def test_ecdh_curves(self):
+        """Every key algorithm has an ECDH curve for nginx"""
+        self.assertEqual(
+            sorted(certificate.ECDH_CURVES), sorted(certificate.KEY_ALGORITHMS)
+        )
@@ -0,0 +1,156 @@
+"""
+Test the platform file writers
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.platform import filewriter
+
+
+class TestFileWriterUnchanged(TestCase):
+    """Tests FileWriter.unchanged"""
+
+    def setUp(self):
+        # pylint: disable-next=consider-using-with
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, "file.conf")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_missing_file(self):
+        """A missing file is always changed"""
+        self.assertFalse(filewriter.FileWriter(self._path).unchanged("contents"))
+
+    def test_same_contents(self):
+        """Rewriting the same contents is unchanged"""
+        writer = filewriter.FileWriter(self._path)
+        writer.write("contents", sync=False)
+        self.assertTrue(writer.unchanged("contents"))
+        self.assertFalse(writer.unchanged("other contents"))
+
+    def test_bytes(self):
+        """Raw bytes are written as they are"""
+        writer = filewriter.FileWriter(self._path)
+        writer.write(b"\xff\x00key", sync=False)
+        with open(self._path, "rb") as file_obj:
+            self.assertEqual(file_obj.read(), b"\xff\x00key")
+        self.assertTrue(writer.unchanged(b"\xff\x00key"))
+        self.assertFalse(writer.unchanged(b"\xff\x00other"))
+
+    def test_headed_same_contents(self):
+        """The timestamped heading is ignored when comparing contents"""
+        writer = filewriter.HeadedFileWriter(self._path)
+        writer.write("contents\n", sync=False)
+        self.assertTrue(writer.unchanged("contents\n"))
+        self.assertFalse(writer.unchanged("contents"))
+
+    def test_headed_unheaded_file(self):
+        """A file written without the heading must be rewritten"""
+        filewriter.FileWriter(self._path).write("contents", sync=False)
+        self.assertFalse(filewriter.HeadedFileWriter(self._path).unchanged("contents"))
+
+    def test_root(self):
+        """Files are written below the root, with their live path in the heading"""
+        writer = filewriter.HeadedFileWriter("/etc/file.conf", root=self._tmpdir.name)
+        self.assertIsNone(writer.read())
+        os.mkdir(os.path.join(self._tmpdir.name, "etc"))
+        writer.write("contents\n", sync=False)
+        self.assertEqual(
+            writer.file_path, os.path.join(self._tmpdir.name, "etc", "file.conf")
+        )
+        with open(writer.file_path, encoding="utf-8") as file_obj:
+            self.assertEqual(file_obj.readline(), "# >/etc/file.conf\n")
+        self.assertEqual(writer.read(), "contents\n")
+        self.assertTrue(writer.unchanged("contents\n"))
+
+
+class TestFileWriterBatch(TestCase):
+    """Tests FileWriter.batch"""
+
+    def setUp(self):
+        # pylint: disable-next=consider-using-with
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, "file.conf")
+        self._other_path = os.path.join(self._tmpdir.name, "other.conf")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as file_obj:
+            return file_obj.read()
+
+    @patch("os.fsync")
+    @patch("rp_turn.platform.filewriter.sync_filesystems")
+    def test_commit(self, sync_mock, fsync_mock):
+        """Files are only replaced on exit, after a single barrier"""
+        filewriter.FileWriter(self._path).write("old", sync=False)
+        with filewriter.FileWriter.batch():
+            filewriter.FileWriter(self._path).write("new")
+            filewriter.HeadedFileWriter(self._other_path).write("other")
+            # Existing files are untouched until the batch commits
+            self.assertEqual(self._read(self._path), "old")
+            self.assertFalse(os.path.exists(self._other_path))
+            sync_mock.assert_not_called()
+        fsync_mock.assert_not_called()
+        self.assertEqual(sync_mock.call_count, 2)
+        self.assertEqual(self._read(self._path), "new")
+        self.assertEqual(self._read(self._path + ".bak"), "old")
+        self.assertTrue(
+            filewriter.HeadedFileWriter(self._other_path).unchanged("other")
+        )
+        self.assertEqual(
+            sorted(os.listdir(self._tmpdir.name)),
+            ["file.conf", "file.conf.bak", "other.conf"],
+        )
+
+    def test_discard(self):
+        """Nothing is replaced if the batch exits with an exception"""
+        filewriter.FileWriter(self._path).write("old", sync=False)
+        with self.assertRaises(RuntimeError):
+            with filewriter.FileWriter.batch():
+                filewriter.FileWriter(self._path).write("new", sync=False)
+                raise RuntimeError("failed")
+        self.assertEqual(self._read(self._path), "old")
+        self.assertEqual(os.listdir(self._tmpdir.name), ["file.conf"])
+
+    def test_nested(self):
+        """Nested batches join the outermost one"""
+        with filewriter.FileWriter.batch():
+            with filewriter.FileWriter.batch():
+                filewriter.FileWriter(self._path).write("contents", sync=False)
+            self.assertFalse(os.path.exists(self._path))
+        self.assertEqual(self._read(self._path), "contents")
+
+    def test_backup_is_hardlink(self):
+        """Backups link to the replaced file rather than copying it"""
+        writer = filewriter.FileWriter(self._path)
+        writer.write("old", sync=False)
+        inode = os.stat(self._path).st_ino
+        writer.write("new", sync=False)
+        self.assertEqual(os.stat(self._path + ".bak").st_ino, inode)
+        self.assertEqual(self._read(self._path + ".bak"), "old")
+
+    def test_restore_backup(self):
+        """The backup is put back in place of the file, once"""
+        filewriter.FileWriter(self._path).write("old", sync=False)
+        filewriter.FileWriter(self._path).write("new", sync=False)
+        self.assertTrue(filewriter.restore_backup(self._path))
+        self.assertEqual(self._read(self._path), "old")
+        self.assertFalse(os.path.exists(self._path + ".bak"))
+        self.assertFalse(filewriter.restore_backup(self._path))
+        self.assertFalse(filewriter.restore_backup(self._other_path))
+        # Below a root
+        relative = os.path.relpath(self._path, "/")
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, os.path.dirname(relative)))
+            rooted = filewriter.rooted(self._path, root)
+            filewriter.FileWriter(self._path, root=root).write("old", sync=False)
+            filewriter.FileWriter(self._path, root=root).write("new", sync=False)
+            self.assertTrue(filewriter.restore_backup(self._path, root=root))
+            self.assertEqual(self._read(rooted), "old")
+        self.assertEqual(self._read(self._path), "old")
@@ -0,0 +1,48 @@
+"""
+Test the SSH host key generation
+"""
+
+from unittest import TestCase
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from rp_turn.platform import hostkeys
+
+
+class TestHostKeys(TestCase):
+    """Tests generate_host_keys and host_key_files"""
+
+    def test_generate_host_keys(self):
+        """A key of every type ssh-keygen -A creates is generated"""
+        keys = hostkeys.generate_host_keys()
+        self.assertEqual(sorted(keys), ["ecdsa", "ed25519", "rsa"])
+        self.assertIsInstance(keys["rsa"], rsa.RSAPrivateKey)
+        self.assertEqual(keys["rsa"].key_size, 3072)
+        self.assertIsInstance(keys["ecdsa"], ec.EllipticCurvePrivateKey)
+        self.assertIsInstance(keys["ed25519"], ed25519.Ed25519PrivateKey)
+
+    def test_unknown_key_type(self):
+        """Unknown key types are rejected"""
+        self.assertRaises(ValueError, hostkeys.generate_host_key, "dsa")
+
+    def test_host_key_files(self):
+        """Private and public OpenSSH key files are created for each key"""
+        key = hostkeys.generate_host_key("ed25519")
+        files = hostkeys.host_key_files({"ed25519": key}, "root@proxy")
+        self.assertEqual(
+            sorted(files), ["ssh_host_ed25519_key", "ssh_host_ed25519_key.pub"]
+        )
+        private_key = serialization.load_ssh_private_key(
+            files["ssh_host_ed25519_key"].encode("ascii"), None
+        )
+        self.assertEqual(private_key.private_bytes_raw(), key.private_bytes_raw())
+        key_type, public_key, comment = files["ssh_host_ed25519_key.pub"].split()
+        self.assertEqual(key_type, "ssh-ed25519")
+        self.assertEqual(comment, "root@proxy")
+        self.assertEqual(
+            serialization.load_ssh_public_key(
+                f"{key_type} {public_key}".encode("ascii")
+            ).public_bytes_raw(),
+            key.public_key().public_bytes_raw(),
+        )
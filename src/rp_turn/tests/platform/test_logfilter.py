@@ -0,0 +1,140 @@
+"""
+Test the maps filtering sensitive parameters out of the logged requests
+"""
+
+import random
+import re
+from unittest import TestCase
+
+from rp_turn.benchmarks import log_filter
+from rp_turn.platform import logfilter
+
+PARAMS = ["code", "state", "token", "pin", "data"]
+
+
+class TestFilterMap(TestCase):
+    """Tests the generated map, evaluated as nginx would"""
+
+    def setUp(self):
+        self._compiled = log_filter.compile_maps(
+            [logfilter.filter_map(PARAMS, "$request")]
+        )
+
+    def _filter(self, line):
+        """Filters the line with the map"""
+        return log_filter.apply_maps(self._compiled, line)
+
+    def test_unfiltered(self):
+        """Lines without sensitive parameters are passed through"""
+        for line in [
+            "GET /static/js/main.js HTTP/1.1",
+            "GET /api/client/v2/status?display_name=alice&role=guest HTTP/1.1",
+            "GET /webapp/?codec=vp8 HTTP/1.1",
+            "",
+        ]:
+            self.assertEqual(self._filter(line), line)
+
+    def test_filtered(self):
+        """The only value of a line is filtered, keeping the other parameters"""
+        for line, expected in [
+            (
+                "POST /api?display_name=bob&pin=1234&role=host HTTP/1.1",
+                "POST /api?display_name=bob&pin=[FILTERED]&role=host HTTP/1.1",
+            ),
+            (
+                "GET /a?x=2&data=a=b== HTTP/1.1",
+                "GET /a?x=2&data=[FILTERED] HTTP/1.1",
+            ),
+            (
+                "GET /a?access_token=1&x=2 HTTP/1.1",
+                "GET /a?access_token=[FILTERED]&x=2 HTTP/1.1",
+            ),
+            (
+                "GET /a?redirect=/b?code=1 HTTP/1.1",
+                "GET /a?redirect=/b?code=[FILTERED] HTTP/1.1",
+            ),
+            (
+                "GET /a?pin= HTTP/1.1",
+                "GET /a?pin=[FILTERED] HTTP/1.1",
+            ),
+            (
+                "https://conf.example.com/?pin=12",
+                "https://conf.example.com/?pin=[FILTERED]",
+            ),
+        ]:
+            self.assertEqual(self._filter(line), expected)
+
+    def test_several(self):
+        """With several values, the URI is filtered from the first of them"""
+        for line, expected in [
+            (
+                "GET /callback?code=abc&state=xyz HTTP/1.1",
+                "GET /callback?code=[FILTERED] HTTP/1.1",
+            ),
+            (
+                "GET /a?x=2&access_token=1&spin=2 HTTP/1.1",
+                "GET /a?x=2&access_token=[FILTERED] HTTP/1.1",
+            ),
+            (
+                "GET /a?pin=&code= HTTP/1.0",
+                "GET /a?pin=[FILTERED] HTTP/1.0",
+            ),
+            (
+                "https://conf.example.com/?pin=12&code=3#x",
+                "https://conf.example.com/?pin=[FILTERED]",
+            ),
+            (
+                "GET /a?pin=1 x?code=2 HTTP/1.1",
+                "GET /a?pin=[FILTERED]",
+            ),
+        ]:
+            self.assertEqual(self._filter(line), expected)
+
+    def test_many(self):
+        """No value is left, however many there are"""
+        line = (
+            "GET /a?"
+            + "&".join(f"token={index}" for index in range(9))
+            + "&token=i&pin=secret HTTP/1.1"
+        )
+        self.assertEqual(self._filter(line), "GET /a?token=[FILTERED] HTTP/1.1")
+
+    def test_nothing_leaks(self):
+        """The map filters every value out of random lines"""
+        value_re = re.compile(r"((?:code|state|token|pin|data)=)[^&\s]*")
+        generator = random.Random(0)
+        names = PARAMS + ["x", "a_pin", "codec", "statement"]
+        for _ in range(500):
+            query = "&".join(
+                f"{generator.choice(names)}={generator.getrandbits(16):x}"
+                for _ in range(generator.randrange(12))
+            )
+            line = f"GET /api?{query} HTTP/1.1"
+            filtered = self._filter(line)
+            self.assertEqual(value_re.sub(r"\1[FILTERED]", filtered), filtered)
+            if len(value_re.findall(line)) <= 1:
+                self.assertEqual(filtered, value_re.sub(r"\1[FILTERED]", line))
+
+    def test_entries(self):
+        """Each entry is anchored and uses at most the nine captures of nginx"""
+        entries = logfilter.filter_map(["pin", "code", "pin"], "$http_referer")
+        self.assertEqual(entries[0][1], "$http_referer")
+        self.assertEqual(len(entries), 3)
+        self.assertIn("(?:pin|code)=", entries[0][0])
+        self.assertEqual(logfilter.filter_map([], "$request"), [])
+        for regex, value in entries:
+            self.assertTrue(regex.startswith("~^"))
+            self.assertLessEqual(re.compile(regex[1:]).groups, 9)
+            self.assertNotIn("$10", value)
+
+
+class TestValidateParam(TestCase):
+    """Tests the names of sensitive parameters"""
+
+    def test_validate_param(self):
+        """Only names which need no escaping in a regex are accepted"""
+        self.assertEqual(logfilter.validate_param("access_token"), "access_token")
+        self.assertEqual(logfilter.validate_param("X-Pin"), "X-Pin")
+        for name in ["", "pin=", "to ken", "(pin)", "pin|code", "pin.*"]:
+            with self.assertRaises(ValueError):
+                logfilter.validate_param(name)
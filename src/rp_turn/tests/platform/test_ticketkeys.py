@@ -0,0 +1,47 @@
+"""
+Test the TLS session ticket keys
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from rp_turn.platform import ticketkeys
+
+
+class TestTicketKeys(TestCase):
+    """Tests reading and rotating the session ticket keys"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self._root = directory.name
+        os.makedirs(os.path.join(self._root, "etc", "nginx", "ssl"))
+
+    def _write(self, path, key):
+        """Writes a key below the root"""
+        with open(os.path.join(self._root, path.lstrip("/")), "wb") as file_obj:
+            file_obj.write(key)
+
+    def test_read_ticket_keys(self):
+        """Missing keys, and keys of the wrong size, are not read"""
+        self.assertFalse(ticketkeys.ticket_keys_exist(self._root))
+        self.assertEqual(ticketkeys.read_ticket_keys(self._root), [None, None, None])
+        key = ticketkeys.generate_ticket_key()
+        self.assertEqual(len(key), 80)
+        self._write("/etc/nginx/ssl/ticket.key", key)
+        self._write("/etc/nginx/ssl/ticket.key.1", b"too short")
+        self.assertEqual(ticketkeys.read_ticket_keys(self._root), [key, None, None])
+        self._write("/etc/nginx/ssl/ticket.key.2", key)
+        self.assertTrue(ticketkeys.ticket_keys_exist(self._root))
+
+    def test_rotated_ticket_keys(self):
+        """A new key is added in front and the oldest key is dropped"""
+        keys = [ticketkeys.generate_ticket_key() for _ in range(3)]
+        rotated = ticketkeys.rotated_ticket_keys(keys)
+        self.assertEqual(rotated[1:], keys[:2])
+        self.assertNotIn(rotated[0], keys)
+        # Missing keys are replaced
+        rotated = ticketkeys.rotated_ticket_keys([None, None, None])
+        self.assertEqual(len(set(rotated)), 3)
+        self.assertTrue(all(len(key) == 80 for key in rotated))
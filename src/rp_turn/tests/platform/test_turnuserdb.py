@@ -0,0 +1,117 @@
+"""
+Test the coturn user database accessor
+"""
+
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from rp_turn.platform import filewriter, turnuserdb
+
+
+def create_turnuserdb(path, users, secrets):
+    """Creates a user database in the same way as turnadmin"""
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            "CREATE TABLE turnusers_lt (realm varchar(127) default '', "
+            "name varchar(512), hmackey char(128), PRIMARY KEY (realm,name))"
+        )
+        connection.execute(
+            "CREATE TABLE turn_secret (realm varchar(127) default '', "
+            "value varchar(256), primary key (realm,value))"
+        )
+        connection.executemany("INSERT INTO turnusers_lt VALUES (?, ?, ?)", users)
+        connection.executemany("INSERT INTO turn_secret VALUES (?, ?)", secrets)
+    connection.close()
+
+
+class TestTurnUserDB(TestCase):
+    """Tests TurnUserDB"""
+
+    def setUp(self):
+        # pylint: disable-next=consider-using-with
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._tmpdir.name, "turnuserdb.conf")
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_lt_cred_key(self):
+        """Key matches turnadmin -k output"""
+        self.assertEqual(
+            turnuserdb.lt_cred_key("ninefingers", "north.gov", "youhavetoberealistic"),
+            "bc807ee29df3c9ffa736523fb2c4e8ee",
+        )
+
+    def test_unchanged_missing(self):
+        """A missing database is always changed"""
+        database = turnuserdb.TurnUserDB(self._path)
+        self.assertFalse(database.unchanged("example.com", {}, []))
+
+    def test_unchanged(self):
+        """Compares users and secrets with the database"""
+        key = turnuserdb.lt_cred_key("user", "example.com", "password")
+        create_turnuserdb(
+            self._path,
+            [("example.com", "user", key)],
+            [("example.com", "secret")],
+        )
+        database = turnuserdb.TurnUserDB(self._path)
+        self.assertTrue(
+            database.unchanged("example.com", {"user": "password"}, ["secret"])
+        )
+        self.assertFalse(
+            database.unchanged("example.com", {"user": "other"}, ["secret"])
+        )
+        self.assertFalse(database.unchanged("example.com", {"user": "password"}, []))
+        self.assertFalse(
+            database.unchanged("example.org", {"user": "password"}, ["secret"])
+        )
+
+    def test_write(self):
+        """Written credentials are read back and replace previous ones"""
+        create_turnuserdb(self._path, [("example.com", "old", "00")], [])
+        database = turnuserdb.TurnUserDB(self._path)
+        database.write("example.com", {"user": "password"}, ["secret"])
+        self.assertTrue(
+            database.unchanged("example.com", {"user": "password"}, ["secret"])
+        )
+        self.assertEqual(os.stat(self._path).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self._tmpdir.name), ["turnuserdb.conf"])
+
+    def test_write_batch(self):
+        """Within a batch the database is only replaced when the batch commits"""
+        create_turnuserdb(self._path, [("example.com", "old", "00")], [])
+        database = turnuserdb.TurnUserDB(self._path)
+        with self.assertRaises(RuntimeError):
+            with filewriter.FileWriter.batch():
+                database.write("example.com", {"user": "password"}, ["secret"])
+                raise RuntimeError("a later phase failed")
+        self.assertEqual(database.read(), ({("example.com", "old", "00")}, set()))
+        self.assertEqual(os.listdir(self._tmpdir.name), ["turnuserdb.conf"])
+        with filewriter.FileWriter.batch():
+            database.write("example.com", {"user": "password"}, ["secret"])
+            self.assertEqual(database.read(), ({("example.com", "old", "00")}, set()))
+        self.assertTrue(
+            database.unchanged("example.com", {"user": "password"}, ["secret"])
+        )
+        self.assertEqual(os.listdir(self._tmpdir.name), ["turnuserdb.conf"])
+
+    def test_write_bulk(self):
+        """Thousands of users are written in one pass"""
+        users = {f"user{index}": f"password{index}" for index in range(5000)}
+        database = turnuserdb.TurnUserDB(self._path)
+        database.write("example.com", users, [])
+        existing_users, existing_secrets = database.read()
+        self.assertEqual(len(existing_users), 5000)
+        self.assertIn(
+            (
+                "example.com",
+                "user42",
+                turnuserdb.lt_cred_key("user42", "example.com", "password42"),
+            ),
+            existing_users,
+        )
+        self.assertEqual(existing_secrets, set())
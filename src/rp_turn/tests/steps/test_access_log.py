@@ -0,0 +1,84 @@
+"""
+Tests the Access Log Steps from the installwizard
+"""
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+import rp_turn.tests.utils as test_utils
+from rp_turn import steps, utils
+
+
+class TestBufferedAccessLog(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_buffered_access_log question from the AccessLogStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.AccessLogStep
+        self._state_id = ["accesslog", "buffered"]
+        self._question = "_enable_buffered_access_log"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["64k"]
+
+
+class TestConditionalAccessLog(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_conditional_access_log question from the AccessLogStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.AccessLogStep
+        self._state_id = ["accesslog", "conditional"]
+        self._question = "_enable_conditional_access_log"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["errors"]
+
+
+class TestStaticLogSample(tests.TestQuestion):
+    """Test the _get_static_log_sample question from the AccessLogStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.AccessLogStep
+        self._state_id = ["accesslog", "staticsample"]
+        self._question = "_get_static_log_sample"
+        self._valid_cases = ["1", "100", "10000"]
+        self._invalid_cases = ["0", "10001", "-10", "10%", "some"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved samples must be whole numbers, defaulting to logging everything"""
+        for saved, expected in [(50, 50), ("50", 1), (0, 1), (True, 1), (None, 1)]:
+            saved_config = utils.make_nested_dict(
+                {"accesslog": {"staticsample": saved}}
+            )
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["accesslog"]["staticsample"], expected)
+            self.assertFalse(config["accesslog"]["buffered"])
+            self.assertFalse(config["accesslog"]["conditional"])
+
+
+class TestSensitiveParams(tests.TestMultiQuestion, tests.TestMultiDefaultConfig):
+    """Test the SensitiveParamsStep"""
+
+    def setUp(self):
+        tests.TestMultiQuestion.setUp(self)
+        tests.TestMultiDefaultConfig.setUp(self)
+        self._step = steps.SensitiveParamsStep
+        self._state_id = ["accesslog", "sensitiveparams"]
+        self._valid_cases = ["code", "access_token", "X-Pin", "data2"]
+        self._invalid_cases = ["to ken", "pin=", "(code|pin)", "token.*", "pin|data"]
+
+    def test_default_config_fallback(self):
+        """Without saved parameters, the parameters filtered before are used"""
+        config = utils.nested_dict()
+        self._step().default_config(utils.nested_dict(), config)
+        self.assertEqual(
+            config["accesslog"]["sensitiveparams"],
+            ["code", "state", "token", "pin", "data"],
+        )
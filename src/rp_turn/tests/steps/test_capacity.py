@@ -0,0 +1,66 @@
+"""
+Tests the Capacity Step from the installwizard
+"""
+
+from unittest import mock
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+from rp_turn import steps, utils
+
+
+class TestTargetParticipants(tests.TestQuestion):
+    """Test the CapacityStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.CapacityStep
+        self._state_id = ["capacity", "participants"]
+        self._question = "_get_target_participants"
+        self._valid_cases = ["1", "2500", "1000000"]
+        self._invalid_cases = ["0", "1000001", "-10", "1e3", "many"]
+        patcher = mock.patch(
+            "rp_turn.platform.capacity.detect_memory_mb", return_value=2048
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved participants must be whole numbers, defaulting to what the memory holds"""
+        for saved, expected in [(50, 50), ("50", 4096), (0, 4096), (True, 4096)]:
+            saved_config = utils.make_nested_dict({"capacity": {"participants": saved}})
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["capacity"]["participants"], expected)
+        with mock.patch(
+            "rp_turn.platform.capacity.detect_memory_mb", return_value=None
+        ):
+            config = utils.nested_dict()
+            self._step().default_config(utils.nested_dict(), config)
+            self.assertEqual(config["capacity"]["participants"], 1000)
+
+
+class TestEnableReuseport(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_reuseport question from the CapacityStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.CapacityStep
+        self._state_id = ["capacity", "reuseport"]
+        self._question = "_enable_reuseport"
+        self._valid_cases = [True, False]
+        self._invalid_cases = ["yes", 1, None]
+
+    def test_default_by_cpus(self):
+        """Without a saved answer, reuseport is used from 8 CPUs"""
+        for cpus, expected in [(2, False), (8, True), (32, True)]:
+            config = utils.nested_dict()
+            with mock.patch("rp_turn.platform.capacity.detect_cpus", return_value=cpus):
+                self._step().default_config(utils.nested_dict(), config)
+            self.assertEqual(config["capacity"]["reuseport"], expected)
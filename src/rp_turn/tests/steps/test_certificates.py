@@ -36,3 +36,27 @@ class TestGenerateSSHQuestion(tests.TestYesNoQuestion, tests.TestDefaultConfig):
         self._question = "_generate_ssh"
         self._valid_cases = [True, False]
         self._invalid_cases = test_utils.VALID_IP_ADDRESSES + test_utils.VALID_HOSTNAMES
+
+
+class TestKeyAlgorithmQuestion(tests.TestQuestion, tests.TestDefaultConfig):
+    """Tests the _get_key_algorithm Question in CertificatesStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = STEPCLASS
+        self._state_id = ["generate-certs", "keyalgorithm"]
+        self._question = "_get_key_algorithm"
+        self._valid_cases = ["ecdsa-p256", "rsa-2048"]
+        self._invalid_cases = ["rsa", "ecdsa", "dsa-1024"] + test_utils.VALID_HOSTNAMES
+
+    def test_asked_when_regenerating_ssl(self):
+        """The key algorithm is only asked for when regenerating the certificate"""
+        for case, asked in (("yes", True), ("no", False)):
+            question, config, step = self.setup_question(
+                case, question_str="_generate_ssl"
+            )
+            question(config)
+            self.assertEqual(
+                "_get_key_algorithm" in self.get_questions_from_step(step), asked
+            )
@@ -0,0 +1,103 @@
+"""
+Tests the Health Check Steps from the installwizard
+"""
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+import rp_turn.tests.utils as test_utils
+from rp_turn import steps, utils
+
+
+class TestEnableHealthCheck(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_health_check question from the HealthCheckStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.HealthCheckStep
+        self._state_id = ["healthcheck", "enabled"]
+        self._question = "_enable_health_check"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["5"]
+
+    def is_valid(self, step, config, expected):
+        tests.TestYesNoQuestion.is_valid(self, step, config, expected)
+        expected_questions = ["_enable_health_check"]
+        if expected:
+            expected_questions.append("_get_interval")
+        self.assertEqual(test_utils.question_strs(step.questions), expected_questions)
+
+
+class TestHealthCheckInterval(tests.TestQuestion):
+    """Test the _get_interval question from the HealthCheckStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.HealthCheckStep
+        self._state_id = ["healthcheck", "interval"]
+        self._question = "_get_interval"
+        self._valid_cases = ["1", "5", "300"]
+        self._invalid_cases = ["0", "301", "-5", "2.5", "five"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved intervals must be whole numbers of seconds, defaulting to 5"""
+        for saved, expected in [(10, 10), ("10", 5), (0, 5), (True, 5), (None, 5)]:
+            saved_config = utils.make_nested_dict({"healthcheck": {"interval": saved}})
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["healthcheck"]["interval"], expected)
+            self.assertFalse(config["healthcheck"]["enabled"])
+
+
+class TestEnableHealthEndpoint(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_health_endpoint question from the HealthEndpointStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.HealthEndpointStep
+        self._state_id = ["healthz", "enabled"]
+        self._question = "_enable_health_endpoint"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["/healthz"]
+
+    def is_valid(self, step, config, expected):
+        tests.TestYesNoQuestion.is_valid(self, step, config, expected)
+        # Without health checks, there is nothing for /healthz to reflect
+        self.assertEqual(
+            test_utils.question_strs(step.questions), ["_enable_health_endpoint"]
+        )
+
+    def test_with_health_checks(self):
+        """With health checks, /healthz may reflect the conference nodes"""
+        question, config, step = self.setup_question("yes")
+        config["healthcheck"]["enabled"] = True
+        question(config)
+        self.assertEqual(
+            test_utils.question_strs(step.questions),
+            ["_enable_health_endpoint", "_enable_upstream_health"],
+        )
+
+    def test_default_config(self):
+        """The endpoint is enabled by default, only answering whether nginx is up"""
+        config = utils.nested_dict()
+        self._step().default_config(utils.nested_dict(), config)
+        self.assertEqual(config["healthz"], {"enabled": True, "upstream": False})
+
+
+class TestUpstreamHealth(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_upstream_health question from the HealthEndpointStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.HealthEndpointStep
+        self._state_id = ["healthz", "upstream"]
+        self._question = "_enable_upstream_health"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["503"]
@@ -0,0 +1,80 @@
+"""
+Tests the Rate Limit Step from the installwizard
+"""
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+import rp_turn.tests.utils as test_utils
+from rp_turn import steps, utils
+
+
+class TestEnableRateLimit(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_rate_limit question from the RateLimitStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.RateLimitStep
+        self._state_id = ["ratelimit", "enabled"]
+        self._question = "_enable_rate_limit"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["5r/s"]
+
+
+class TestTokenRate(tests.TestQuestion):
+    """Test the _get_token_rate question from the RateLimitStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.RateLimitStep
+        self._state_id = ["ratelimit", "tokenrate"]
+        self._question = "_get_token_rate"
+        self._valid_cases = ["1", "5", "1000"]
+        self._invalid_cases = ["0", "1001", "-5", "5r/s", "fast"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved limits must be whole numbers in range, defaulting to each limit's own"""
+        saved_config = utils.make_nested_dict(
+            {"ratelimit": {"tokenrate": 10, "tokenburst": "50", "connections": 0}}
+        )
+        config = utils.nested_dict()
+        self._step().default_config(saved_config, config)
+        self.assertEqual(
+            config["ratelimit"],
+            {"enabled": False, "tokenrate": 10, "tokenburst": 20, "connections": 100},
+        )
+
+
+class TestTokenBurst(tests.TestQuestion):
+    """Test the _get_token_burst question from the RateLimitStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.RateLimitStep
+        self._state_id = ["ratelimit", "tokenburst"]
+        self._question = "_get_token_burst"
+        self._valid_cases = ["0", "20", "10000"]
+        self._invalid_cases = ["10001", "-1", "20.5", "none"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+
+class TestConnectionLimit(tests.TestQuestion):
+    """Test the _get_connection_limit question from the RateLimitStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.RateLimitStep
+        self._state_id = ["ratelimit", "connections"]
+        self._question = "_get_connection_limit"
+        self._valid_cases = ["1", "100", "100000"]
+        self._invalid_cases = ["0", "100001", "-100", "unlimited"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
@@ -0,0 +1,77 @@
+"""
+Tests the Real IP Steps from the installwizard
+"""
+
+from unittest import mock
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+from rp_turn import steps, utils
+
+
+class TestRealIPSource(tests.TestQuestion, tests.TestDefaultConfig):
+    """Test the _get_real_ip_source question from the RealIPStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.RealIPStep
+        self._state_id = ["realip", "source"]
+        self._question = "_get_real_ip_source"
+        self._valid_cases = ["none", "proxy_protocol", "header"]
+        self._invalid_cases = ["proxy", "X-Forwarded-For", "", "10.0.0.0/8"]
+
+    def test_header_asked(self):
+        """The header is only asked for when the address comes from one"""
+        for source, questions in [("header", 2), ("proxy_protocol", 1)]:
+            step = self._step()
+            with mock.patch.object(step, "ask", return_value=source):
+                step.questions[0](utils.nested_dict())
+            self.assertEqual(len(step.questions), questions)
+
+
+class TestRealIPHeader(tests.TestQuestion):
+    """Test the _get_real_ip_header question from the RealIPStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.RealIPStep
+        self._state_id = ["realip", "header"]
+        self._question = "_get_real_ip_header"
+        self._valid_cases = ["X-Forwarded-For", "X-Real-IP", "CF-Connecting-IP"]
+        self._invalid_cases = ["", "X Forwarded", "X_Real_IP", "proxy_protocol"]
+
+    def test_default_config(self):
+        """Saved settings are validated, defaulting to clients connecting directly"""
+        saved_config = utils.make_nested_dict(
+            {"realip": {"source": "proxy", "header": "True-Client-IP"}}
+        )
+        config = utils.nested_dict()
+        self._step().default_config(saved_config, config)
+        self.assertEqual(
+            config["realip"], {"source": "none", "header": "True-Client-IP"}
+        )
+
+
+class TestTrustedProxies(tests.TestMultiQuestion, tests.TestMultiDefaultConfig):
+    """Test the TrustedProxiesStep"""
+
+    def setUp(self):
+        tests.TestMultiQuestion.setUp(self)
+        tests.TestMultiDefaultConfig.setUp(self)
+        self._step = steps.TrustedProxiesStep
+        self._state_id = ["realip", "trusted"]
+        self._valid_cases = ["10.0.0.0/8", "192.0.2.0/24", "130.211.0.0/22"]
+        self._invalid_cases = ["10.0.0.0/33", "load balancer", "2001:db8::/32"]
+
+    def test_skipped_without_load_balancers(self):
+        """Nothing is asked when clients connect directly"""
+        config = utils.make_nested_dict(
+            {"realip": {"source": "none", "trusted": ["10.0.0.0/8"]}}
+        )
+        step = self._step()
+        with mock.patch.object(step, "ask") as ask:
+            step.run(config, step_id=1, total_steps=1, print_header=False)
+        ask.assert_not_called()
@@ -0,0 +1,71 @@
+"""
+Tests the Static Cache Step from the installwizard
+"""
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+import rp_turn.tests.utils as test_utils
+from rp_turn import steps, utils
+
+
+class TestEnableStaticCache(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_static_cache question from the StaticCacheStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.StaticCacheStep
+        self._state_id = ["staticcache", "enabled"]
+        self._question = "_enable_static_cache"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["256"]
+
+    def is_valid(self, step, config, expected):
+        tests.TestYesNoQuestion.is_valid(self, step, config, expected)
+        expected_questions = ["_enable_static_cache"]
+        if expected:
+            expected_questions += [
+                "_get_static_cache_size",
+                "_enable_static_cache_tmpfs",
+            ]
+        self.assertEqual(test_utils.question_strs(step.questions), expected_questions)
+
+
+class TestStaticCacheSize(tests.TestQuestion):
+    """Test the _get_static_cache_size question from the StaticCacheStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.StaticCacheStep
+        self._state_id = ["staticcache", "size"]
+        self._question = "_get_static_cache_size"
+        self._valid_cases = ["16", "256", "16384"]
+        self._invalid_cases = ["15", "16385", "-256", "1G", "large"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved cache sizes must be whole numbers, defaulting to 256"""
+        for saved, expected in [(1024, 1024), ("1024", 256), (8, 256), (None, 256)]:
+            saved_config = utils.make_nested_dict({"staticcache": {"size": saved}})
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["staticcache"]["size"], expected)
+            self.assertFalse(config["staticcache"]["enabled"])
+            self.assertFalse(config["staticcache"]["tmpfs"])
+
+
+class TestEnableStaticCacheTmpfs(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_static_cache_tmpfs question from the StaticCacheStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.StaticCacheStep
+        self._state_id = ["staticcache", "tmpfs"]
+        self._question = "_enable_static_cache_tmpfs"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["tmpfs"]
@@ -0,0 +1,69 @@
+"""
+Tests the TLS Steps from the installwizard
+"""
+
+# Import steps and default cases
+import rp_turn.tests.steps as tests
+
+# Local application/library specific imports
+import rp_turn.tests.utils as test_utils
+from rp_turn import steps, utils
+
+
+class TestEnableTLSPerformance(tests.TestYesNoQuestion, tests.TestDefaultConfig):
+    """Test the _enable_tls_performance question from the TLSPerformanceStep"""
+
+    def setUp(self):
+        tests.TestYesNoQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.TLSPerformanceStep
+        self._state_id = ["tlsperformance", "enabled"]
+        self._question = "_enable_tls_performance"
+        self._valid_cases = [True, False]
+        self._invalid_cases = test_utils.VALID_IP_ADDRESSES + ["1000"]
+
+    def is_valid(self, step, config, expected):
+        tests.TestYesNoQuestion.is_valid(self, step, config, expected)
+        expected_questions = ["_enable_tls_performance"]
+        if expected:
+            expected_questions.append("_get_expected_clients")
+        self.assertEqual(test_utils.question_strs(step.questions), expected_questions)
+
+
+class TestExpectedClients(tests.TestQuestion):
+    """Test the _get_expected_clients question from the TLSPerformanceStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        self._step = steps.TLSPerformanceStep
+        self._state_id = ["tlsperformance", "clients"]
+        self._question = "_get_expected_clients"
+        self._valid_cases = ["1", "250", "1000000"]
+        self._invalid_cases = ["0", "1000001", "-5", "1e3", "many"]
+
+    def is_valid(self, _step, config, expected):
+        self.assertEqual(self.get_config_value(config), int(expected))
+
+    def test_default_config(self):
+        """Saved client counts must be whole numbers, defaulting to 1000"""
+        for saved, expected in [(5000, 5000), ("5000", 1000), (0, 1000), (None, 1000)]:
+            saved_config = utils.make_nested_dict(
+                {"tlsperformance": {"clients": saved}}
+            )
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["tlsperformance"]["clients"], expected)
+            self.assertFalse(config["tlsperformance"]["enabled"])
+
+
+class TestTLSProfile(tests.TestQuestion, tests.TestDefaultConfig):
+    """Test the TLSProfileStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.TLSProfileStep
+        self._state_id = "tlsprofile"
+        self._question = "_get_tls_profile"
+        self._valid_cases = ["compatibility", "performance"]
+        self._invalid_cases = ["modern", "ECDHE-RSA-AES128-GCM-SHA256", ""]
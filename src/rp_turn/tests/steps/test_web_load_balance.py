@@ -2,12 +2,16 @@
 Tests the Web Load Balance Step from the installwizard
 """
 
+from unittest import mock
+
 # Import steps and default cases
 import rp_turn.tests.steps as tests
 
 # Local application/library specific imports
 import rp_turn.tests.utils as test_utils
-from rp_turn import steps
+from rp_turn import steps, utils
+from rp_turn.step_error import StepError
+from rp_turn.steps.web_load_balance import default_node_options
 
 
 class TestEnableWebLoadBalance(tests.TestYesNoQuestion, tests.TestDefaultConfig):
@@ -40,6 +44,128 @@ class TestGetSignalingConfNode(tests.TestMultiQuestion, tests.TestMultiDefaultCo
         )
 
 
+class TestConfNodeOptions(tests.QuestionUtils):
+    """Test the options following the SignalingConferenceNodeStep addresses"""
+
+    def setUp(self):
+        tests.QuestionUtils.setUp(self)
+        self._step = steps.SignalingConferenceNodeStep
+        self._question = "_get_another_answer"
+
+    def _answer(self, lines):
+        """Answers each line, then finishes the step"""
+        question, config, step = self.setup_question(None)
+        for line in lines + [""]:
+            step.ask = mock.Mock(return_value=line)
+            question(config)
+        return config
+
+    def test_options(self):
+        """Options are saved separately from the addresses"""
+        config = self._answer(
+            [
+                "10.44.4.2 weight=4 max_conns=500 max_fails=2 fail_timeout=30",
+                "10.44.4.3  BACKUP ",
+            ]
+        )
+        self.assertEqual(config["conferencenodes"], ["10.44.4.2", "10.44.4.3"])
+        self.assertEqual(
+            config["conferencenodeoptions"],
+            {
+                "10.44.4.2": {
+                    "weight": 4,
+                    "maxconns": 500,
+                    "maxfails": 2,
+                    "failtimeout": 30,
+                    "backup": False,
+                    "down": False,
+                },
+                "10.44.4.3": dict(default_node_options(), backup=True),
+            },
+        )
+
+    def test_invalid_options(self):
+        """Unknown options and values out of range are rejected"""
+        for line in [
+            "10.44.4.2 weight=0",
+            "10.44.4.2 weight=-1",
+            "10.44.4.2 weight=two",
+            "10.44.4.2 fail_timeout=0",
+            "10.44.4.2 backup=yes",
+            "10.44.4.2 drained",
+            "weight=2 10.44.4.2",
+        ]:
+            question, config, step = self.setup_question(None)
+            step.ask = mock.Mock(return_value=line)
+            self.assertRaises(StepError, question, config)
+
+    def test_use_default_shows_options(self):
+        """The saved options are shown with the default addresses"""
+        config = self._answer(["10.44.4.2 weight=2", "10.44.4.3"])
+        step = self._step()
+        self.assertEqual(
+            step.current_values(config), ["10.44.4.2 weight=2", "10.44.4.3"]
+        )
+
+    def test_default_config(self):
+        """Saved options are used only if every node has valid options"""
+        options = dict(default_node_options(), weight=3)
+        for saved_options, expected in [
+            ({"10.44.4.2": options}, {"10.44.4.2": options}),
+            ({}, {"10.44.4.2": default_node_options()}),
+            (
+                {"10.44.4.2": dict(options, maxfails=-1)},
+                {"10.44.4.2": default_node_options()},
+            ),
+            (
+                {"10.44.4.2": options, "10.44.4.3": options},
+                {"10.44.4.2": default_node_options()},
+            ),
+        ]:
+            saved_config = utils.make_nested_dict(
+                {
+                    "conferencenodes": ["10.44.4.2"],
+                    "conferencenodeoptions": saved_options,
+                }
+            )
+            config = utils.nested_dict()
+            self._step().default_config(saved_config, config)
+            self.assertEqual(config["conferencenodeoptions"], expected)
+
+
+class TestLoadBalanceMethod(tests.TestQuestion, tests.TestDefaultConfig):
+    """Test the LoadBalanceMethodStep"""
+
+    def setUp(self):
+        tests.TestQuestion.setUp(self)
+        tests.TestDefaultConfig.setUp(self)
+        self._step = steps.LoadBalanceMethodStep
+        self._state_id = "loadbalancemethod"
+        self._question = "_get_load_balance_method"
+        self._valid_cases = ["hash", "least_conn", "random", "ip_hash"]
+        self._invalid_cases = (
+            ["round_robin", "least_time", "hash $remote_addr consistent"]
+            + test_utils.VALID_IP_ADDRESSES
+            + test_utils.VALID_HOSTNAMES
+        )
+
+    def test_backup_nodes(self):
+        """Backup nodes cannot be used with hashing methods"""
+        backup_options = dict(default_node_options(), backup=True)
+        for case in ["hash", "ip_hash", "random"]:
+            question, config, _ = self.setup_question(case)
+            config["conferencenodeoptions"]["10.44.4.2"] = backup_options
+            self.assertRaises(StepError, question, config)
+        question, config, _ = self.setup_question("least_conn")
+        config["conferencenodeoptions"]["10.44.4.2"] = backup_options
+        question(config)
+        self.assertEqual(config["loadbalancemethod"], "least_conn")
+        # Saved hashing methods are not used with backup nodes
+        saved_config = utils.make_nested_dict({"loadbalancemethod": "hash"})
+        self._step().default_config(saved_config, config)
+        self.assertEqual(config["loadbalancemethod"], "least_conn")
+
+
 class TestContentSecurityPolicy(tests.TestYesNoQuestion, tests.TestDefaultConfig):
     """Test the ContentSecurityPolicyStep"""
 
@@ -0,0 +1,258 @@
+"""
+Test the conference node health checks, against local stand-in HTTPS servers
+"""
+
+import asyncio
+import json
+import os
+import ssl
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import AsyncMock, patch
+
+from rp_turn import healthcheck
+from rp_turn.platform import certificate, nodehealth
+from rp_turn.steps.web_load_balance import default_node_options
+from rp_turn.tests import test_config_applicator
+from rp_turn.tests.test_config_applicator import DummyFileWriter
+
+NODES = ["127.0.0.1", "127.0.0.2"]
+
+
+class StandInNode:
+    """A local HTTPS server standing in for a conference node"""
+
+    def __init__(self, address, status=302):
+        self.address = address
+        self.status = status
+        self.delay = 0.0
+        self.requests = []
+        self._server = None
+
+    async def start(self, context, port=0):
+        """Starts listening, returning the port"""
+        self._server = await asyncio.start_server(
+            self._handle, self.address, port, ssl=context
+        )
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stops listening"""
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        """Answers a single request with the status"""
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            self.requests.append(request.decode("ascii"))
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            writer.write(
+                f"HTTP/1.1 {self.status} Stand-in\r\n"
+                "Content-Length: 0\r\nConnection: close\r\n\r\n".encode("ascii")
+            )
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class StandInTestCase(IsolatedAsyncioTestCase):
+    """Runs a stand-in HTTPS server for each of NODES, on the same port"""
+
+    server_context = None
+
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as directory:
+            pem_path = os.path.join(directory, "node.pem")
+            with open(pem_path, "w", encoding="ascii") as file_obj:
+                file_obj.write(certificate.generate_self_signed_pem())
+            cls.server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            cls.server_context.load_cert_chain(pem_path)
+
+    async def asyncSetUp(self):
+        self.nodes = {address: StandInNode(address) for address in NODES}
+        self.port = 0
+        for node in self.nodes.values():
+            self.port = await node.start(self.server_context, self.port)
+            self.addAsyncCleanup(node.stop)
+
+
+class TestProbe(StandInTestCase):
+    """Tests probing a single node"""
+
+    async def test_healthy(self):
+        """Any response other than a server error counts, timing the request"""
+        latency = await healthcheck.probe("127.0.0.1", port=self.port)
+        self.assertGreater(latency, 0)
+        request = self.nodes["127.0.0.1"].requests[0]
+        self.assertTrue(request.startswith("GET / HTTP/1.1\r\n"))
+        self.assertIn("User-Agent: rp-turn-healthcheck\r\n", request)
+
+    async def test_unhealthy(self):
+        """Server errors, slow responses and refused connections all fail"""
+        self.nodes["127.0.0.1"].status = 503
+        with self.assertRaisesRegex(healthcheck.ProbeError, "HTTP 503"):
+            await healthcheck.probe("127.0.0.1", port=self.port)
+        self.nodes["127.0.0.2"].delay = 1.0
+        with self.assertRaisesRegex(healthcheck.ProbeError, "no response within"):
+            await healthcheck.probe("127.0.0.2", port=self.port, timeout=0.1)
+        await self.nodes["127.0.0.2"].stop()
+        with self.assertRaises(healthcheck.ProbeError):
+            await healthcheck.probe("127.0.0.2", port=self.port)
+
+
+class TestNodeHealth(TestCase):
+    """Tests the hysteresis of a node's health"""
+
+    def test_fall_rise(self):
+        """Health only changes after enough probes in a row agree"""
+        health = healthcheck.NodeHealth(rise=2, fall=3)
+        results = [
+            (None, "refused"),
+            (None, "refused"),
+            (0.01, None),  # Breaks the run of failures
+            (None, "refused"),
+            (None, "refused"),
+            (None, "refused"),
+            (0.01, None),
+            (0.01, None),
+        ]
+        changes = [health.record(*result) for result in results]
+        self.assertEqual(changes, [False] * 5 + [True, False, True])
+        self.assertTrue(health.healthy)
+        self.assertEqual(
+            health.to_dict(),
+            {
+                "healthy": True,
+                "latency_ms": 10.0,
+                "error": None,
+                "checked": health.to_dict()["checked"],
+            },
+        )
+
+
+class TestHealthChecker(StandInTestCase):
+    """Tests probing the nodes and taking unhealthy ones out of the upstream"""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self._config_path = os.path.join(directory.name, "healthcheck.json")
+        with open(self._config_path, "w", encoding="utf-8") as file_obj:
+            json.dump(
+                {
+                    "conferencenodes": NODES,
+                    "conferencenodeoptions": {
+                        address: default_node_options() for address in NODES
+                    },
+                    "loadbalancemethod": "least_conn",
+                    "healthcheck": {"enabled": True, "interval": 1},
+                },
+                file_obj,
+            )
+        self._status_path = os.path.join(directory.name, "health.json")
+        status_patch = patch.object(nodehealth, "HEALTH_STATUS_PATH", self._status_path)
+        status_patch.start()
+        self.addCleanup(status_patch.stop)
+        self._available_path = os.path.join(directory.name, "available")
+        available_patch = patch.object(
+            nodehealth, "AVAILABLE_PATH", self._available_path
+        )
+        available_patch.start()
+        self.addCleanup(available_patch.stop)
+
+    def _update_upstream(self, checker):
+        """Updates the upstream, returning it and the commands which were run"""
+        test_config_applicator.TestDefaultSettings.DummyFileSystem = {}
+        with patch(
+            "rp_turn.platform.filewriter.FileWriter", side_effect=DummyFileWriter
+        ):
+            with patch("subprocess.check_output", return_value="") as check_output_mock:
+                with patch("sys.stdout"):
+                    self.assertTrue(checker.update_upstream())
+        return (
+            test_config_applicator.TestDefaultSettings.DummyFileSystem[
+                "/etc/nginx/includes/pexip-upstream.conf"
+            ],
+            [call[0][0] for call in check_output_mock.call_args_list],
+        )
+
+    async def test_check(self):
+        """An unhealthy node is marked down, and the latency of each is written"""
+        self.nodes["127.0.0.2"].status = 500
+        checker = healthcheck.HealthChecker(self._config_path, port=self.port)
+        changes = [await checker.check() for _ in range(healthcheck.FALL)]
+        self.assertEqual(changes, [False] * (healthcheck.FALL - 1) + [True])
+        self.assertEqual(checker.interval, 1)
+
+        checker.write_status()
+        status = nodehealth.read_status(self._status_path)
+        self.assertTrue(status["127.0.0.1"]["healthy"])
+        self.assertGreater(status["127.0.0.1"]["latency_ms"], 0)
+        self.assertEqual(
+            status["127.0.0.2"],
+            dict(status["127.0.0.2"], healthy=False, latency_ms=None, error="HTTP 500"),
+        )
+        self.assertTrue(os.path.exists(self._available_path))
+        # A drained node takes no requests, however healthy
+        checker.config["conferencenodeoptions"]["127.0.0.1"]["down"] = True
+        checker.write_status()
+        self.assertFalse(os.path.exists(self._available_path))
+        checker.config["conferencenodeoptions"]["127.0.0.1"]["down"] = False
+
+        upstream, commands = self._update_upstream(checker)
+        self.assertIn("server 127.0.0.1:443 weight=1", upstream)
+        self.assertIn("fail_timeout=10s;", upstream)
+        self.assertIn("fail_timeout=10s down;", upstream)
+        self.assertEqual(
+            commands, [["/usr/sbin/nginx", "-t"], ["/bin/systemctl", "reload", "nginx"]]
+        )
+
+        # Health survives restarts of the service, which keep /run/rp-turn
+        self.assertFalse(healthcheck.HealthChecker().nodes["127.0.0.2"].healthy)
+
+    async def test_all_unhealthy(self):
+        """Unhealthy nodes are kept if no other node would be left"""
+        for node in self.nodes.values():
+            node.status = 502
+        checker = healthcheck.HealthChecker(self._config_path, port=self.port)
+        for _ in range(healthcheck.FALL):
+            await checker.check()
+        checker.write_status()
+        self.assertEqual(
+            nodehealth.unhealthy_nodes(nodehealth.read_status(self._status_path)),
+            set(NODES),
+        )
+        self.assertFalse(os.path.exists(self._available_path))
+        upstream, _ = self._update_upstream(checker)
+        self.assertNotIn(" down", upstream)
+
+    async def test_run(self):
+        """The upstream is updated on starting, then only when health changes"""
+        checker = healthcheck.HealthChecker(self._config_path, port=self.port)
+        stop = asyncio.CancelledError()
+        with patch.object(checker, "update_upstream", return_value=True) as update_mock:
+            with patch(
+                "rp_turn.healthcheck.asyncio.sleep",
+                new=AsyncMock(side_effect=[None, None, stop]),
+            ) as sleep_mock:
+                with self.assertRaises(asyncio.CancelledError):
+                    await checker.run()
+        self.assertEqual(update_mock.call_count, 1)
+        self.assertEqual(sleep_mock.await_count, 3)
+        self.assertEqual(len(self.nodes["127.0.0.1"].requests), 3)
+        self.assertEqual(set(nodehealth.read_status(self._status_path)), set(NODES))
+
+    async def test_no_config(self):
+        """Nothing is probed until there are conference nodes to probe"""
+        os.remove(self._config_path)
+        checker = healthcheck.HealthChecker(self._config_path, port=self.port)
+        self.assertFalse(await checker.check())
+        self.assertEqual(checker.nodes, {})
+        self.assertEqual(checker.interval, 5)
+        self.assertTrue(checker.update_upstream())
@@ -284,7 +284,11 @@ class TestInstallWizard(TestCase):
             saved_config=saved_config,
         )
 
-    @patch("subprocess.check_call")
+    @patch("rp_turn.platform.turnuserdb.TurnUserDB")
+    @patch("glob.glob")
+    @patch("os.chmod")
+    @patch("shutil.chown")
+    @patch("subprocess.check_output")
     @patch("rp_turn.platform.filewriter.HeadedFileWriter")
     @patch("rp_turn.platform.filewriter.FileWriter")
     @patch("os.path.exists")
@@ -334,6 +338,17 @@ class TestInstallWizard(TestCase):
             "internal",
             "external",
             "conferencenodes",
+            "conferencenodeoptions",
+            "loadbalancemethod",
+            "healthcheck",
+            "healthz",
+            "tlsperformance",
+            "tlsprofile",
+            "staticcache",
+            "accesslog",
+            "capacity",
+            "ratelimit",
+            "realip",
             "enablecsp",
             "generate-certs",
         ]
@@ -398,6 +413,7 @@ class TestInstallWizard(TestCase):
         wizard._gather_user_input = mock.MagicMock()
         wizard._save_user_config = mock.MagicMock()
         wizard._apply_user_config = mock.MagicMock()
+        wizard._keys = mock.MagicMock()
         with patch.object(os, "system", mock.MagicMock(), create=True), patch.object(
             time, "sleep", mock.MagicMock(), create=True
         ):
@@ -418,3 +434,140 @@ System going down for reboot\r
 
 """,
             )
+        # Keys are generated while waiting for input, and unused ones discarded
+        wizard._keys.start.assert_called_once_with(
+            key_algorithm=wizard._config["generate-certs"]["keyalgorithm"], ssh=True
+        )
+        wizard._keys.close.assert_called_once_with()
+
+    def test_run_without_reboot(self):
+        """Tests _run method applies live changes instead of rebooting"""
+        wizard = get_installwizard()
+        wizard._config["first_run"] = False
+        wizard._skip_ui = True
+        wizard._skip_apply = False
+        applicator = mock.MagicMock()
+        applicator.changed = ["/etc/nginx/sites-available/pexapp"]
+        applicator.units = {}
+        wizard._apply_user_config = mock.MagicMock(return_value=applicator)
+        with patch.object(os, "system", mock.MagicMock(), create=True), patch.object(
+            subprocess, "check_output", mock.MagicMock(return_value=""), create=True
+        ) as check_output_mock:
+            fake_out = StringIO()
+            sys.stdout = fake_out
+            wizard.run()
+            sys.stdout = sys.__stdout__
+            self.assertEqual(fake_out.getvalue(), "Reloading nginx\n")
+            commands = [call[0][0] for call in check_output_mock.call_args_list]
+            self.assertEqual(
+                commands,
+                [["/usr/sbin/nginx", "-t"], ["/bin/systemctl", "reload", "nginx"]],
+            )
+
+    def test_run_post_apply_fails(self):
+        """Tests _run method rolls back what it can if the changes do not take effect"""
+        wizard = get_installwizard()
+        wizard._config["first_run"] = False
+        wizard._skip_ui = True
+        wizard._skip_apply = False
+        wizard._save_user_config = mock.MagicMock()
+        applicator = mock.MagicMock()
+        applicator.changed = [
+            "/etc/nginx/sites-available/pexapp",
+            "/etc/turnuserdb.conf",
+        ]
+        applicator.units = {"snmpd.service": True}
+        applicator.requested_units = {"snmpd.service": True}
+
+        def restore():
+            applicator.changed = ["/etc/nginx/sites-available/pexapp"]
+            applicator.units = {"snmpd.service": False}
+            applicator.requested_units = {"snmpd.service": False}
+            return applicator.changed
+
+        applicator.restore.side_effect = restore
+        wizard._apply_user_config = mock.MagicMock(return_value=applicator)
+        nginx_tests = []
+
+        def check_output(command, **_kwargs):
+            # nginx rejects the new files, but not the restored ones
+            if command == ["/usr/sbin/nginx", "-t"]:
+                nginx_tests.append(command)
+                if len(nginx_tests) == 1:
+                    raise subprocess.CalledProcessError(1, command)
+            return ""
+
+        with patch.object(
+            subprocess, "check_output", mock.MagicMock(side_effect=check_output)
+        ) as check_output_mock:
+            with patch("sys.stdout", new_callable=StringIO) as stdout:
+                with self.assertRaises(SystemExit) as context:
+                    wizard.run()
+        self.assertEqual(context.exception.code, 1)
+        applicator.restore.assert_called_once_with()
+        self.assertIn(
+            """\
+Unable to put the changes into effect, rolling back
+Restored the previous files:
+  - /etc/nginx/sites-available/pexapp
+Disabled snmpd.service again
+Not restored, as there was no previous copy (e.g. secrets):
+  - /etc/turnuserdb.conf
+The saved configuration was left as it was
+""",
+            stdout.getvalue(),
+        )
+        # The rejected answers are not offered again
+        wizard._save_user_config.assert_not_called()
+        # The restored files are reloaded and the unit stopped again, with no reboot
+        self.assertEqual(
+            [call[0][0] for call in check_output_mock.call_args_list],
+            [
+                ["/bin/systemctl", "restart", "snmpd.service"],
+                ["/bin/systemctl", "restart", "coturn"],
+                ["/usr/sbin/nginx", "-t"],
+                ["/bin/systemctl", "stop", "snmpd.service"],
+                ["/usr/sbin/nginx", "-t"],
+                ["/bin/systemctl", "reload", "nginx"],
+            ],
+        )
+        self.assertNotIn("Rebooting", stdout.getvalue())
+
+    def test_run_plan(self):
+        """Tests _run method prints the plan instead of applying it"""
+        wizard = get_installwizard()
+        wizard._config["first_run"] = False
+        wizard._skip_ui = True
+        wizard._plan = "/tmp/staging"
+        applicator = mock.MagicMock()
+        applicator.changed = [
+            "/etc/nginx/sites-available/pexapp",
+            "/etc/nginx/ssl/pexip.pem",
+        ]
+        applicator.diffs = {
+            "/etc/nginx/sites-available/pexapp": "--- a/pexapp\n+++ b/pexapp\n"
+        }
+        applicator.actions = ["/usr/bin/openssl req"]
+        applicator.units = {}
+        wizard._apply_user_config = mock.MagicMock(return_value=applicator)
+        with patch.object(
+            subprocess, "check_output", mock.MagicMock(), create=True
+        ) as check_output_mock:
+            fake_out = StringIO()
+            sys.stdout = fake_out
+            wizard.run()
+            sys.stdout = sys.__stdout__
+            check_output_mock.assert_not_called()
+        self.assertEqual(
+            fake_out.getvalue(),
+            """\
+--- a/pexapp
++++ b/pexapp
+/etc/nginx/ssl/pexip.pem would be regenerated
+Commands:
+  $ /usr/bin/openssl req
+Then reloading nginx:
+  $ /usr/sbin/nginx -t
+  $ /bin/systemctl reload nginx
+""",
+        )
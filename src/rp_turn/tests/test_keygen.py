@@ -0,0 +1,54 @@
+"""
+Test the background key generation
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from rp_turn import keygen
+from rp_turn.platform import hostkeys
+
+
+class TestKeyGenerator(TestCase):
+    """Tests KeyGenerator"""
+
+    def setUp(self):
+        self._keys = keygen.KeyGenerator()
+        self.addCleanup(self._keys.close)
+
+    def test_started_keys(self):
+        """Keys started in the background are handed out once"""
+        self._keys.start(key_algorithm="ecdsa-p256")
+        with patch("rp_turn.platform.certificate.generate_key") as generate_key:
+            key = self._keys.tls_key("ecdsa-p256")
+            generate_key.assert_not_called()
+            self.assertIsInstance(key, ec.EllipticCurvePrivateKey)
+            # A second key is generated when asked for
+            self.assertIs(self._keys.tls_key("ecdsa-p256"), generate_key.return_value)
+
+    def test_other_algorithm(self):
+        """Keys of another algorithm than started are generated when asked for"""
+        self._keys.start(key_algorithm="ecdsa-p256")
+        self.assertIsInstance(self._keys.tls_key("rsa-2048"), rsa.RSAPrivateKey)
+
+    def test_host_keys(self):
+        """Host keys are generated in the background, or when asked for"""
+        with patch(
+            "rp_turn.platform.hostkeys.generate_host_keys",
+            side_effect=[{"ed25519": "started"}, {"ed25519": "asked"}],
+        ):
+            self._keys.start(ssh=True)
+            self.assertEqual(self._keys.host_keys(), {"ed25519": "started"})
+            self.assertEqual(self._keys.host_keys(), {"ed25519": "asked"})
+
+    def test_close(self):
+        """Unused keys are discarded"""
+        self._keys.start(key_algorithm="ecdsa-p256", ssh=True)
+        self._keys.close()
+        with patch.object(
+            hostkeys, "generate_host_keys", return_value={}
+        ) as generate_host_keys:
+            self.assertEqual(self._keys.host_keys(), {})
+            generate_host_keys.assert_called_once_with()
@@ -0,0 +1,132 @@
+"""
+Test the node drain command
+"""
+
+import argparse
+import copy
+import json
+import os
+import subprocess
+import tempfile
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn import node
+from rp_turn.tests import test_config_applicator
+from rp_turn.tests.test_config_applicator import VALID_CONFIGS, DummyFileWriter
+
+
+class TestNode(TestCase):
+    """Tests the node list/drain/undrain commands"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self._path = os.path.join(directory.name, "config.json")
+        self._save(copy.deepcopy(VALID_CONFIGS[0]))
+
+    def _save(self, config):
+        """Writes a saved config"""
+        with open(self._path, "w", encoding="utf-8") as file_obj:
+            json.dump(config, file_obj)
+
+    def _load(self):
+        """Reads the saved config"""
+        with open(self._path, encoding="utf-8") as file_obj:
+            return json.load(file_obj)
+
+    def _run(self, action, address=None, force=False):
+        """Runs a node command, returning what it printed"""
+        args = argparse.Namespace(
+            config=self._path, action=action, address=address, force=force
+        )
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            node.run(args)
+        return stdout.getvalue()
+
+    def test_list(self):
+        """Each conference node is listed with its state"""
+        config = copy.deepcopy(VALID_CONFIGS[0])
+        config["conferencenodeoptions"]["10.44.4.3"]["down"] = True
+        self._save(config)
+        self.assertEqual(
+            self._run("list"),
+            "10.44.4.2       active   weight=1\n10.44.4.3       drained  weight=1\n",
+        )
+
+    @patch("rp_turn.node.reload_upstream", return_value=True)
+    def test_drain_undrain(self, reload_mock):
+        """Draining marks the node down, reloads nginx and saves the config"""
+        self.assertEqual(self._run("drain", "10.44.4.2"), "10.44.4.2 drained\n")
+        config = reload_mock.call_args[0][0]
+        self.assertTrue(config["conferencenodeoptions"]["10.44.4.2"]["down"])
+        saved_config = self._load()
+        self.assertTrue(saved_config["conferencenodeoptions"]["10.44.4.2"]["down"])
+        self.assertEqual(saved_config["turnserver"], VALID_CONFIGS[0]["turnserver"])
+
+        # Draining again changes nothing
+        reload_mock.reset_mock()
+        self.assertEqual(
+            self._run("drain", "10.44.4.2"), "10.44.4.2 is already drained\n"
+        )
+        reload_mock.assert_not_called()
+
+        self.assertEqual(
+            self._run("undrain", "10.44.4.2"), "10.44.4.2 is active again\n"
+        )
+        self.assertFalse(self._load()["conferencenodeoptions"]["10.44.4.2"]["down"])
+
+    @patch("rp_turn.node.reload_upstream", return_value=True)
+    def test_drain_last_node(self, reload_mock):
+        """The last active node is only drained when forced"""
+        self._run("drain", "10.44.4.2")
+        self.assertRaises(node.NodeError, self._run, "drain", "10.44.4.3")
+        self.assertEqual(reload_mock.call_count, 1)
+        self._run("drain", "10.44.4.3", force=True)
+        self.assertTrue(self._load()["conferencenodeoptions"]["10.44.4.3"]["down"])
+
+    @patch("rp_turn.node.reload_upstream", side_effect=[False, True])
+    def test_drain_failed(self, reload_mock):
+        """If nginx rejects the upstream, it is put back and nothing is saved"""
+        self.assertRaises(node.NodeError, self._run, "drain", "10.44.4.2")
+        self.assertEqual(reload_mock.call_count, 2)
+        config = reload_mock.call_args[0][0]
+        self.assertFalse(config["conferencenodeoptions"]["10.44.4.2"]["down"])
+        self.assertFalse(self._load()["conferencenodeoptions"]["10.44.4.2"]["down"])
+
+    def test_invalid(self):
+        """Unknown nodes, and configs without the web reverse proxy, are rejected"""
+        self.assertRaises(node.NodeError, self._run, "drain", "10.44.4.9")
+        self.assertRaises(node.NodeError, self._run, "drain", "not-an-ip")
+        config = copy.deepcopy(VALID_CONFIGS[0])
+        config["enablewebloadbalance"] = False
+        self._save(config)
+        self.assertRaises(node.NodeError, self._run, "list")
+        os.remove(self._path)
+        self.assertRaises(node.NodeError, self._run, "list")
+
+    @patch("rp_turn.platform.filewriter.FileWriter", side_effect=DummyFileWriter)
+    @patch("subprocess.check_output", return_value="")
+    def test_reload_upstream(self, check_output_mock, _filewriter_mock):
+        """Only the upstream is rewritten, then nginx is tested and reloaded"""
+        test_config_applicator.TestDefaultSettings.DummyFileSystem = {}
+        config = node.load_config(self._path)[1]
+        with patch("sys.stdout"):
+            self.assertTrue(node.reload_upstream(config))
+        self.assertEqual(
+            list(test_config_applicator.TestDefaultSettings.DummyFileSystem),
+            [
+                "/etc/nginx/includes/pexip-upstream.conf",
+                "/etc/rp-turn/healthcheck.json",
+            ],
+        )
+        self.assertEqual(
+            [call[0][0] for call in check_output_mock.call_args_list],
+            [["/usr/sbin/nginx", "-t"], ["/bin/systemctl", "reload", "nginx"]],
+        )
+        # Only a changed upstream is tested and reloaded
+        test_config_applicator.TestDefaultSettings.DummyFileSystem = {}
+        check_output_mock.side_effect = subprocess.CalledProcessError(1, "nginx")
+        with patch("sys.stdout"):
+            self.assertFalse(node.reload_upstream(config))
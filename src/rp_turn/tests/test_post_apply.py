@@ -0,0 +1,137 @@
+"""
+Test the post-apply stage
+"""
+
+import subprocess
+import sys
+from io import StringIO
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn.post_apply import PostApply
+
+
+class TestPostApply(TestCase):
+    """Tests PostApply"""
+
+    def test_nothing_changed(self):
+        """No changes need no actions"""
+        post_apply = PostApply([], {})
+        self.assertFalse(post_apply.reboot_required)
+        self.assertEqual(post_apply.commands(), [])
+
+    def test_hostname_requires_reboot(self):
+        """Artifacts that cannot be applied live require a reboot"""
+        post_apply = PostApply(["/etc/hostname", "/etc/hosts"], {})
+        self.assertTrue(post_apply.reboot_required)
+
+    def test_nginx_reload(self):
+        """nginx changes are tested and gracefully reloaded"""
+        post_apply = PostApply(
+            ["/etc/nginx/sites-available/pexapp", "/home/pexip/iptables.rules"], {}
+        )
+        self.assertFalse(post_apply.reboot_required)
+        self.assertEqual(
+            post_apply.commands(),
+            [
+                (
+                    "Reloading nginx",
+                    [
+                        ["/usr/sbin/nginx", "-t"],
+                        ["/bin/systemctl", "reload", "nginx"],
+                    ],
+                )
+            ],
+        )
+
+    def test_coturn_restart(self):
+        """coturn is restarted once for any of its files"""
+        post_apply = PostApply(["/etc/turnserver.conf", "/etc/turnuserdb.conf"], {})
+        self.assertEqual(
+            post_apply.commands(),
+            [("Restarting coturn", [["/bin/systemctl", "restart", "coturn"]])],
+        )
+
+    def test_ssh_host_keys_restart(self):
+        """New SSH host keys restart ssh once"""
+        post_apply = PostApply(
+            ["/etc/ssh/ssh_host_rsa_key", "/etc/ssh/ssh_host_rsa_key.pub"], {}
+        )
+        self.assertFalse(post_apply.reboot_required)
+        self.assertEqual(
+            post_apply.commands(),
+            [
+                (
+                    "Restarting ssh.service",
+                    [["/bin/systemctl", "restart", "ssh.service"]],
+                )
+            ],
+        )
+
+    def test_network_and_units(self):
+        """Network is applied first, then units are stopped and started"""
+        post_apply = PostApply(
+            ["/etc/netplan/01-netcfg.yaml", "/etc/snmp/snmpd.conf"],
+            {"snmpd.service": True, "coturn": False},
+        )
+        self.assertFalse(post_apply.reboot_required)
+        self.assertEqual(
+            post_apply.commands(),
+            [
+                ("Applying network configuration", [["/usr/sbin/netplan", "apply"]]),
+                ("Stopping coturn", [["/bin/systemctl", "stop", "coturn"]]),
+                (
+                    "Starting snmpd.service",
+                    [["/bin/systemctl", "restart", "snmpd.service"]],
+                ),
+            ],
+        )
+
+    def test_disabled_unit_not_restarted(self):
+        """Changed files of a unit meant to stay disabled do not start it"""
+        post_apply = PostApply(
+            ["/etc/ssh/ssh_host_rsa_key", "/etc/turnserver.conf"],
+            {},
+            {"ssh.service": False, "coturn": True},
+        )
+        self.assertEqual(
+            post_apply.commands(),
+            [("Restarting coturn", [["/bin/systemctl", "restart", "coturn"]])],
+        )
+
+    def test_static_cache_units(self):
+        """The cache warm-up starts after nginx reloads, its tmpfs needs a reboot"""
+        post_apply = PostApply(
+            ["/etc/nginx/sites-available/pexapp", "/etc/rp-turn/static-cache.json"],
+            {"rp-turn-static-cache-warmup.service": True},
+        )
+        self.assertFalse(post_apply.reboot_required)
+        self.assertEqual(
+            [description for description, _ in post_apply.commands()],
+            ["Reloading nginx", "Starting rp-turn-static-cache-warmup.service"],
+        )
+        post_apply = PostApply([], {"var-cache-nginx-static.mount": False})
+        self.assertTrue(post_apply.reboot_required)
+        self.assertEqual(post_apply.commands(), [])
+
+    @patch("subprocess.check_output")
+    def test_run_failed_config_test(self, subprocess_mock):
+        """A failed configuration test stops that service being reloaded"""
+        commands = []
+
+        def check_output(command, **_kwargs):
+            commands.append(" ".join(command))
+            if command == ["/usr/sbin/nginx", "-t"]:
+                raise subprocess.CalledProcessError(1, command, "test failed")
+            return ""
+
+        subprocess_mock.side_effect = check_output
+        post_apply = PostApply(
+            ["/etc/nginx/sites-available/pexapp", "/etc/ntp.conf"], {}
+        )
+        fake_out = StringIO()
+        sys.stdout = fake_out
+        success = post_apply.run()
+        sys.stdout = sys.__stdout__
+        self.assertFalse(success)
+        self.assertEqual(commands, ["/usr/sbin/nginx -t", "/bin/systemctl restart ntp"])
@@ -0,0 +1,61 @@
+"""
+Test the TLS session ticket key rotation
+"""
+
+import os
+import stat
+import subprocess
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn import rotate_ticket_keys
+from rp_turn.platform import ticketkeys
+
+
+class TestRotateTicketKeys(TestCase):
+    """Tests rotating the keys and reloading nginx"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self._root = directory.name
+        os.makedirs(os.path.join(self._root, "etc", "nginx", "ssl"))
+
+    def test_rotate(self):
+        """Every key moves along by one, and they are only readable by root"""
+        self.assertEqual(
+            rotate_ticket_keys.rotate(self._root), list(ticketkeys.TICKET_KEY_PATHS)
+        )
+        keys = ticketkeys.read_ticket_keys(self._root)
+        self.assertTrue(all(keys))
+        rotate_ticket_keys.rotate(self._root)
+        self.assertEqual(ticketkeys.read_ticket_keys(self._root)[1:], keys[:2])
+        for path in ticketkeys.TICKET_KEY_PATHS:
+            mode = os.stat(os.path.join(self._root, path.lstrip("/"))).st_mode
+            self.assertEqual(stat.S_IMODE(mode), 0o600)
+        self.assertFalse(
+            os.path.exists(os.path.join(self._root, "etc/nginx/ssl/ticket.key.bak"))
+        )
+
+    @patch("rp_turn.rotate_ticket_keys.setup_logger")
+    @patch("subprocess.check_output", return_value="")
+    def test_main(self, check_output_mock, _setup_logger_mock):
+        """nginx is tested and reloaded to pick up the new keys"""
+        with patch(
+            "rp_turn.rotate_ticket_keys.rotate",
+            return_value=["/etc/nginx/ssl/ticket.key"],
+        ):
+            with patch("sys.stdout"):
+                rotate_ticket_keys.main([])
+        self.assertEqual(
+            [call[0][0] for call in check_output_mock.call_args_list],
+            [["/usr/sbin/nginx", "-t"], ["/bin/systemctl", "reload", "nginx"]],
+        )
+        check_output_mock.side_effect = subprocess.CalledProcessError(1, "nginx")
+        with patch(
+            "rp_turn.rotate_ticket_keys.rotate",
+            return_value=["/etc/nginx/ssl/ticket.key"],
+        ):
+            with patch("sys.stdout"):
+                self.assertRaises(SystemExit, rotate_ticket_keys.main, [])
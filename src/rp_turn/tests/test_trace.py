@@ -0,0 +1,94 @@
+"""
+Test the apply tracer
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn import trace, utils
+
+
+class TestTracer(TestCase):
+    """Tests Tracer and span"""
+
+    def test_no_active_tracer(self):
+        """Spans are not recorded without an active tracer"""
+        tracer = trace.Tracer()
+        with trace.span("write", path="/etc/hosts") as span:
+            span["skipped"] = True
+        self.assertEqual(tracer.spans, [])
+
+    def test_spans(self):
+        """Spans from any thread are recorded with their attributes"""
+
+        def render():
+            with trace.span("render", template="ntp.conf"):
+                pass
+
+        tracer = trace.Tracer()
+        with tracer.activate():
+            with trace.span("phase", phase="ntp_server_config"):
+                thread = threading.Thread(target=render)
+                thread.start()
+                thread.join()
+            with self.assertRaises(RuntimeError):
+                with trace.span("phase", phase="snmp"):
+                    raise RuntimeError("failed")
+        spans = tracer.spans
+        self.assertEqual(
+            [(span["name"], span["attributes"]) for span in spans],
+            [
+                ("phase", {"phase": "ntp_server_config"}),
+                ("render", {"template": "ntp.conf"}),
+                ("phase", {"phase": "snmp", "error": "RuntimeError('failed')"}),
+            ],
+        )
+        self.assertNotEqual(spans[0]["thread"], spans[1]["thread"])
+        self.assertGreaterEqual(spans[0]["duration"], spans[1]["duration"])
+
+    @patch("subprocess.check_output")
+    def test_command(self, subprocess_mock):
+        """Commands are recorded with their exit code and output"""
+        error = subprocess.CalledProcessError(1, ["/usr/sbin/nginx", "-t"], "bad")
+        subprocess_mock.side_effect = ["saved\n", error]
+        tracer = trace.Tracer()
+        with tracer.activate():
+            utils.run_command("/usr/sbin/netfilter-persistent", "save")
+            with self.assertRaises(subprocess.CalledProcessError):
+                utils.run_command("/usr/sbin/nginx", "-t")
+        self.assertEqual(
+            [span["attributes"] for span in tracer.spans],
+            [
+                {
+                    "command": "/usr/sbin/netfilter-persistent save",
+                    "exit_code": 0,
+                    "output": "saved\n",
+                },
+                {
+                    "command": "/usr/sbin/nginx -t",
+                    "exit_code": 1,
+                    "output": "bad",
+                    "error": repr(error),
+                },
+            ],
+        )
+
+    def test_write(self):
+        """The trace is written as JSON"""
+        tracer = trace.Tracer()
+        with tracer.activate():
+            with trace.span("apply", incremental=False):
+                pass
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "rp-turn", "apply-trace.json")
+            tracer.write(path)
+            with open(path, encoding="utf-8") as file_obj:
+                written = json.load(file_obj)
+        self.assertEqual(written["spans"][0]["name"], "apply")
+        self.assertEqual(written["spans"][0]["attributes"], {"incremental": False})
+        self.assertIn("duration", written)
@@ -0,0 +1,139 @@
+"""
+Test the static asset cache warm-up, against a local stand-in for nginx
+"""
+
+import json
+import os
+import ssl
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from unittest.mock import patch
+
+from rp_turn import warm_static_cache
+from rp_turn.platform import certificate
+
+PAGE = b"""<!DOCTYPE html>
+<html>
+<head>
+<link rel="stylesheet" href="../static/style.css">
+<script src="/static/app.js?v=2"></script>
+<script src="https://cdn.example.com/static/other.js"></script>
+</head>
+<body><a href="/api/client/v2/status">status</a><img src='/static/missing.png'></body>
+</html>
+"""
+MANIFEST = {"files": {"main": "/static/main.js", "chunks": ["chunk.js", 1, None]}}
+ASSETS = {
+    "/webapp/": PAGE,
+    "/static/manifest.json": json.dumps(MANIFEST).encode(),
+    "/static/style.css": b"body {}",
+    "/static/app.js?v=2": b"app",
+    "/static/main.js": b"main",
+    "/static/chunk.js": b"chunk",
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves ASSETS, recording each request"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answers with the asset, or 404"""
+        self.server.requests.append((self.path, self.headers["Host"]))
+        body = ASSETS.get(self.path)
+        self.send_response(404 if body is None else 200)
+        self.send_header("Content-Length", str(len(body or b"")))
+        self.end_headers()
+        self.wfile.write(body or b"")
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keeps the test output quiet"""
+
+
+class TestWarmStaticCache(TestCase):
+    """Tests fetching the assets referenced by the manifests"""
+
+    def setUp(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        self._server.requests = []
+        with tempfile.TemporaryDirectory() as directory:
+            pem_path = os.path.join(directory, "nginx.pem")
+            with open(pem_path, "w", encoding="ascii") as file_obj:
+                file_obj.write(certificate.generate_self_signed_pem())
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(pem_path)
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self._server.server_close)
+        self.addCleanup(self._server.shutdown)
+
+    def test_asset_paths(self):
+        """Only /static assets of this site are taken from pages and manifests"""
+        self.assertEqual(
+            warm_static_cache.asset_paths("/webapp/", PAGE),
+            ["/static/app.js?v=2", "/static/missing.png", "/static/style.css"],
+        )
+        self.assertEqual(
+            warm_static_cache.asset_paths(
+                "/static/manifest.json", ASSETS["/static/manifest.json"]
+            ),
+            ["/static/chunk.js", "/static/main.js"],
+        )
+
+    def test_warm(self):
+        """Each referenced asset is fetched once, as the web app is requested"""
+        warmed, errors = warm_static_cache.warm(
+            "127.0.0.1",
+            "reverseproxy.rd.pexip.com",
+            ["/webapp/", "/static/manifest.json", "/webapp2/"],
+            port=self.port,
+        )
+        self.assertEqual(
+            warmed,
+            [
+                "/static/app.js?v=2",
+                "/static/chunk.js",
+                "/static/main.js",
+                "/static/style.css",
+            ],
+        )
+        self.assertEqual(
+            errors, ["/webapp2/: HTTP 404", "/static/missing.png: HTTP 404"]
+        )
+        paths = [path for path, _ in self._server.requests]
+        self.assertEqual(len(paths), len(set(paths)))
+        self.assertEqual(
+            {host for _, host in self._server.requests}, {"reverseproxy.rd.pexip.com"}
+        )
+
+    @patch.object(warm_static_cache, "setup_logger")
+    def test_main(self, _setup_logger_mock):
+        """The warm-up only fails if nothing could be fetched"""
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "static-cache.json")
+            with open(config_path, "w", encoding="utf-8") as file_obj:
+                json.dump({"address": "127.0.0.1", "fqdn": "reverseproxy"}, file_obj)
+            with patch.object(
+                warm_static_cache, "warm", return_value=(["/static/app.js"], ["x"])
+            ) as warm_mock:
+                warm_static_cache.main(["--config", config_path])
+                warm_mock.assert_called_once_with(
+                    "127.0.0.1", "reverseproxy", warm_static_cache.DEFAULT_MANIFESTS
+                )
+                warm_mock.return_value = ([], ["x"])
+                with self.assertRaises(SystemExit):
+                    warm_static_cache.main(["--config", config_path])
+                with self.assertRaises(SystemExit):
+                    warm_static_cache.main(["--config", directory + "/missing.json"])
+
+    def test_load_config(self):
+        """The address nginx listens on must be an IPv4 address"""
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "static-cache.json")
+            with open(config_path, "w", encoding="utf-8") as file_obj:
+                json.dump({"address": "reverseproxy", "fqdn": "reverseproxy"}, file_obj)
+            with self.assertRaisesRegex(warm_static_cache.WarmupError, "IPv4"):
+                warm_static_cache.load_config(config_path)
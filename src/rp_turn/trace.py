@@ -0,0 +1,107 @@
+"""
+Timed spans recorded while applying configuration
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Iterator
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+TRACE_PATH = "/var/log/rp-turn/apply-trace.json"
+PROFILE_PATH = "/var/log/rp-turn/apply.prof"
+
+# Tracer recording spans from any thread, if any
+_ACTIVE: Tracer | None = None
+
+
+class Tracer:
+    """
+    Collects timed spans (phases, renders, writes, syncs and commands).
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._spans: list[dict[str, Any]] = []
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator[Tracer]:
+        """Records spans started (from any thread) within the context"""
+        global _ACTIVE  # pylint: disable=global-statement
+        previous = _ACTIVE
+        _ACTIVE = self
+        try:
+            yield self
+        finally:
+            _ACTIVE = previous
+
+    def record(
+        self, name: str, start: float, duration: float, attributes: dict[str, Any]
+    ) -> None:
+        """Adds a finished span"""
+        with self._lock:
+            self._spans.append(
+                {
+                    "name": name,
+                    "start": round(start - self._start, 6),
+                    "duration": round(duration, 6),
+                    "thread": threading.current_thread().name,
+                    "attributes": attributes,
+                }
+            )
+
+    @property
+    def spans(self) -> list[dict[str, Any]]:
+        """Finished spans, in order of starting"""
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span["start"])
+
+    def to_dict(self) -> dict[str, Any]:
+        """Returns the trace as a JSON serialisable dict"""
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "duration": round(time.monotonic() - self._start, 6),
+            "spans": self.spans,
+        }
+
+    def write(self, path: str = TRACE_PATH) -> None:
+        """Atomically writes the trace as JSON"""
+        parent_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent_dir, exist_ok=True)
+        osfh, tmpfile = tempfile.mkstemp(dir=parent_dir, suffix=".json")
+        try:
+            with os.fdopen(osfh, "w", encoding="utf-8") as file_obj:
+                json.dump(self.to_dict(), file_obj, indent=2, default=str)
+            os.chmod(tmpfile, 0o644)
+            os.rename(tmpfile, path)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+        DEV_LOGGER.info("Wrote apply trace to %s", path)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """
+    Times the enclosed block as a span of the active tracer, if any.
+    Yields the span's attributes, so more can be added (e.g. an exit code).
+    """
+    tracer = _ACTIVE
+    start = time.monotonic()
+    try:
+        yield attributes
+    except BaseException as error:
+        attributes["error"] = repr(error)
+        raise
+    finally:
+        if tracer is not None:
+            tracer.record(name, start, time.monotonic() - start, attributes)
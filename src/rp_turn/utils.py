@@ -4,9 +4,11 @@ Bunch of utils for the install wizard
 
 from __future__ import annotations
 
+import glob
 import logging
 import os
 import re
+import shutil
 import subprocess
 from collections import defaultdict
 from functools import partial
@@ -19,6 +21,7 @@ from ipaddress import (
 )
 from typing import Any, Callable, TypeVar
 
+from rp_turn import trace
 from rp_turn.step_error import StepError
 
 DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
@@ -256,10 +259,77 @@ def validate_hostname(hostname: str) -> str:
     return hostname
 
 
-def run_shell(argl: str, *argv: str) -> None:
-    """Runs a list of shell commands"""
-    with open(os.devnull, "wb") as fnull:
-        for cmd in [argl] + list(argv):
-            DEV_LOGGER.info("Running shell command: %s", cmd)
-            # TODO: Get subprocess stdout and stderr into DEV_LOGGER
-            subprocess.check_call(cmd, stdout=fnull, stderr=fnull, shell=True)
+def validate_int_range(value: Any, low: int, high: int, name: str) -> int:
+    """
+    Validate a whole number from low to high, e.g. a response to a question.
+    name says what the number is in the error, e.g. "Health check interval"
+    """
+    value = str(value).strip()
+    if not value.isdigit() or not low <= int(value) <= high:
+        raise StepError(f"{name} must be a whole number from {low} to {high}")
+    return int(value)
+
+
+def validate_saved_int_range(value: Any, low: int, high: int, name: str) -> int:
+    """
+    Validate a saved whole number from low to high, which must be a number
+    """
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise StepError(f"{value} is not a whole number")
+    return validate_int_range(value, low, high, name)
+
+
+def run_command(*argv: str, stdin: str | None = None, log_args: bool = True) -> str:
+    """
+    Runs a command (without a shell), logging its combined stdout and stderr
+    Raises subprocess.CalledProcessError if it fails
+    """
+    command = " ".join(argv) if log_args else argv[0]
+    DEV_LOGGER.info("Running command: %s", command)
+    with trace.span("command", command=command) as span:
+        try:
+            output: str = subprocess.check_output(
+                list(argv), input=stdin, stderr=subprocess.STDOUT, text=True
+            )
+        except subprocess.CalledProcessError as error:
+            DEV_LOGGER.error(
+                "Command %s exited with %s: %s", argv[0], error.returncode, error.output
+            )
+            span.update(exit_code=error.returncode, output=error.output)
+            raise
+        span.update(exit_code=0, output=output)
+    if output:
+        DEV_LOGGER.info("Command %s output: %s", argv[0], output)
+    return output
+
+
+def chown(path: str, user: str, group: str) -> None:
+    """Changes the owner and group of a file"""
+    DEV_LOGGER.info("Setting owner of %s to %s:%s", path, user, group)
+    shutil.chown(path, user, group)
+
+
+def chmod(path: str, mode: int) -> None:
+    """Changes the mode bits of a file"""
+    DEV_LOGGER.info("Setting mode of %s to %o", path, mode)
+    os.chmod(path, mode)
+
+
+def remove_glob(pattern: str) -> None:
+    """Removes all files matching a glob pattern, like rm -f"""
+    for path in glob.glob(pattern):
+        DEV_LOGGER.info("Removing %s", path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def systemd_unit_enabled(unit: str, root: str = "/") -> bool:
+    """
+    Whether a systemd unit is enabled, judged by its install symlinks.
+    Avoids forking systemctl for units installed into a .wants directory.
+    """
+    if "." not in unit:
+        unit += ".service"
+    return bool(glob.glob(os.path.join(root, f"etc/systemd/system/*.wants/{unit}")))
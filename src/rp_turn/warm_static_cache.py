@@ -0,0 +1,193 @@
+"""
+Warms the static asset cache of the web reverse proxy.
+
+Runs as rp-turn-static-cache-warmup.service, after nginx has started or the
+cache was enabled: each asset manifest is fetched through nginx, then every
+/static asset it references, so the first participants to join do not all
+wait on the conference nodes for the same files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import re
+import ssl
+import sys
+import urllib.parse
+from concurrent import futures
+
+from rp_turn import utils
+from rp_turn.config_applicator import STATIC_CACHE_WARMUP_CONFIG_PATH
+from rp_turn.installwizard import setup_logger
+from rp_turn.step_error import StepError
+
+DEV_LOGGER = logging.getLogger("rp_turn.installwizard")
+
+# Pages or JSON manifests referencing the static assets of the web app
+DEFAULT_MANIFESTS = ("/webapp/",)
+STATIC_PREFIX = "/static/"
+FETCH_TIMEOUT = 10.0
+# Assets fetched at once, low enough not to look like a participant surge
+FETCH_CONCURRENCY = 4
+USER_AGENT = "rp-turn-static-cache-warmup"
+
+# src/href attributes of an HTML page
+_REFERENCE_RE = re.compile(r"""(?:src|href)\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+class WarmupError(Exception):
+    """An asset could not be fetched through nginx"""
+
+
+def fetch(
+    address: str, fqdn: str, path: str, port: int = 443, timeout: float = FETCH_TIMEOUT
+) -> bytes:
+    """
+    Requests path from the local nginx, as a participant would.
+    Returns the body of the response, or raises WarmupError.
+    """
+    # nginx is addressed by IP, and may still have a self-signed certificate
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    connection = http.client.HTTPSConnection(
+        address, port, timeout=timeout, context=context
+    )
+    try:
+        connection.request(
+            "GET", path, headers={"Host": fqdn, "User-Agent": USER_AGENT}
+        )
+        response = connection.getresponse()
+        body = response.read()
+    except (OSError, ssl.SSLError, http.client.HTTPException) as error:
+        raise WarmupError(f"{path}: {error or type(error).__name__}") from error
+    finally:
+        connection.close()
+    if response.status >= 400:
+        raise WarmupError(f"{path}: HTTP {response.status}")
+    return body
+
+
+def asset_paths(manifest_path: str, body: bytes) -> list[str]:
+    """
+    Returns the /static assets referenced by a manifest: any string of a JSON
+    manifest, or the src and href attributes of an HTML page.
+    """
+    text = body.decode("utf-8", errors="replace")
+    try:
+        references = list(_json_strings(json.loads(text)))
+    except ValueError:
+        references = _REFERENCE_RE.findall(text)
+    paths = set()
+    for reference in references:
+        url = urllib.parse.urlsplit(urllib.parse.urljoin(manifest_path, reference))
+        # Assets of other sites are not cached by nginx
+        if url.netloc or not url.path.startswith(STATIC_PREFIX):
+            continue
+        paths.add(url.path + (f"?{url.query}" if url.query else ""))
+    return sorted(paths)
+
+
+def _json_strings(value: object) -> list[str]:
+    """Returns every string in a JSON value"""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        return [string for item in value for string in _json_strings(item)]
+    return []
+
+
+def warm(
+    address: str,
+    fqdn: str,
+    manifests: tuple[str, ...] | list[str] = DEFAULT_MANIFESTS,
+    port: int = 443,
+) -> tuple[list[str], list[str]]:
+    """
+    Fetches each manifest and the assets it references through nginx.
+    Returns the assets which were fetched, and the errors of those which were not.
+    """
+    paths: set[str] = set()
+    errors = []
+    for manifest in manifests:
+        try:
+            paths.update(asset_paths(manifest, fetch(address, fqdn, manifest, port)))
+        except WarmupError as error:
+            errors.append(str(error))
+    warmed = []
+    with futures.ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+        results = {
+            path: executor.submit(fetch, address, fqdn, path, port)
+            for path in sorted(paths)
+        }
+        for path, result in results.items():
+            try:
+                result.result()
+                warmed.append(path)
+            except WarmupError as error:
+                errors.append(str(error))
+    return warmed, errors
+
+
+def load_config(path: str) -> tuple[str, str]:
+    """
+    Loads the address and name nginx serves the web app on, as written by
+    ConfigApplicator. Raises WarmupError if they are missing or invalid.
+    """
+    try:
+        with open(path, encoding="utf-8") as file_obj:
+            config = json.load(file_obj)
+        address = str(utils.validate_ip(config["address"]))
+        fqdn = str(config["fqdn"])
+    except (OSError, ValueError, KeyError, TypeError, StepError) as error:
+        raise WarmupError(f"Unable to read {path}: {error}") from error
+    return address, fqdn
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Execute the static asset cache warm-up."""
+    parser = argparse.ArgumentParser(
+        prog="rp-turn-static-cache-warmup",
+        description="Fills the static asset cache of the web reverse proxy",
+    )
+    parser.add_argument(
+        "--config",
+        default=STATIC_CACHE_WARMUP_CONFIG_PATH,
+        help="where nginx serves the web app (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--manifest",
+        action="append",
+        help="page or JSON manifest referencing the static assets, may be "
+        + f"repeated (default: {', '.join(DEFAULT_MANIFESTS)})",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_const",
+        const=True,
+        default=False,
+        help="prints debug to stdout (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    setup_logger(debug=args.debug)
+    try:
+        address, fqdn = load_config(args.config)
+    except WarmupError:
+        DEV_LOGGER.exception("Unable to warm the static asset cache")
+        sys.exit(1)
+    warmed, errors = warm(address, fqdn, args.manifest or DEFAULT_MANIFESTS)
+    for error in errors:
+        DEV_LOGGER.warning("Unable to warm the static asset cache: %s", error)
+    DEV_LOGGER.info("Warmed the static asset cache with %d assets", len(warmed))
+    if errors and not warmed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()